@@ -22,6 +22,7 @@ class GameStat(models.Model):
     player2_score = models.IntegerField()
     player2_hits = models.IntegerField()
     longest_rally = models.IntegerField()
+    result_key = models.CharField(max_length=64, unique=True, null=True, blank=True) # idempotency key of the game server result the stats were written from
 
     def __str__(self):
         return (f"Stats for Game {self.game_id.game_id}: {self.player1_score} vs {self.player2_score} - Longest Rally: {self.longest_rally}")
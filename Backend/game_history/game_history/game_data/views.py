@@ -3,6 +3,9 @@ from .models import GameHistory, GameStat
 from .serializers import GameHistorySerializer, GameStatSerializer
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
 import logging
 
 logger = logging.getLogger(__name__)
@@ -113,4 +116,55 @@ class GameStatViewSet(viewsets.ModelViewSet):
         """
         instance = get_object_or_404(self.get_queryset(), pk=pk)
         self.perform_destroy(instance)
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class GameResultViewSet(viewsets.ViewSet):
+    """
+    A viewset for the game results written by the game server.
+    """
+
+    def create_batch(self, request, *args, **kwargs):
+        """
+        Store a batch of game results.
+
+        Every result sets the winner and end time of its game history record and
+        creates its game stat. Results carry an idempotency key: a result whose key
+        was already stored is reported as a duplicate and not stored again, so the
+        game server can safely send a batch again when it did not get an answer.
+
+        Returns {"results": [{"idempotency_key", "status", "error"}]}, status is
+        "created", "duplicate" or "error" for every result of the batch.
+        """
+        if request.headers.get('X-SERVICE-SECRET') != settings.SECRET_KEY:
+            return Response({"error": "Unauthorized request"}, status=status.HTTP_401_UNAUTHORIZED)
+        results = request.data.get('results')
+        if not isinstance(results, list):
+            return Response({"error": "results must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"results": [self.store_result(result) for result in results]}, status=status.HTTP_200_OK)
+
+    def store_result(self, result) -> dict:
+        key = result.get('idempotency_key')
+        if not key:
+            return {"idempotency_key": key, "status": "error", "error": "idempotency_key is required"}
+        if GameStat.objects.filter(result_key=key).exists():
+            return {"idempotency_key": key, "status": "duplicate"}
+        try:
+            with transaction.atomic():
+                game = GameHistory.objects.select_for_update().get(pk=result['game_id'])
+                game.winner_id = result['winner_id']
+                game.end_time = parse_datetime(result['end_time']) if result.get('end_time') else None
+                game.save()
+                GameStat.objects.update_or_create(game_id=game, defaults={
+                    'player1_score': result['player1_score'],
+                    'player2_score': result['player2_score'],
+                    'player1_hits': result['player1_hits'],
+                    'player2_hits': result['player2_hits'],
+                    'longest_rally': result['longest_rally'],
+                    'result_key': key,
+                })
+        except GameHistory.DoesNotExist:
+            return {"idempotency_key": key, "status": "error", "error": "Game not found"}
+        except (KeyError, TypeError, ValueError) as err:
+            logger.error(f"Invalid game result {key}: {err}")
+            return {"idempotency_key": key, "status": "error", "error": "Invalid game result"}
+        return {"idempotency_key": key, "status": "created"}
@@ -225,3 +225,33 @@ def test_delete_game_stat(api_client):
     response = api_client.delete(url)
     assert response.status_code == status.HTTP_204_NO_CONTENT
     assert GameStat.objects.count() == 0
+
+@pytest.mark.django_db
+def test_game_results_are_stored_once(api_client):
+    from django.conf import settings
+    game = GameHistory.objects.create(player1_id=1, player2_id=2, start_time=now())
+    url = reverse('game-results')
+    result = {
+        'idempotency_key': f'pong-result-{game.game_id}',
+        'game_id': game.game_id,
+        'winner_id': 2,
+        'player1_score': 3,
+        'player2_score': 5,
+        'player1_hits': 10,
+        'player2_hits': 12,
+        'longest_rally': 7,
+        'end_time': '2024-07-03T12:05:00+00:00',
+    }
+    missing = dict(result, idempotency_key='pong-result-0', game_id=0)
+    headers = {'HTTP_X_SERVICE_SECRET': settings.SECRET_KEY}
+
+    assert api_client.post(url, {'results': [result]}, format='json').status_code == status.HTTP_401_UNAUTHORIZED
+    response = api_client.post(url, {'results': [result, missing]}, format='json', **headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert [item['status'] for item in response.data['results']] == ['created', 'error']
+    response = api_client.post(url, {'results': [result]}, format='json', **headers) # sent again, e.g. after a timeout
+    assert response.data['results'][0]['status'] == 'duplicate'
+    assert GameStat.objects.count() == 1
+    game.refresh_from_db()
+    assert game.winner_id == 2
+    assert game.end_time.isoformat() == '2024-07-03T12:05:00+00:00'
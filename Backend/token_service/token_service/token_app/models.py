@@ -6,4 +6,13 @@ class UserTokens(models.Model):
     token_data = models.JSONField(null=True)
 
     def __str__(self):
-        return self.username
\ No newline at end of file
+        return self.username
+
+
+class RevokedTokens(models.Model):
+    # Time of the user's last logout, the user's tokens issued before it are revoked
+    id = models.IntegerField(primary_key=True)
+    revoked_at = models.IntegerField()
+
+    def __str__(self):
+        return f"{self.id} revoked at {self.revoked_at}"
@@ -1,10 +1,11 @@
 # from django.contrib import admin
 from django.urls import path
-from .views import CustomTokenRefreshView, CustomTokenObtainPairView, InvalidateToken, ValidateToken
+from .views import CustomTokenRefreshView, CustomTokenObtainPairView, InvalidateToken, ValidateToken, RevokedTokensView
 
 urlpatterns = [
     path("auth/token/refresh/", CustomTokenRefreshView.as_view(), name="token_refresh",),
     path("auth/token/gen-tokens/", CustomTokenObtainPairView.as_view(), name="generate_tokens",),
     path("auth/token/invalidate-tokens/", InvalidateToken.as_view({"post": "invalidate_token_for_user",}), name="invalidate_tokens",),
     path("auth/token/validate-token/", ValidateToken.as_view({"post": "validate_token_for_user",}), name="validate_token",),
+    path("auth/token/revoked-tokens/", RevokedTokensView.as_view({"get": "list_revoked_tokens",}), name="revoked_tokens",),
 ]
@@ -9,7 +9,8 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework import viewsets
 from .serializers import CustomTokenObtainPairSerializer
-from .models import UserTokens
+from .models import UserTokens, RevokedTokens
+import time
 import jwt
 from rest_framework.permissions import AllowAny
 from django.conf import settings
@@ -223,6 +224,7 @@ class InvalidateToken(viewsets.ViewSet):
                         user = get_object_or_404(UserTokens, id=id)
                         if user is not None:
                             user.delete()
+                            RevokedTokens.objects.update_or_create(id=id, defaults={"revoked_at": int(time.time())})
                             response_message = {"detail":"User logged out"}
                     else:
                         response_message = {"error": "Invalid or expired token"}
@@ -234,3 +236,24 @@ class InvalidateToken(viewsets.ViewSet):
                 response_message = {"error": str(err)}
                 status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
         return Response(response_message, status=status_code)
+
+
+class RevokedTokensView(viewsets.ViewSet):
+    def list_revoked_tokens(self, request, *args, **kwargs) -> Response:
+        """
+            List the revoked access tokens.
+
+            Services that verify access tokens themselves (the game server) poll this
+            endpoint. Tokens of a user that were issued before the user's last logout
+            are revoked. Logouts older than the access token lifetime are left out,
+            every token they revoked has expired anyway.
+
+            Returns:
+                Response: {"revoked": {user_id: revoked_at}}, revoked_at in seconds since the epoch.
+        """
+        response_message, status_code = check_secret(request, {}, status.HTTP_200_OK)
+        if response_message:
+            return Response(response_message, status=status_code)
+        lifetime = settings.SIMPLE_JWT["ACCESS_TOKEN_LIFETIME"].total_seconds()
+        revoked = RevokedTokens.objects.filter(revoked_at__gte=int(time.time() - lifetime))
+        return Response({"revoked": {token.id: token.revoked_at for token in revoked}}, status=status.HTTP_200_OK)
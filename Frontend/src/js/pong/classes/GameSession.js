@@ -62,6 +62,13 @@ class GameSession {
         initializeEventHandlers(this);
 
         // Always connect to the server
+        // The game server is sharded by game_id, the handshake carries it so that
+        // both players end up on the worker that runs the game
+        const query = this.socket.io.opts.query || {};
+        if (this.socket.connected && query.game_id !== gameId) {
+            this.socket.disconnect();
+        }
+        this.socket.io.opts.query = { ...query, game_id: gameId };
         if (!this.socket.connected) {
             this.socket.connect();
         }
@@ -85,6 +92,13 @@ class GameSession {
             handleTokenVerification()
                 .then(validToken => {
                     userData.token = validToken;
+                    // The game server authenticates the connection once, with the handshake's token
+                    if (!this.socket.auth || this.socket.auth.token !== validToken) {
+                        this.socket.auth = { ...this.socket.auth, token: validToken };
+                        if (this.socket.connected) {
+                            this.socket.disconnect().connect();
+                        }
+                    }
                     gameInitData['token'] = validToken;
                     gameInitData['type'] = 'join_game';
                     this.socket.emit('join_game', gameInitData);
@@ -39,6 +39,20 @@ export const initializeEventHandlers = (gameSession) => {
         gameSession.handleError('An error occurred. Exiting game..');
     });
 
+    // Event handler for the game frame, the messages of one server tick
+    // Every message in it goes to the handler of its own event below
+    socket.on('game_frame', (frame) => {
+        try {
+            if (frame && frame.gameId === gameSession.gameId) {
+                for (const [event, data] of frame.events) {
+                    socket.listeners(event).forEach((listener) => listener(data));
+                }
+            }
+        } catch (error) {
+            console.error('Error handling game_frame:', error);
+        }
+    });
+
     // Event handler for the game state message
     socket.on('send_game_state', (data) => {
         try {
@@ -146,6 +160,7 @@ export const cleanupEventHandlers = () => {
     socket.off('connect');
     socket.off('disconnect');
     socket.off('game_start');
+    socket.off('game_frame');
     socket.off('send_game_state');
     socket.off('score');
     socket.off('game_over');
@@ -2,6 +2,7 @@ import { io } from 'socket.io-client';
 
 // Use the proxy path for local development
 const socket = io('/', {path: '/game-server/socket.io',
+    auth: {wire_format: 'frames'},  // everything the server sends in a tick comes in one 'game_frame'
     pingInterval: 10000,  // 10 seconds between pings
     pingTimeout: 5000     // 5 seconds to wait for pong before disconnecting
 });
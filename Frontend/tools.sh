@@ -18,6 +18,18 @@ while ! curl -s "${GAME_HISTORY}" >/dev/null; do
     sleep 5
 done
 
+# Game server upstream of nginx.conf, one server per game server worker
+# (GAME_SERVER_WORKERS, worker i listens on 8010 + i, see Game_server/supervisor.py)
+GAME_SERVER_WORKERS="${GAME_SERVER_WORKERS:-1}"
+if ! [[ "$GAME_SERVER_WORKERS" =~ ^[1-9][0-9]*$ ]]; then
+    echo "Invalid GAME_SERVER_WORKERS=${GAME_SERVER_WORKERS}, using 1 game server worker"
+    GAME_SERVER_WORKERS=1
+fi
+: > /etc/nginx/game-server-upstream.conf
+for ((i = 0; i < GAME_SERVER_WORKERS; i++)); do
+    echo "server game-server:$((8010 + i));" >> /etc/nginx/game-server-upstream.conf
+done
+
 if [ "$NODE_ENV" = "development" ]; then
     echo "Starting Vite development server"
     # Run Vite in the background
@@ -39,6 +39,11 @@ export default defineConfig(({ mode }) => ({
         changeOrigin: true,
         ws: true,  // Enable WebSocket support
       },
+      '/replay-service/socket.io': {
+        target: 'http://replay-service:8020/socket.io',  // Proxy to replay service
+        changeOrigin: true,
+        ws: true,
+      },
     }
   },
   css: {
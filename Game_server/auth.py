@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import os
+import time
+import jwt
+import requests
+
+# Authentication of game server sessions
+# Access tokens are JWTs signed by the token service with the Django secret (HS256), the
+# game server verifies their signature and expiry itself, without asking the token service.
+# Sessions authenticate once, with the token of the Socket.IO handshake (auth={'token': ...}),
+# and the verified identity is kept for the session (see sid_identity in server_utils).
+# Tokens of users that logged out are revoked: the token service lists, per user, the time
+# of the last logout, and tokens issued before it are refused. The game server fetches that
+# denylist every DENYLIST_INTERVAL seconds in a thread, never on the event loop.
+
+JWT_SECRET = os.environ.get('DJANGO_SECRET')
+JWT_ALGORITHMS = ['HS256']
+TOKEN_SERVICE = os.environ.get('TOKEN_SERVICE')
+DENYLIST_PATH = '/auth/token/revoked-tokens/'
+DENYLIST_INTERVAL = 30.0
+DENYLIST_TIMEOUT = 5.0
+
+
+# Identity class
+# What a verified access token says about its user
+class Identity:
+    __slots__ = ('user_id', 'issued_at', 'expires_at')
+
+    def __init__(self, user_id: str, issued_at: float, expires_at: float):
+        self.user_id = user_id
+        self.issued_at = issued_at
+        self.expires_at = expires_at
+
+
+# verify_token function
+# Checks the signature and expiry of an access token
+# Returns the token's Identity, or None if the token is missing, invalid or expired
+def verify_token(token, secret: str = None):
+    secret = secret or JWT_SECRET
+    if not token or not secret:
+        return None
+    try:
+        claims = jwt.decode(token, secret, algorithms=JWT_ALGORITHMS,
+                            options={'require': ['exp', 'user_id']})
+    except jwt.InvalidTokenError:
+        return None
+    if claims.get('token_type', 'access') != 'access':
+        return None
+    return Identity(str(claims['user_id']), claims.get('iat', 0), claims['exp'])
+
+
+# Denylist class
+# Revoked tokens, refreshed from the token service
+# Properties:
+#   - revoked: user ID -> time of the user's last logout, their tokens issued before it are revoked
+#   - updated: time of the last successful refresh, None before the first one
+class Denylist:
+    def __init__(self, url: str = None, secret: str = JWT_SECRET):
+        self.url = url or (f"{TOKEN_SERVICE}{DENYLIST_PATH}" if TOKEN_SERVICE else None)
+        self.secret = secret
+        self.revoked: dict = {}
+        self.updated = None
+
+    # is_revoked method
+    # Returns True if the token of the identity was revoked
+    def is_revoked(self, identity: Identity) -> bool:
+        revoked_at = self.revoked.get(identity.user_id)
+        return revoked_at is not None and identity.issued_at < revoked_at
+
+    # update method
+    # Replaces the denylist with the one the token service sent
+    def update(self, data: dict) -> None:
+        self.revoked = {str(user_id): revoked_at for user_id, revoked_at in data.get('revoked', {}).items()}
+        self.updated = time.time()
+
+    def fetch(self) -> dict:
+        response = requests.get(self.url, headers={'X-SERVICE-SECRET': self.secret}, timeout=DENYLIST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    # refresh method
+    # Fetches the denylist from the token service, in a thread so the event loop keeps running
+    async def refresh(self) -> None:
+        self.update(await asyncio.to_thread(self.fetch))
+
+    # keep_fresh method
+    # Refreshes the denylist every DENYLIST_INTERVAL seconds, keeps the last one when it fails
+    async def keep_fresh(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.error(f"Could not refresh the token denylist: {e}")
+            await asyncio.sleep(DENYLIST_INTERVAL)
+
+
+# is_authorized function
+# Returns True if the identity is the given player's, and its token has not expired or been revoked
+def is_authorized(identity, player_id, denylist: Denylist) -> bool:
+    if identity is None or identity.user_id != str(player_id):
+        return False
+    if identity.expires_at <= time.time():
+        return False
+    return not denylist.is_revoked(identity)
@@ -0,0 +1,124 @@
+import argparse
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+
+# Entity benchmark
+# Measures the memory of a game's entities (GameState, players, paddles, ball, positions)
+# and the time of a physics tick (ball movement, collisions and goal check).
+# Usage, from Game_server:
+#   python benchmarks/entities.py                      # the entities of this tree
+#   python benchmarks/entities.py --compare HEAD~1     # and those of another git revision
+# With --compare, the other revision's game_logic package is exported to a temporary
+# directory and measured in a subprocess, so both run the same benchmark code.
+
+GAME_SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# new_game function
+# Creates the entities of one game, the same way PongGame.init_game does
+def new_game(game_id: int):
+    from game_logic.entities.gamestate import GameState
+    from game_logic.entities.player import Player
+    from game_logic.entities.ball import Ball
+    from game_logic.game_defaults import (PLAYER1_START_X, PLAYER2_START_X, BALL_DEFAULT_X,
+                                          BALL_DEFAULT_Z, BALL_RADIUS, BALL_SPEED)
+    player1 = Player(game_id * 2, PLAYER1_START_X)
+    player2 = Player(game_id * 2 + 1, PLAYER2_START_X)
+    ball = Ball(BALL_DEFAULT_X, BALL_DEFAULT_Z, BALL_RADIUS, BALL_SPEED, random.uniform(-40, 40))
+    return GameState(game_id, player1, player2, ball)
+
+
+# measure_memory function
+# Returns the bytes allocated per game for the entities of `games` games
+def measure_memory(games: int) -> float:
+    new_game(0)  # imports the entities outside of the measurement
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    states = [new_game(game_id) for game_id in range(games)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del states
+    return (after - before) / games
+
+
+# measure_ticks function
+# Steps `games` games for `ticks` ticks like a rally does, the ball is served again after a goal
+# The paddles follow the ball so rallies go on
+# Returns the nanoseconds per game and tick
+def measure_ticks(games: int, ticks: int) -> float:
+    states = [new_game(game_id) for game_id in range(games)]
+    start = time.perf_counter_ns()
+    for _ in range(ticks):
+        for state in states:
+            ball = state.ball
+            ball.update_position()
+            state.handle_collisions()
+            if state.check_goal():
+                state.reset_ball()
+            state.player1.move_paddle(ball.z - state.player1.paddle.z)
+            state.player2.move_paddle(ball.z - state.player2.paddle.z)
+    return (time.perf_counter_ns() - start) / (games * ticks)
+
+
+def run(games: int, ticks: int) -> dict:
+    random.seed(0)
+    return {
+        'bytes_per_game': round(measure_memory(games)),
+        'ns_per_game_tick': round(measure_ticks(games, ticks)),
+    }
+
+
+# run_revision function
+# Runs the benchmark on the entities of another git revision, in a subprocess
+def run_revision(revision: str, games: int, ticks: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        archive = subprocess.run(
+            ['git', 'archive', revision, 'game_logic'],
+            cwd=GAME_SERVER_DIR, check=True, capture_output=True,
+        ).stdout
+        archive_path = os.path.join(directory, 'game_logic.tar')
+        with open(archive_path, 'wb') as f:
+            f.write(archive)
+        with tarfile.open(archive_path) as tar:
+            tar.extractall(directory)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--games', str(games), '--ticks', str(ticks),
+             '--import-path', directory],
+            check=True, capture_output=True, text=True,
+        ).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Game entity memory and tick time benchmark')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--ticks', type=int, default=600)
+    parser.add_argument('--compare', metavar='REVISION', help='git revision to compare against')
+    parser.add_argument('--import-path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sys.path.insert(0, args.import_path or GAME_SERVER_DIR)
+    current = run(args.games, args.ticks)
+    if not args.compare:
+        print(json.dumps(current))
+        return
+    baseline = run_revision(args.compare, args.games, args.ticks)
+    print(json.dumps({
+        'current': current,
+        args.compare: baseline,
+        'memory_saved': f"{1 - current['bytes_per_game'] / baseline['bytes_per_game']:.0%}",
+        'tick_speedup': f"{baseline['ns_per_game_tick'] / current['ns_per_game_tick']:.2f}x",
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import json
+import threading
+import time
+import jwt
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Fake token service
+# Stands in for the backend's token service in load tests, so the game server can be run
+# without it: set TOKEN_SERVICE=http://127.0.0.1:<port> for the game server.
+# The game server verifies tokens itself, with its DJANGO_SECRET: issue_token() signs access
+# tokens with the same secret, and the service's denylist of revoked tokens is always empty.
+# On the validate-token endpoint every token is valid, except INVALID_TOKEN.
+# Usage, from Game_server:
+#   python benchmarks/fake_token_service.py --port 8011
+
+VALIDATE_PATH = '/auth/token/validate-token/'
+DENYLIST_PATH = '/auth/token/revoked-tokens/'
+INVALID_TOKEN = 'invalid'
+SECRET = 'load-test-secret-of-at-least-32-bytes'  # DJANGO_SECRET of a game server started for a load test
+TOKEN_LIFETIME = 3600
+
+
+# issue_token function
+# Returns an access token of the user, signed like the token service signs them
+def issue_token(user_id, secret: str = SECRET, lifetime: float = TOKEN_LIFETIME) -> str:
+    now = int(time.time())
+    claims = {'token_type': 'access', 'user_id': user_id, 'iat': now, 'exp': now + int(lifetime)}
+    return jwt.encode(claims, secret, algorithm='HS256')
+
+
+class TokenHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != DENYLIST_PATH:
+            self.reply(404, {'error': 'Not found'})
+        else:
+            self.reply(200, {'revoked': {}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode()
+        if self.path != VALIDATE_PATH:
+            self.reply(404, {'error': 'Not found'})
+        elif f'access={INVALID_TOKEN}' in body.split('&'):
+            self.reply(401, {'error': 'Invalid token'})
+        else:
+            self.reply(200, {'message': 'Token is valid'})
+
+    def reply(self, status: int, data: dict) -> None:
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# start function
+# Starts the fake token service in a daemon thread, returns the server
+# Its URL is f"http://{host}:{server.server_port}"
+def start(host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), TokenHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake token service for load tests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8011)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), TokenHandler)
+    print(f"Fake token service on http://{args.host}:{server.server_port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_token_service
+from results import GAME_SERVER_DIR, write_results, percentile
+
+# Load test
+# Starts simulated Socket.IO clients against a running game server, in pairs that join
+# the same remote game through join_game and then play it with move_paddle, like the
+# frontend does. The number of games is raised in stages, e.g. --games 100,500,1000,
+# and every stage is measured for --duration seconds once its games are running.
+# For every stage it reports, from the clients' side:
+#   - latency: time from the server building a send_game_state to the client receiving it
+#   - jitter: how far the time between two states is off the snapshot interval
+#   - dropped: states missing during rallies, from gaps in their tick numbers
+# and the server's CPU and RAM (needs psutil and the server's PID, which is known
+# when the load test starts the server itself with --start-server).
+# The clients run in --workers processes, so the load test itself is not the bottleneck.
+# With --start-server, a fake token service and the game server (python server.py) are
+# started locally, with TOKEN_SERVICE pointing at the fake service. Clients authenticate
+# with tokens signed with --secret, which must be the server's DJANGO_SECRET.
+# Needs the packages in benchmarks/requirements.txt.
+# Usage, from Game_server:
+#   python benchmarks/loadtest.py --start-server --games 50,200,500 --workers 4 --output load.json
+# Run it with --runtime standard and --runtime fast to compare the server's runtime profiles.
+
+SERVER_PORT = 8010
+FIRST_GAME_ID = 1_000_000  # game IDs of the load test, far from real ones
+
+
+# ClientStats class
+# What the clients of a worker measured during a stage
+class ClientStats:
+    def __init__(self):
+        self.received = 0
+        self.dropped = 0
+        self.latencies: list = []  # milliseconds
+        self.jitter: list = []     # milliseconds
+        self.errors = 0
+
+    def as_dict(self) -> dict:
+        return {
+            'received': self.received,
+            'dropped': self.dropped,
+            'latencies': self.latencies,
+            'jitter': self.jitter,
+            'errors': self.errors,
+        }
+
+
+# LoadClient class
+# One simulated player, connects, joins its game and moves its paddle towards the ball
+class LoadClient:
+    def __init__(self, worker, url: str, game_id: int, player: int, input_rate: float, secret: str):
+        import socketio
+        self.worker = worker
+        self.url = url
+        self.game_id = game_id
+        self.player1_id = game_id * 2
+        self.player2_id = game_id * 2 + 1
+        self.player_id = self.player1_id if player == 1 else self.player2_id
+        self.player = player
+        self.token = fake_token_service.issue_token(self.player_id, secret)
+        self.input_interval = 1.0 / input_rate
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.last_tick = None
+        self.last_arrival = None
+        self.last_paused = True
+        self.ball_z = None
+        self.paddle_z = None
+        self.sio.on('send_game_state', self.on_state)
+        self.sio.on('error', self.on_error)
+        self.sio.on('invalid_token', self.on_error)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        try:
+            # game_id in the handshake routes both players to the same worker, see supervisor.py
+            await self.sio.connect(f'{self.url}?game_id={self.game_id}', transports=['websocket'],
+                                   auth={'token': self.token})
+            await self.sio.emit('join_game', {
+                'game_id': self.game_id,
+                'local_player_id': self.player_id,
+                'player1_id': self.player1_id,
+                'player2_id': self.player2_id,
+                'is_remote': True,
+                'token': self.token,
+            })
+            while not stop.is_set():
+                await asyncio.sleep(self.input_interval)
+                await self.move()
+        except Exception:
+            self.worker.stats.errors += 1
+        finally:
+            await self.sio.disconnect()
+
+    # move method
+    # Sends a move_paddle towards the ball, at most PADDLE_SPEED
+    async def move(self) -> None:
+        if self.ball_z is None or self.paddle_z is None:
+            return
+        delta_z = max(-9.0, min(9.0, self.ball_z - self.paddle_z))
+        if abs(delta_z) < 1.0:
+            return
+        await self.sio.emit('move_paddle', {
+            'type': 'move_paddle',
+            'game_id': self.game_id,
+            'player_id': self.player_id,
+            'delta_z': delta_z,
+        })
+
+    async def on_state(self, data) -> None:
+        arrival = time.time() * 1000
+        stats = self.worker.stats
+        stats.received += 1
+        tick = data.get('tick')
+        paused = data.get('paused', False)
+        self.ball_z = data['ballPosition']['z']
+        self.paddle_z = data['player1Pos' if self.player == 1 else 'player2Pos']['z']
+        if self.worker.measuring:
+            stats.latencies.append(arrival - data['serverTime'])
+            # Only rallies have a state on every snapshot interval, the serve does not
+            if self.last_tick is not None and not paused and not self.last_paused:
+                gap = tick - self.last_tick
+                if gap > self.worker.snapshot_interval:
+                    stats.dropped += gap // self.worker.snapshot_interval - 1
+                stats.jitter.append(abs(arrival - self.last_arrival - self.worker.expected_interval_ms))
+        self.last_tick = tick
+        self.last_arrival = arrival
+        self.last_paused = paused
+
+    async def on_error(self, data=None) -> None:
+        self.worker.stats.errors += 1
+
+
+# Worker class
+# Runs this process' share of the clients through the stages
+class Worker:
+    def __init__(self, index: int, args: dict):
+        self.index = index
+        self.args = args
+        self.stats = ClientStats()
+        self.measuring = False
+        self.snapshot_interval = max(1, args['tick_rate'] // args['snapshot_rate'])
+        self.expected_interval_ms = 1000.0 / args['snapshot_rate']
+
+    async def run(self, start_time: float) -> list:
+        stop = asyncio.Event()
+        tasks = []
+        results = []
+        games = 0
+        stage_length = self.args['ramp'] + self.args['warmup'] + self.args['duration']
+        for stage, target in enumerate(self.args['games']):
+            stage_start = start_time + stage * stage_length
+            await asyncio.sleep(max(0.0, stage_start - time.time()))
+            new_games = [
+                game for game in range(games, target)
+                if game % self.args['workers'] == self.index
+            ]
+            games = target
+            for number, game in enumerate(new_games):
+                for player in (1, 2):
+                    client = LoadClient(self, self.args['url'], FIRST_GAME_ID + game, player,
+                                        self.args['input_rate'], self.args['secret'])
+                    tasks.append(asyncio.create_task(client.run(stop)))
+                # Spread the new games over the ramp
+                await asyncio.sleep(self.args['ramp'] / max(1, len(new_games)))
+            await asyncio.sleep(max(0.0, stage_start + self.args['ramp'] + self.args['warmup'] - time.time()))
+            self.stats = ClientStats()
+            self.measuring = True
+            await asyncio.sleep(max(0.0, stage_start + stage_length - time.time()))
+            self.measuring = False
+            results.append(self.stats.as_dict())
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return results
+
+
+def run_worker(index: int, args: dict, start_time: float, queue) -> None:
+    results = asyncio.run(Worker(index, args).run(start_time))
+    queue.put((index, results))
+
+
+# wait_for_port function
+# Waits until something listens on the port, raises a TimeoutError after `timeout` seconds
+def wait_for_port(host: str, port: int, timeout: float = 15.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1.0):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"Nothing is listening on {host}:{port}")
+
+
+# start_server function
+# Starts the fake token service and the game server, returns the server process
+def start_server(secret: str, runtime: str = None) -> subprocess.Popen:
+    token_service = fake_token_service.start()
+    env = dict(os.environ)
+    if runtime:
+        env['GAME_SERVER_RUNTIME'] = runtime
+    env['TOKEN_SERVICE'] = f"http://127.0.0.1:{token_service.server_port}"
+    env['DJANGO_SECRET'] = secret
+    env.setdefault('HOSTNAME', 'localhost')
+    process = subprocess.Popen(
+        [sys.executable, 'server.py'], cwd=GAME_SERVER_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    wait_for_port('127.0.0.1', SERVER_PORT)
+    return process
+
+
+# ServerMonitor class
+# Measures the game server's CPU and RAM during every stage, needs psutil
+class ServerMonitor:
+    def __init__(self, pid):
+        self.process = None
+        if pid is None:
+            return
+        try:
+            import psutil
+        except ImportError:
+            print("psutil is not installed, server CPU and RAM are not measured", file=sys.stderr)
+            return
+        self.process = psutil.Process(pid)
+
+    def start(self) -> None:
+        if self.process is not None:
+            self.process.cpu_percent(None)
+
+    def stop(self) -> dict:
+        if self.process is None:
+            return {}
+        return {
+            'server_cpu_percent': self.process.cpu_percent(None),
+            'server_rss_mb': round(self.process.memory_info().rss / 2 ** 20, 1),
+        }
+
+
+# summarize function
+# Merges the workers' stats of a stage into the stage's report
+def summarize(games: int, duration: float, stats: list, server: dict) -> dict:
+    latencies = [value for worker in stats for value in worker['latencies']]
+    jitter = [value for worker in stats for value in worker['jitter']]
+    received = sum(worker['received'] for worker in stats)
+    dropped = sum(worker['dropped'] for worker in stats)
+    return {
+        'games': games,
+        'clients': games * 2,
+        'states_per_second': round(received / duration),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'max': round(max(latencies, default=0.0), 2),
+        },
+        'jitter_ms': {
+            'p50': round(percentile(jitter, 50), 2),
+            'p99': round(percentile(jitter, 99), 2),
+        },
+        'dropped': dropped,
+        'dropped_percent': round(dropped / (received + dropped) * 100, 3) if received + dropped else 0.0,
+        'errors': sum(worker['errors'] for worker in stats),
+        **server,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Socket.IO load test of the game server')
+    parser.add_argument('--url', default=f'http://127.0.0.1:{SERVER_PORT}')
+    parser.add_argument('--games', default='10,50,100', help='comma separated game counts, one stage each')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds every stage is measured')
+    parser.add_argument('--ramp', type=float, default=5.0, help='seconds to connect the new games of a stage')
+    parser.add_argument('--warmup', type=float, default=3.0, help='seconds between the ramp and the measurement')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='client processes')
+    parser.add_argument('--input-rate', type=float, default=60.0, help='move_paddle messages per second per client')
+    parser.add_argument('--tick-rate', type=int, default=60, help='the server\'s default tick rate')
+    parser.add_argument('--snapshot-rate', type=int, default=60, help='the server\'s default snapshot rate')
+    parser.add_argument('--start-server', action='store_true', help='start a fake token service and the server')
+    parser.add_argument('--secret', default=os.environ.get('DJANGO_SECRET', fake_token_service.SECRET),
+                        help='secret the server verifies tokens with (its DJANGO_SECRET)')
+    parser.add_argument('--runtime', choices=('fast', 'standard'),
+                        help='runtime profile of the started server (GAME_SERVER_RUNTIME, see runtime.py)')
+    parser.add_argument('--server-pid', type=int, help='PID of an already running server, for CPU and RAM')
+    parser.add_argument('--output', metavar='FILE', help='write the JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    worker_args = {
+        'url': args.url,
+        'games': [int(games) for games in args.games.split(',')],
+        'duration': args.duration,
+        'ramp': args.ramp,
+        'warmup': args.warmup,
+        'workers': args.workers,
+        'input_rate': args.input_rate,
+        'tick_rate': args.tick_rate,
+        'snapshot_rate': args.snapshot_rate,
+        'secret': args.secret,
+    }
+    server_process = start_server(args.secret, args.runtime) if args.start_server else None
+    monitor = ServerMonitor(server_process.pid if server_process else args.server_pid)
+    try:
+        start_time = time.time() + 1.0
+        queue = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=run_worker, args=(index, worker_args, start_time, queue))
+            for index in range(args.workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        # Sample the server during every stage's measurement, on the workers' schedule
+        stage_length = args.ramp + args.warmup + args.duration
+        server_stats = []
+        for stage in range(len(worker_args['games'])):
+            measure_start = start_time + stage * stage_length + args.ramp + args.warmup
+            time.sleep(max(0.0, measure_start - time.time()))
+            monitor.start()
+            time.sleep(max(0.0, measure_start + args.duration - time.time()))
+            server_stats.append(monitor.stop())
+
+        worker_results = dict(queue.get() for _ in workers)
+        for worker in workers:
+            worker.join()
+    finally:
+        if server_process is not None:
+            server_process.terminate()
+            server_process.wait()
+
+    stages = [
+        summarize(games, args.duration, [worker_results[index][stage] for index in worker_results],
+                  server_stats[stage])
+        for stage, games in enumerate(worker_args['games'])
+    ]
+    write_results({
+        'benchmark': 'loadtest',
+        'settings': {key: value for key, value in worker_args.items() if key not in ('url', 'secret')},
+        'runtime': args.runtime,
+        'stages': stages,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
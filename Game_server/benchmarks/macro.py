@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from results import write_results, percentile
+from game_logic.game_defaults import *
+from tick_scheduler import TickScheduler
+from headless import PaddleBot, apply_input
+import broadcast
+import server
+from server import PongGame
+
+# Game loop benchmark
+# Runs N concurrent PongGame loops on a real TickScheduler (real clock and sleep) for a
+# while, with bots playing both paddles and an in-process fake Socket.IO server that
+# JSON encodes every emit like the real one does, but sends nothing.
+# Reports the achieved tick rate per game, how late the scheduler woke up for its ticks
+# (p50/p99 jitter), the CPU time per game, and the messages and bytes that would be sent.
+# Usage, from Game_server:
+#   python benchmarks/macro.py --games 100 --duration 10 --output macro.json
+
+
+# FakeSio class
+# Stands in for the Socket.IO server, counts emits and the bytes of their JSON encoding
+class FakeSio:
+    def __init__(self):
+        self.emits = 0
+        self.bytes = 0
+
+    async def enter_room(self, sid, room, namespace=None):
+        pass
+
+    async def leave_room(self, sid, room, namespace=None):
+        pass
+
+    async def emit(self, event, data=None, room=None, skip_sid=None, **kwargs):
+        self.emits += 1
+        if isinstance(data, (bytes, bytearray)):
+            self.bytes += len(data)
+        else:
+            self.bytes += len(json.dumps([event, data], default=repr))
+
+
+# JitterSleep class
+# The scheduler's sleep function, records how late every wake-up was in seconds
+class JitterSleep:
+    def __init__(self):
+        self.lateness: list = []
+
+    async def __call__(self, delay: float) -> None:
+        target = time.monotonic() + delay
+        await asyncio.sleep(delay)
+        self.lateness.append(time.monotonic() - target)
+
+
+async def run(games: int, duration: float, tick_rate: int) -> dict:
+    fake_sio = FakeSio()
+    broadcast.sio = fake_sio
+    server.sio = fake_sio
+    sleep = JitterSleep()
+    scheduler = TickScheduler(MAX_TICK_RATE, sleep=sleep)
+    server.tick_scheduler = scheduler
+
+    pong_games, bots = [], []
+    for game_id in range(games):
+        game = PongGame(game_id, game_id * 2 + 1, game_id * 2 + 2, True, tick_rate, tick_rate, seed=game_id)
+        game.physics = None
+        await game.add_player(f'sid{game_id}a', game_id * 2 + 1)
+        await game.add_player(f'sid{game_id}b', game_id * 2 + 2)
+        pong_games.append(game)
+        bots.append((game, PaddleBot(1, game_id * 2), PaddleBot(2, game_id * 2 + 1)))
+
+    # Bots decide after every scheduler tick, like clients sending input in between ticks
+    def play():
+        for game, *players in bots:
+            for bot in players:
+                for data in bot.inputs(game.tick + 1, game):
+                    apply_input(game, data, data['tick'])
+    scheduler.add_tick_hook(play)
+
+    cpu_start, wall_start = time.process_time(), time.monotonic()
+    tasks = [asyncio.create_task(game.game_loop()) for game in pong_games]
+    await asyncio.sleep(duration)
+    wall = time.monotonic() - wall_start
+    cpu = time.process_time() - cpu_start
+    ticks = sum(game.tick for game in pong_games)
+    for game in pong_games:
+        game.finish()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    lateness_ms = [late * 1000 for late in sleep.lateness]
+    return {
+        'games': games,
+        'duration': round(wall, 3),
+        'target_tick_rate': tick_rate,
+        'tick_rate': round(ticks / games / wall, 2),
+        'jitter_ms': {
+            'p50': round(percentile(lateness_ms, 50), 3),
+            'p99': round(percentile(lateness_ms, 99), 3),
+            'max': round(max(lateness_ms, default=0.0), 3),
+        },
+        'skipped_ticks': scheduler.skipped_ticks,
+        'cpu_percent': round(cpu / wall * 100, 1),
+        'cpu_ms_per_game_second': round(cpu * 1000 / games / wall, 3),
+        'emits_per_second': round(fake_sio.emits / wall),
+        'bytes_per_second': round(fake_sio.bytes / wall),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent game loop benchmark')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to run the games for')
+    parser.add_argument('--tick-rate', type=int, default=TICK_RATE)
+    parser.add_argument('--output', metavar='FILE', help='write the JSON results here instead of stdout')
+    args = parser.parse_args()
+    results = asyncio.run(run(args.games, args.duration, args.tick_rate))
+    write_results({'benchmark': 'macro', 'results': results}, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from results import write_results
+from game_logic.game_defaults import *
+from server import PongGame
+
+# Microbenchmarks of the game logic
+# Times the functions every game runs on every tick, in nanoseconds per call
+# (best of --repeat runs, each auto-ranged to at least 0.2 seconds)
+# Usage, from Game_server:
+#   python benchmarks/micro.py --output micro.json
+
+
+# new_game function
+# A game in the middle of a rally, the ball heading for player 1's paddle
+def new_game() -> PongGame:
+    game = PongGame(1, 1, 2, False, seed=0)
+    game.game_state.paused = False
+    game.game_state.ball.set_state(FIELD_DEPTH / 3, PLAYER_START_Z, BALL_SPEED, 200,
+                                   -BALL_SPEED, -BALL_SPEED / 3)
+    return game
+
+
+# cases function
+# Returns the benchmarks as name -> (statement, namespace)
+# Statements that change the ball start by putting it back with set_state, so every
+# call does the same work
+def cases() -> dict:
+    game = new_game()
+    state = game.game_state
+    ball = state.ball
+    paddle = state.player1.paddle
+    near_paddle = (BALL_RADIUS + 2, PLAYER_START_Z + PADDLE_WIDTH / 4, BALL_SPEED, 200,
+                   -BALL_SPEED, -BALL_SPEED / 3)
+    mid_field = (FIELD_DEPTH / 2, PLAYER_START_Z, BALL_SPEED, 200, -BALL_SPEED, -BALL_SPEED / 3)
+    namespace = {
+        'game': game, 'state': state, 'ball': ball, 'paddle': paddle,
+        'near_paddle': near_paddle, 'mid_field': mid_field, 'json': json,
+    }
+    game.send_game_state_to_client()
+    namespace['payload'] = game.broadcaster.outbox.pop()[1]
+    return {
+        'ball_set_state': 'ball.set_state(*mid_field)',
+        'ball_update_position': 'ball.set_state(*mid_field); ball.update_position()',
+        'ball_check_collision': 'ball.check_collision(paddle)',
+        'ball_next_impact': 'ball.next_impact(1.0, state.player1.paddle, state.player2.paddle)',
+        'ball_bounce_from_paddle': 'ball.set_state(*near_paddle); ball.bounce_from_paddle(paddle)',
+        'gamestate_handle_collisions': 'ball.set_state(*mid_field); state.handle_collisions()',
+        'gamestate_advance_ball': 'ball.set_state(*mid_field); state.advance_ball()',
+        'gamestate_advance_ball_paddle_hit': 'ball.set_state(*near_paddle); state.advance_ball()',
+        'send_game_state_payload': 'game.send_game_state_to_client(); game.broadcaster.outbox.clear()',
+        'send_game_state_json': 'json.dumps(payload)',
+    }, namespace
+
+
+# run function
+# Returns name -> nanoseconds per call
+def run(repeat: int) -> dict:
+    statements, namespace = cases()
+    results = {}
+    for name, statement in statements.items():
+        timer = timeit.Timer(statement, globals=namespace)
+        number, _ = timer.autorange()
+        best = min(timer.repeat(repeat=repeat, number=number))
+        results[name] = round(best / number * 1e9, 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Game logic microbenchmarks')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', metavar='FILE', help='write the JSON results here instead of stdout')
+    args = parser.parse_args()
+    write_results({'benchmark': 'micro', 'unit': 'ns/call', 'results': run(args.repeat)}, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from results import write_results
+from game_logic.game_defaults import PADDLE_WIDTH
+from server import PongGame, PHASE_RALLY
+
+# Physics engine benchmark
+# Moves the balls of many games at once, the way PongGame.step does in a rally, with the
+# object engine (every game moves its own ball, GameState.advance_ball) and with the batch
+# engine (one NumPy step for all rallies of the tick, see game_logic/batch_engine.py), and
+# reports the microseconds per game and tick of the physics: moving the ball, collisions,
+# goals and the trajectory bookkeeping after them. The rest of the tick (input, serves,
+# post rally) is the same with both engines and is not timed.
+# The paddles follow the ball a little off center so rallies go on and the balls bounce,
+# games that scored go through a serve and play on.
+# Usage, from Game_server:
+#   python benchmarks/physics.py --games 100,500,2000 --output physics.json
+
+
+# new_games function
+# Creates the games, all about to launch a rally, with the given physics engine
+# (None for the object engine)
+def new_games(count: int, engine) -> list:
+    games = []
+    for game_id in range(count):
+        game = PongGame(game_id, 1, 2, False, seed=game_id)
+        game.physics = engine
+        game.start_rally()
+        game.phase_ticks = 1
+        games.append(game)
+    return games
+
+
+# follow_ball function
+# Moves both paddles towards the ball, off center by the game's own offset
+def follow_ball(game, offset: float) -> None:
+    state = game.game_state
+    z = state.ball.z + offset
+    state.player1.move_paddle(z - state.player1.paddle.z, game.step_scale)
+    state.player2.move_paddle(z - state.player2.paddle.z, game.step_scale)
+
+
+# measure function
+# Returns the microseconds of physics per game and tick, over `ticks` ticks of `count` games
+def measure(count: int, ticks: int, engine) -> float:
+    games = new_games(count, engine)
+    offsets = [random.Random(game.game_id).uniform(-0.4, 0.4) * PADDLE_WIDTH for game in games]
+    elapsed = 0.0
+    for _ in range(ticks):
+        rallies = []
+        for game, offset in zip(games, offsets):
+            follow_ball(game, offset)
+            if game.phase == PHASE_RALLY:
+                rallies.append(game)
+            else:
+                game.step()
+        start = time.perf_counter()
+        if engine is not None:
+            for game in rallies:
+                engine.submit(game, game.step_scale)
+            engine.run()
+        else:
+            for game in rallies:
+                game.update_game_state()
+                game.end_rally_tick()
+        elapsed += time.perf_counter() - start
+        for game in rallies:
+            game.trajectory_changes.clear()  # nothing flushes them here
+    return elapsed * 1e6 / (count * ticks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Object vs batch physics engine benchmark')
+    parser.add_argument('--games', default='100,500,2000', help='comma separated numbers of games')
+    parser.add_argument('--ticks', type=int, default=600)
+    parser.add_argument('--output', help='JSON file to write the results to, stdout if not given')
+    args = parser.parse_args()
+
+    try:
+        from game_logic.batch_engine import BatchPhysicsEngine
+    except ImportError:
+        BatchPhysicsEngine = None
+    results = []
+    for count in (int(games) for games in args.games.split(',')):
+        result = {'games': count, 'object_us_per_game_tick': round(measure(count, args.ticks, None), 3)}
+        if BatchPhysicsEngine is not None:
+            batch = measure(count, args.ticks, BatchPhysicsEngine())
+            result['batch_us_per_game_tick'] = round(batch, 3)
+            result['batch_speedup'] = f"{result['object_us_per_game_tick'] / batch:.2f}x"
+        results.append(result)
+        print(json.dumps(result), file=sys.stderr)
+    write_results({'benchmark': 'physics', 'unit': 'us/game tick', 'ticks': args.ticks, 'results': results},
+                  args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+GAME_SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# metadata function
+# Describes where and on what the benchmark ran, so results can be compared over time
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=GAME_SERVER_DIR,
+            check=True, capture_output=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+# write_results function
+# Writes the results as JSON to the given file, or to stdout if there is none
+def write_results(results: dict, output=None) -> None:
+    results = {'meta': metadata(), **results}
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+# percentile function
+# Nearest-rank percentile of a list of numbers, p between 0 and 100
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
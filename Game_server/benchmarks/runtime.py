@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from socketio import packet
+from results import write_results
+from server import PongGame
+import runtime
+
+# Runtime profile benchmark
+# Messages per second the Socket.IO packet codec handles with the json module (standard
+# runtime profile) and with orjson (fast runtime profile, see runtime.py), for the messages
+# the game server sends and receives most: game states, frames and trajectories out,
+# move_paddle and paddle_input in. Every message is a full Socket.IO packet, encoded or
+# decoded the way python-socketio does it on every emit and every received event.
+# For the whole server, compare benchmarks/loadtest.py --runtime standard and --runtime fast.
+# Usage, from Game_server:
+#   python benchmarks/runtime.py --output runtime.json
+
+
+# StandardPacket and FastPacket classes
+# Socket.IO packets encoded with the json module and with orjson
+class StandardPacket(packet.Packet):
+    json = json
+
+
+class FastPacket(packet.Packet):
+    json = runtime.OrjsonModule
+
+
+# messages function
+# Returns the outgoing messages as name -> [event, data], and the incoming ones as
+# name -> encoded packet
+def messages() -> tuple:
+    game = PongGame(1, 1, 2, False, seed=0)
+    game.start_rally()
+    for _ in range(game.serve_delay_ticks + 30):
+        game.step()
+    game.send_game_state_to_client()
+    state = game.broadcaster.outbox.pop()[1]
+    trajectory = game.trajectory_event([{'kind': 'wall_bounce', 'tick': game.tick}])
+    frame = {'gameId': 1, 'events': [['send_game_state', state], ['score', {
+        'type': 'score', 'gameId': 1, 'player1Score': 3, 'player2Score': 4}]]}
+    outgoing = {
+        'send_game_state': ['send_game_state', state],
+        'game_frame': ['game_frame', frame],
+        'trajectory': ['trajectory', trajectory],
+    }
+    incoming = {
+        'move_paddle': StandardPacket(packet.EVENT, ['move_paddle', {'game_id': 1, 'player_id': 1, 'delta_z': -9}]).encode(),
+        'paddle_input': StandardPacket(packet.EVENT, ['paddle_input', {'game_id': 1, 'player_id': 1, 'direction': 1, 'seq': 42}]).encode(),
+    }
+    return outgoing, incoming
+
+
+# messages_per_second function
+# Runs the function over and over for about the given time, returns calls per second
+def messages_per_second(function, seconds: float) -> float:
+    calls = 0
+    batch = 1000
+    start = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            function()
+        calls += batch
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return calls / elapsed
+
+
+# run function
+# Returns, for every message, the messages per second with both codecs and the speedup
+def run(seconds: float) -> dict:
+    outgoing, incoming = messages()
+    cases = {}
+    for name, data in outgoing.items():
+        cases[f'encode_{name}'] = {
+            profile: (lambda packet_class=packet_class: packet_class(packet.EVENT, data).encode())
+            for profile, packet_class in (('standard', StandardPacket), ('fast', FastPacket))
+        }
+    for name, encoded in incoming.items():
+        cases[f'decode_{name}'] = {
+            profile: (lambda packet_class=packet_class: packet_class(encoded_packet=encoded))
+            for profile, packet_class in (('standard', StandardPacket), ('fast', FastPacket))
+        }
+    results = {}
+    for name, functions in cases.items():
+        standard = messages_per_second(functions['standard'], seconds)
+        fast = messages_per_second(functions['fast'], seconds)
+        results[name] = {
+            'standard': round(standard),
+            'fast': round(fast),
+            'speedup': round(fast / standard, 2),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Socket.IO codec throughput of the runtime profiles')
+    parser.add_argument('--seconds', type=float, default=1.0, help='seconds every case runs per codec')
+    parser.add_argument('--output', metavar='FILE', help='write the JSON results here instead of stdout')
+    args = parser.parse_args()
+    if runtime.orjson is None:
+        sys.exit("orjson is not installed (or GAME_SERVER_RUNTIME is not 'fast'), nothing to compare")
+    write_results({'benchmark': 'runtime', 'unit': 'messages/s', 'runtime': runtime.describe(),
+                   'results': run(args.seconds)}, args.output)
+
+
+if __name__ == '__main__':
+    main()
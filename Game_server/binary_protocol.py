@@ -0,0 +1,68 @@
+import struct
+
+# Compact binary game state, for clients that connect with the 'binary' wire format
+# Every snapshot is a fixed-layout little-endian record (46 bytes):
+#   - schema version   uint8
+#   - flags            uint8   (FLAG_BOUNCE, FLAG_PAUSED)
+#   - tick             uint32
+#   - server time      float64 (milliseconds since the epoch)
+#   - ball x, z        float32
+#   - ball dx, dz      float32
+#   - player1 paddle z float32
+#   - player2 paddle z float32
+#   - player1 seq      uint32  (last applied paddle_input, for client prediction)
+#   - player2 seq      uint32
+# Paddle x positions and the game ID never change during a game, so they are
+# not part of the record. A new layout must bump BINARY_SCHEMA_VERSION.
+BINARY_SCHEMA_VERSION = 3
+SNAPSHOT_STRUCT = struct.Struct('<BBId6f2I')
+
+FLAG_BOUNCE = 1
+FLAG_PAUSED = 2
+
+
+# pack_snapshot function
+# Packs a 'send_game_state' message into a binary snapshot
+def pack_snapshot(state: dict) -> bytes:
+    flags = 0
+    if state['bounce']:
+        flags |= FLAG_BOUNCE
+    if state['paused']:
+        flags |= FLAG_PAUSED
+    ball = state['ballPosition']
+    delta = state['ballDelta']
+    return SNAPSHOT_STRUCT.pack(
+        BINARY_SCHEMA_VERSION,
+        flags,
+        state['tick'] & 0xFFFFFFFF,
+        state['serverTime'],
+        ball['x'],
+        ball['z'],
+        delta['dx'],
+        delta['dz'],
+        state['player1Pos']['z'],
+        state['player2Pos']['z'],
+        state['player1Seq'] & 0xFFFFFFFF,
+        state['player2Seq'] & 0xFFFFFFFF,
+    )
+
+
+# unpack_snapshot function
+# Unpacks a binary snapshot, used by tests and tools, clients do the same in JS
+# Raises a ValueError if the snapshot has another schema version
+def unpack_snapshot(data: bytes) -> dict:
+    version, flags, tick, server_time, x, z, dx, dz, p1_z, p2_z, p1_seq, p2_seq = SNAPSHOT_STRUCT.unpack(data)
+    if version != BINARY_SCHEMA_VERSION:
+        raise ValueError(f"Unsupported snapshot schema version {version}")
+    return {
+        'tick': tick,
+        'serverTime': server_time,
+        'ballPosition': {'x': x, 'z': z},
+        'ballDelta': {'dx': dx, 'dz': dz},
+        'player1Pos': {'z': p1_z},
+        'player2Pos': {'z': p2_z},
+        'player1Seq': p1_seq,
+        'player2Seq': p2_seq,
+        'bounce': bool(flags & FLAG_BOUNCE),
+        'paused': bool(flags & FLAG_PAUSED),
+    }
@@ -0,0 +1,279 @@
+import logging
+import os
+import time
+from collections import deque
+from server_utils import sio, sid_spectating
+from binary_protocol import pack_snapshot
+from snapshot import SnapshotEncoder
+
+# Wire formats a client can ask for in the Socket.IO auth data at connect,
+# e.g. io(url, {auth: {wire_format: 'frames'}})
+WIRE_JSON = 'json'      # one Socket.IO event per message, the default for old clients
+WIRE_FRAMES = 'frames'  # everything produced in one tick in a single 'game_frame' event
+WIRE_BINARY = 'binary'  # like frames, but the game state is a packed binary snapshot
+WIRE_DELTA = 'delta'    # like frames, but the game state is delta compressed (see snapshot.py)
+WIRE_EVENTS = 'events'  # no game state, only trajectory changes, the client extrapolates in between
+WIRE_FORMATS = (WIRE_JSON, WIRE_FRAMES, WIRE_BINARY, WIRE_DELTA, WIRE_EVENTS)
+
+# Spectators get game states at a lower rate than the players, and a little late
+SPECTATOR_SNAPSHOT_RATE = float(os.environ.get('SPECTATOR_SNAPSHOT_RATE', '10'))  # per second
+SPECTATOR_DELAY = float(os.environ.get('SPECTATOR_DELAY', '0.5'))  # seconds
+
+
+# SpectatorFeed class
+# Streams a game to its spectators, all of them in one Socket.IO room
+# At most SPECTATOR_SNAPSHOT_RATE game states per second are taken from the players'
+# messages, together with every other message (score, game_over, ...) in a
+# 'spectator_frame'. Frames wait SPECTATOR_DELAY seconds in a buffer before they are sent,
+# with a single emit to the room, so every frame is encoded once for all the spectators.
+# Properties:
+#   - sids: session IDs of the spectators
+#   - buffer: frames waiting for their send time, as (send time, frame)
+class SpectatorFeed:
+    def __init__(self, game_id, rate: float = SPECTATOR_SNAPSHOT_RATE,
+                 delay: float = SPECTATOR_DELAY, clock=time.monotonic):
+        self.game_id = game_id
+        self.sids: set = set()
+        self.buffer: deque = deque()
+        self.rate = rate
+        self.delay = delay
+        self._interval = 1.0 / rate
+        self._next_state = 0.0
+        self._clock = clock
+
+    @property
+    def room(self) -> str:
+        return f"game:{self.game_id}:spectators"
+
+    async def add(self, sid) -> None:
+        await sio.enter_room(sid, self.room)
+        self.sids.add(sid)
+
+    async def remove(self, sid) -> None:
+        if sid not in self.sids:
+            return
+        self.sids.discard(sid)
+        try:
+            await sio.leave_room(sid, self.room)
+        except Exception as e:
+            logging.error(f"Error removing spectator {sid} of game {self.game_id}: {e}")
+
+    # capture method
+    # Puts the messages of a flush in a frame for the spectators
+    # The game state is only kept if the spectators are due one
+    def capture(self, events: list) -> None:
+        now = self._clock()
+        frame_events = []
+        for event, data in events:
+            if event != 'send_game_state':
+                frame_events.append([event, data])
+            elif now >= self._next_state:
+                frame_events.append([event, data])
+                self._next_state += self._interval
+                if self._next_state <= now:  # fell behind, e.g. during a serve, don't burst
+                    self._next_state = now + self._interval
+        if frame_events:
+            frame = {'type': 'spectator_frame', 'gameId': self.game_id, 'events': frame_events}
+            self.buffer.append((now + self.delay, frame))
+
+    # release method
+    # Sends the frames whose delay is over, all of them if forced
+    async def release(self, force: bool = False) -> None:
+        now = self._clock()
+        while self.buffer and (force or self.buffer[0][0] <= now):
+            _, frame = self.buffer.popleft()
+            await sio.emit('spectator_frame', frame, room=self.room)
+
+    # close method
+    # Sends the frames still in the buffer and removes every spectator
+    # The spectators no longer watch a game, their sid_spectating entries go too
+    async def close(self) -> None:
+        if self.sids:
+            await self.release(force=True)
+        self.buffer.clear()
+        for sid in list(self.sids):
+            await self.remove(sid)
+            if sid_spectating.get(sid) == self.game_id:
+                del sid_spectating[sid]
+
+
+# GameBroadcaster class
+# Sends a game's messages to its clients through Socket.IO rooms
+# Every wire format has its own room, so a message is encoded once per format
+# and the encoded packet is fanned out to all clients in the room.
+# Messages queued during a tick are sent together on flush
+# Properties:
+#   - game_id: the ID of the game
+#   - members: session IDs in the game's rooms and their wire format
+#   - outbox: messages queued since the last flush, as (event, data) tuples
+#   - trajectory: trajectory events queued since the last flush, only for the events wire format
+#   - snapshots: delta encoder for the clients using the delta wire format
+#   - spectators: the game's spectator feed
+class GameBroadcaster:
+    def __init__(self, game_id):
+        self.game_id = game_id
+        self.members: dict = {}
+        self.outbox: list = []
+        self.trajectory: list = []
+        self.snapshots: SnapshotEncoder = SnapshotEncoder()
+        self.spectators: SpectatorFeed = SpectatorFeed(game_id)
+        self._format_counts: dict = {wire_format: 0 for wire_format in WIRE_FORMATS}
+
+    # room method
+    # Returns the name of the game's room for the given wire format
+    def room(self, wire_format: str) -> str:
+        return f"game:{self.game_id}:{wire_format}"
+
+    # add method
+    # Adds a session to the room of its wire format
+    async def add(self, sid, wire_format: str = WIRE_JSON) -> None:
+        if wire_format not in self._format_counts:
+            wire_format = WIRE_JSON
+        if sid in self.members:
+            await self.remove(sid)
+        await sio.enter_room(sid, self.room(wire_format))
+        self.members[sid] = wire_format
+        self._format_counts[wire_format] += 1
+        if wire_format == WIRE_DELTA:
+            self.snapshots.add(sid)
+
+    # remove method
+    # Removes a session from the game's rooms
+    async def remove(self, sid) -> None:
+        wire_format = self.members.pop(sid, None)
+        if wire_format is None:
+            return
+        self._format_counts[wire_format] -= 1
+        self.snapshots.remove(sid)
+        try:
+            await sio.leave_room(sid, self.room(wire_format))
+        except Exception as e:
+            logging.error(f"Error removing {sid} from room of game {self.game_id}: {e}")
+
+    # close method
+    # Removes every session from the game's rooms
+    async def close(self) -> None:
+        for sid in list(self.members):
+            await self.remove(sid)
+        await self.spectators.close()
+        self.outbox.clear()
+        self.trajectory.clear()
+
+    # has_format method
+    # Returns True if a session in the game uses the given wire format
+    def has_format(self, wire_format: str) -> bool:
+        return self._format_counts[wire_format] > 0
+
+    # queue method
+    # Queues a message, it is sent on the next flush
+    def queue(self, event: str, data: dict) -> None:
+        self.outbox.append((event, data))
+
+    # queue_trajectory method
+    # Queues a trajectory event for the events wire format, it is sent on the next flush
+    def queue_trajectory(self, data: dict) -> None:
+        if self._format_counts[WIRE_EVENTS]:
+            self.trajectory.append(data)
+
+    # send method
+    # Queues a message and flushes right away
+    async def send(self, event: str, data: dict, skip_sid=None) -> None:
+        self.queue(event, data)
+        await self.flush(skip_sid)
+
+    # flush method
+    # Sends all queued messages
+    # JSON clients get every message as its own event, one emit per message
+    # for the whole room. Frame clients get all of them in one 'game_frame'.
+    # Binary clients get the state as a 'game_state_bin' snapshot, or a
+    # 'game_frame' with the snapshot in it when the tick produced other messages
+    # Delta clients get 'game_snapshot' (or a 'game_frame' with it) the same way,
+    # one emit per group of clients that share a baseline
+    # Events clients get the trajectory events and every message but the game state
+    # Spectators get their frames from the spectator feed, on every flush
+    async def flush(self, skip_sid=None) -> None:
+        if self.spectators.sids:
+            self.spectators.capture(self.outbox)
+            await self.spectators.release()
+        if not self.outbox and not self.trajectory:
+            return
+        events, self.outbox = self.outbox, []
+        trajectory, self.trajectory = self.trajectory, []
+        if self._format_counts[WIRE_EVENTS]:
+            await self._flush_events(events, trajectory, skip_sid)
+        if not events:
+            return
+        if self._format_counts[WIRE_JSON]:
+            for event, data in events:
+                await sio.emit(event, data, room=self.room(WIRE_JSON), skip_sid=skip_sid)
+        if self._format_counts[WIRE_FRAMES]:
+            frame = {
+                'type': 'game_frame',
+                'gameId': self.game_id,
+                'events': [[event, data] for event, data in events],
+            }
+            await sio.emit('game_frame', frame, room=self.room(WIRE_FRAMES), skip_sid=skip_sid)
+        if self._format_counts[WIRE_BINARY]:
+            await self._flush_binary(events, skip_sid)
+        if self._format_counts[WIRE_DELTA]:
+            await self._flush_delta(events, skip_sid)
+
+    async def _flush_binary(self, events: list, skip_sid) -> None:
+        room = self.room(WIRE_BINARY)
+        if len(events) == 1 and events[0][0] == 'send_game_state':
+            await sio.emit('game_state_bin', pack_snapshot(events[0][1]), room=room, skip_sid=skip_sid)
+            return
+        frame = {
+            'type': 'game_frame',
+            'gameId': self.game_id,
+            'events': [
+                [event, pack_snapshot(data) if event == 'send_game_state' else data]
+                for event, data in events
+            ],
+        }
+        await sio.emit('game_frame', frame, room=room, skip_sid=skip_sid)
+
+    async def _flush_delta(self, events: list, skip_sid) -> None:
+        state = None
+        for event, data in events:
+            if event == 'send_game_state':
+                state = data
+        if state is None:
+            groups = [(None, self.room(WIRE_DELTA))]
+        else:
+            groups = self.snapshots.encode(state['tick'], state)
+        for payload, room in groups:
+            if len(events) == 1 and payload is not None:
+                await sio.emit('game_snapshot', payload, room=room, skip_sid=skip_sid)
+                continue
+            frame = {
+                'type': 'game_frame',
+                'gameId': self.game_id,
+                'events': [
+                    ['game_snapshot', payload] if event == 'send_game_state' else [event, data]
+                    for event, data in events
+                ],
+            }
+            await sio.emit('game_frame', frame, room=room, skip_sid=skip_sid)
+
+    async def _flush_events(self, events: list, trajectory: list, skip_sid) -> None:
+        messages = [('trajectory', data) for data in trajectory]
+        messages.extend((event, data) for event, data in events if event != 'send_game_state')
+        if not messages:
+            return
+        room = self.room(WIRE_EVENTS)
+        if len(messages) == 1:
+            event, data = messages[0]
+            await sio.emit(event, data, room=room, skip_sid=skip_sid)
+            return
+        frame = {
+            'type': 'game_frame',
+            'gameId': self.game_id,
+            'events': [[event, data] for event, data in messages],
+        }
+        await sio.emit('game_frame', frame, room=room, skip_sid=skip_sid)
+
+    # ack method
+    # Records that a delta client received the snapshot of the given tick
+    def ack(self, sid, tick) -> None:
+        self.snapshots.ack(sid, tick)
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+
+# Clustered game server
+# With REDIS_URL set, several game server nodes can run behind the load balancer and share
+# their clients through Redis:
+#   - Socket.IO uses a Redis client manager, any node can emit to any sid and put it in a
+#     room, whichever node the client is connected to
+#   - every game has an ownership lease in Redis, only the node holding it runs the
+#     PongGame loop, it renews the lease while the game runs and releases it at the end
+#   - pending join_game requests are kept in a shared request index, so the two players of
+#     a game are paired even when their sids are connected to different nodes
+#   - the events of a sid whose game runs on another node are forwarded to the owning node
+#     over its own Redis channel
+# Without REDIS_URL the server runs standalone and none of this is used.
+# Tests pass a FakeRedis (see fake_redis.py) instead of a Redis client.
+
+REDIS_URL = os.environ.get('REDIS_URL')
+KEY_PREFIX = 'pong'
+LEASE_TTL = 10.0  # seconds a game lease lasts without being renewed
+LEASE_RENEW_INTERVAL = 3.0
+REQUEST_TTL = 10  # seconds a join_game request waits in the shared index for its partner
+
+# Lease scripts, run by Redis in one step so the lease can not change owner between the
+# check and the update: KEYS[1] is the lease, ARGV[1] the node ID
+# RENEW_LEASE_SCRIPT extends the lease by ARGV[2] milliseconds, returns 1 if it did
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+# RELEASE_LEASE_SCRIPT deletes the lease, returns 1 if it did
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+# client_manager function
+# Returns the Socket.IO client manager of a clustered server, None when running standalone
+def client_manager(url: str = REDIS_URL):
+    if not url:
+        return None
+    import socketio
+    return socketio.AsyncRedisManager(url, channel=f'{KEY_PREFIX}:socketio')
+
+
+# Cluster class
+# Game ownership leases, the shared join request index and event forwarding between nodes
+# Properties:
+#   - redis: an asyncio Redis client, or a FakeRedis
+#   - node_id: unique ID of this node, the value of its leases and the name of its channel
+#   - leases: IDs of the games this node holds the lease of
+class Cluster:
+    def __init__(self, redis, node_id: str = None):
+        self.redis = redis
+        self.node_id: str = node_id or uuid.uuid4().hex
+        self.leases: set = set()
+
+    # from_url method
+    # Creates the cluster of the Redis server at the given URL
+    @classmethod
+    def from_url(cls, url: str = REDIS_URL) -> 'Cluster':
+        from redis import asyncio as aioredis
+        return cls(aioredis.Redis.from_url(url, decode_responses=True))
+
+    @staticmethod
+    def lease_key(game_id) -> str:
+        return f'{KEY_PREFIX}:game:{game_id}:owner'
+
+    @staticmethod
+    def request_key(game_id, player1_id, player2_id) -> str:
+        return f'{KEY_PREFIX}:join:{game_id}:{player1_id}:{player2_id}'
+
+    @staticmethod
+    def channel(node_id: str) -> str:
+        return f'{KEY_PREFIX}:node:{node_id}'
+
+    # acquire_lease method
+    # Takes the ownership lease of a game, returns False if another node holds it
+    async def acquire_lease(self, game_id) -> bool:
+        acquired = await self.redis.set(self.lease_key(game_id), self.node_id,
+                                        nx=True, px=int(LEASE_TTL * 1000))
+        if acquired:
+            self.leases.add(game_id)
+        return bool(acquired)
+
+    # renew_leases method
+    # Extends the leases of this node's games, drops the ones that were lost to another node
+    # Returns the IDs of the games whose lease was lost
+    async def renew_leases(self) -> list:
+        lost = []
+        for game_id in list(self.leases):
+            renewed = await self.redis.eval(RENEW_LEASE_SCRIPT, 1, self.lease_key(game_id),
+                                            self.node_id, int(LEASE_TTL * 1000))
+            if not renewed:
+                self.leases.discard(game_id)
+                lost.append(game_id)
+        return lost
+
+    # release_lease method
+    # Gives up the lease of a game, if this node still holds it
+    async def release_lease(self, game_id) -> None:
+        self.leases.discard(game_id)
+        await self.redis.eval(RELEASE_LEASE_SCRIPT, 1, self.lease_key(game_id), self.node_id)
+
+    # owner method
+    # Returns the ID of the node that runs a game, None if no node does
+    async def owner(self, game_id):
+        return await self.redis.get(self.lease_key(game_id))
+
+    # pair_request method
+    # Pairs a join_game request with the request of the other player of the game
+    # If the other player's request is in the shared index it is taken out and returned,
+    # as a dict with its 'sid', 'node', 'player_id' and 'wire_format'
+    # Otherwise this request is added to the index for the other player and None is returned
+    # A request of the same player, from another session or node, is replaced by this one
+    async def pair_request(self, game_id, player1_id, player2_id, sid, player_id, wire_format: str):
+        key = self.request_key(game_id, player1_id, player2_id)
+        request = json.dumps({'sid': sid, 'node': self.node_id, 'player_id': player_id,
+                              'wire_format': wire_format})
+        while True:
+            partner = await self.redis.getdel(key)
+            if partner is not None:
+                partner = json.loads(partner)
+                if partner['sid'] != sid and partner.get('player_id') != player_id:
+                    return partner
+            if await self.redis.set(key, request, nx=True, ex=REQUEST_TTL):
+                return None
+
+    # cancel_request method
+    # Takes a session's join_game request out of the shared index, if it is still waiting there
+    async def cancel_request(self, game_id, player1_id, player2_id, sid) -> None:
+        key = self.request_key(game_id, player1_id, player2_id)
+        request = await self.redis.get(key)
+        if request is not None and json.loads(request)['sid'] == sid:
+            await self.redis.delete(key)
+
+    # forward method
+    # Sends a client event to the node that runs the client's game
+    async def forward(self, node_id: str, event: str, sid, data=None) -> None:
+        message = {'event': event, 'sid': sid, 'data': data, 'node': self.node_id}
+        await self.redis.publish(self.channel(node_id), json.dumps(message))
+
+    # listen method
+    # Receives the events forwarded to this node, calls handler(event, sid, data, node) for each
+    async def listen(self, handler) -> None:
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self.channel(self.node_id))
+        async for message in pubsub.listen():
+            if message.get('type') != 'message':
+                continue
+            try:
+                forwarded = json.loads(message['data'])
+                await handler(forwarded['event'], forwarded['sid'], forwarded.get('data'), forwarded['node'])
+            except Exception as e:
+                logging.error(f"Failed to handle a forwarded event: {e}")
+
+    # keep_leases method
+    # Renews the leases every LEASE_RENEW_INTERVAL seconds, calls on_lost(game_id) for lost ones
+    async def keep_leases(self, on_lost) -> None:
+        while True:
+            await asyncio.sleep(LEASE_RENEW_INTERVAL)
+            try:
+                for game_id in await self.renew_leases():
+                    await on_lost(game_id)
+            except Exception as e:
+                logging.error(f"Failed to renew game leases: {e}")
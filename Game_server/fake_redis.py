@@ -0,0 +1,114 @@
+import asyncio
+import time
+from cluster import RENEW_LEASE_SCRIPT, RELEASE_LEASE_SCRIPT
+
+# Fake Redis
+# In-process stand-in for the asyncio Redis client, with the commands the cluster uses
+# (see cluster.py): strings with expiry, GETDEL, PEXPIRE, the cluster's lease scripts and
+# pub/sub.
+# Several Cluster instances sharing one FakeRedis behave like nodes sharing a Redis server,
+# so tests can run a cluster without one.
+
+
+# FakePubSub class
+# Subscription of one client, messages are delivered through an asyncio queue
+class FakePubSub:
+    def __init__(self, redis):
+        self.redis = redis
+        self.channels: set = set()
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def subscribe(self, *channels) -> None:
+        for channel in channels:
+            self.channels.add(channel)
+            self.redis.subscribers.setdefault(channel, []).append(self)
+            await self.queue.put({'type': 'subscribe', 'channel': channel, 'data': len(self.channels)})
+
+    async def unsubscribe(self, *channels) -> None:
+        for channel in channels or list(self.channels):
+            self.channels.discard(channel)
+            if self in self.redis.subscribers.get(channel, []):
+                self.redis.subscribers[channel].remove(self)
+
+    async def listen(self):
+        while True:
+            yield await self.queue.get()
+
+
+# FakeRedis class
+# Properties:
+#   - data: key -> (value, expiry time or None)
+#   - subscribers: channel -> subscriptions
+class FakeRedis:
+    def __init__(self, clock=time.monotonic):
+        self.data: dict = {}
+        self.subscribers: dict = {}
+        self._clock = clock
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= self._clock():
+            del self.data[key]
+            return None
+        return value
+
+    def _expiry(self, ex=None, px=None):
+        if ex is not None:
+            return self._clock() + ex
+        if px is not None:
+            return self._clock() + px / 1000
+        return None
+
+    async def get(self, key):
+        return self._live(key)
+
+    async def set(self, key, value, nx=False, xx=False, ex=None, px=None):
+        exists = self._live(key) is not None
+        if (nx and exists) or (xx and not exists):
+            return None
+        self.data[key] = (value, self._expiry(ex, px))
+        return True
+
+    async def getdel(self, key):
+        value = self._live(key)
+        self.data.pop(key, None)
+        return value
+
+    async def delete(self, *keys) -> int:
+        deleted = 0
+        for key in keys:
+            if self._live(key) is not None:
+                del self.data[key]
+                deleted += 1
+        return deleted
+
+    async def pexpire(self, key, milliseconds) -> bool:
+        value = self._live(key)
+        if value is None:
+            return False
+        self.data[key] = (value, self._expiry(px=milliseconds))
+        return True
+
+    # eval method
+    # Runs one of the cluster's Lua scripts, in one step like Redis does
+    async def eval(self, script, numkeys, *keys_and_args):
+        keys, args = keys_and_args[:numkeys], keys_and_args[numkeys:]
+        if self._live(keys[0]) != args[0]:
+            return 0
+        if script == RENEW_LEASE_SCRIPT:
+            return int(await self.pexpire(keys[0], int(args[1])))
+        if script == RELEASE_LEASE_SCRIPT:
+            return await self.delete(keys[0])
+        raise NotImplementedError('FakeRedis only runs the cluster\'s scripts')
+
+    async def publish(self, channel, message) -> int:
+        subscriptions = self.subscribers.get(channel, [])
+        for subscription in subscriptions:
+            await subscription.queue.put({'type': 'message', 'channel': channel, 'data': message})
+        return len(subscriptions)
+
+    def pubsub(self) -> FakePubSub:
+        return FakePubSub(self)
@@ -0,0 +1,281 @@
+import logging
+from game_logic.game_defaults import *
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only the batch engine needs it
+    np = None
+
+# Names of the per-game buffers, every one is a float64 array of the engine's capacity
+BUFFERS = ('x', 'z', 'speed', 'direction', 'dx', 'dz', 'step', 'p1_z', 'p2_z')
+
+
+# BatchPhysicsEngine class
+# Vectorized alternative to GameState.advance_ball + check_goal
+# Games in a rally submit themselves during their step(), and once every game of the
+# tick has been stepped, run() advances all submitted balls with one NumPy step:
+# swept movement, wall bounce, paddle collision, paddle bounce angle and goal detection.
+# The results are the same as the object engine's (up to float rounding of cos/sin).
+# During a rally the engine owns the ball: its state is loaded into the struct-of-arrays
+# buffers (one array per field) on the game's first tick of the rally and stays there.
+# Every tick only the paddles' z are read from the entities' positions and only the ball's
+# x and z are written back to its position; the rest of the ball (speed, direction,
+# deltas), the hits and the score are written back on the ticks where the ball bounced or
+# went through a goal. The slots of games that stop submitting (their rally ended, the game
+# was cancelled) are given up on the next tick, the slots stay dense.
+# Properties:
+#   - capacity: number of games the buffers can hold
+#   - pending: number of games submitted for the current tick
+class BatchPhysicsEngine:
+    def __init__(self, capacity: int = 256):
+        if np is None:
+            raise ImportError("The batch physics engine needs numpy")
+        self.capacity: int = 0
+        self.pending: int = 0
+        self._slots: dict = {}       # game -> slot, slots are 0..len - 1
+        self._games: list = []       # by slot: the game
+        self._balls: list = []       # by slot: the Position of the game's ball
+        self._paddles1: list = []    # by slot: the Positions of the game's paddles
+        self._paddles2: list = []
+        self._submitted: list = []   # by slot: tick the game last submitted
+        self._tick: int = 0
+        self._bounced: list = []     # games whose bounce flag was set in the last run
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int) -> None:
+        for name in BUFFERS:
+            buffer = np.zeros(capacity, dtype=np.float64)
+            if self.capacity:
+                buffer[:self.capacity] = getattr(self, name)
+            setattr(self, name, buffer)
+        self.capacity = capacity
+
+    # submit method
+    # Queues a game for this tick's physics step, its ball is loaded into the buffers
+    # on the first tick of its rally
+    # step: fraction of a BASE_TICK_RATE tick the ball moves, see Ball.update_position
+    def submit(self, game, step: float = 1.0) -> None:
+        slot = self._slots.get(game)
+        if slot is None:
+            slot = self._load(game, step)
+        self._submitted[slot] = self._tick
+        self.pending += 1
+
+    def _load(self, game, step: float) -> int:
+        slot = len(self._games)
+        if slot == self.capacity:
+            self._allocate(self.capacity * 2)
+        game_state = game.game_state
+        ball = game_state.ball
+        self.x[slot] = ball.x
+        self.z[slot] = ball.z
+        self.speed[slot] = ball.speed
+        self.direction[slot] = ball.direction
+        self.dx[slot] = ball.delta_x
+        self.dz[slot] = ball.delta_z
+        self.step[slot] = step
+        self._slots[game] = slot
+        self._games.append(game)
+        self._balls.append(ball.position)
+        self._paddles1.append(game_state.player1.paddle.position)
+        self._paddles2.append(game_state.player2.paddle.position)
+        self._submitted.append(self._tick)
+        return slot
+
+    # _release method
+    # Gives up the slots of the games that did not submit this tick, the last slots are
+    # moved into the freed ones
+    def _release(self) -> None:
+        lists = (self._games, self._balls, self._paddles1, self._paddles2, self._submitted)
+        slot = 0
+        while slot < len(self._games):
+            if self._submitted[slot] == self._tick:
+                slot += 1
+                continue
+            del self._slots[self._games[slot]]
+            last = len(self._games) - 1
+            if slot != last:
+                self._slots[self._games[last]] = slot
+                for values in lists:
+                    values[slot] = values[last]
+                for name in BUFFERS:
+                    buffer = getattr(self, name)
+                    buffer[slot] = buffer[last]
+            for values in lists:
+                values.pop()
+
+    # run method
+    # Advances every submitted game by one tick, then calls physics_done() on each game
+    # Meant to be registered as a tick hook of the TickScheduler
+    def run(self) -> None:
+        if not self.pending:
+            return  # no game stepped in this tick of the scheduler
+        if self.pending != len(self._games):
+            self._release()
+        self.pending = 0
+        self._tick += 1
+        games = self._games
+        n = len(games)
+        self.p1_z[:n] = [position.z for position in self._paddles1]
+        self.p2_z[:n] = [position.z for position in self._paddles2]
+        for game_state in self._bounced:
+            game_state.bounce = False
+        self._bounced = []
+        try:
+            hits_1, hits_2, hitpos, goals, changed = self._step(n)
+        except Exception:
+            logging.exception("Batch physics step failed")
+            for game in list(games):
+                game.fail(RuntimeError("Batch physics step failed"))
+            self._tick += 1
+            self._release()  # none of them submitted this tick
+            return
+        x, z = self.x[:n].tolist(), self.z[:n].tolist()
+        for position, ball_x, ball_z in zip(self._balls, x, z):
+            position.x = ball_x
+            position.z = ball_z
+        goal = [False] * n
+        for i in np.flatnonzero(changed).tolist():
+            game_state = games[i].game_state
+            game_state.ball.set_state(x[i], z[i], float(self.speed[i]), float(self.direction[i]),
+                                      float(self.dx[i]), float(self.dz[i]))
+            if hits_1[i] or hits_2[i]:
+                game_state.player1.hits += int(hits_1[i])
+                game_state.player2.hits += int(hits_2[i])
+                game_state.hitpos = float(hitpos[i])
+                game_state.bounce = True
+                self._bounced.append(game_state)
+            if goals[i] == 1:
+                game_state.update_player_score(game_state.player1.id)
+            elif goals[i] == 2:
+                game_state.update_player_score(game_state.player2.id)
+            goal[i] = goals[i] != 0
+        for game, scored in zip(list(games), goal):
+            game.physics_done(scored)
+
+    # _step method
+    # The vectorized physics step of the first n games
+    # Returns (player 1 hits, player 2 hits, absolute hit positions, goals, changed)
+    # goals is 0 for no goal, 1 if player 1 scored and 2 if player 2 scored
+    # changed is True for the games whose ball bounced or went through a goal
+    def _step(self, n: int) -> tuple:
+        x, z = self.x[:n], self.z[:n]
+        direction = self.direction[:n]
+        dx, dz = self.dx[:n], self.dz[:n]
+        p1_z, p2_z = self.p1_z[:n], self.p2_z[:n]
+        remaining = self.step[:n].copy()
+        hits_1 = np.zeros(n, dtype=np.int64)
+        hits_2 = np.zeros(n, dtype=np.int64)
+        hitpos = np.zeros(n)
+        face_1 = PLAYER1_START_X + PADDLE_DEPTH / 2 + BALL_RADIUS
+        face_2 = PLAYER2_START_X - PADDLE_DEPTH / 2 - BALL_RADIUS
+        moving = np.ones(n, dtype=bool)
+        changed = np.zeros(n, dtype=bool)
+
+        # GameState.advance_ball, every round moves the balls to their next impact
+        for _ in range(MAX_IMPACTS_PER_STEP):
+            impact, wall, paddle_1, paddle_2 = self._next_impact(x, z, dx, dz, remaining, p1_z, p2_z, face_1, face_2)
+            impact = np.where(moving, impact, 0.0)
+            x += dx * impact
+            z += dz * impact
+            remaining -= impact
+            wall &= moving
+            paddle_1 &= moving
+            paddle_2 &= moving
+
+            # Ball.bounce_from_wall
+            if wall.any():
+                direction[wall] = np.mod(360 - direction[wall], 360)
+                self._set_deltas(wall, n)
+
+            hits = paddle_1 | paddle_2
+            if hits.any():
+                hits_1 += paddle_1
+                hits_2 += paddle_2
+                paddle_z = np.where(paddle_1, p1_z, p2_z)
+                hitpos[hits] = self._bounce_from_paddle(hits, paddle_z[hits], n)
+
+            moving = wall | hits
+            changed |= moving
+            if not moving.any():
+                break
+
+        # GameState.check_goal
+        goals = np.where(x < 0, 2, np.where(x > FIELD_DEPTH, 1, 0))
+        return hits_1, hits_2, hitpos, goals, changed | (goals != 0)
+
+    # _next_impact method
+    # Ball.next_impact for all games
+    # Returns (time of impact, wall mask, player 1 paddle mask, player 2 paddle mask)
+    @staticmethod
+    def _next_impact(x, z, dx, dz, step, p1_z, p2_z, face_1, face_2) -> tuple:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            wall_low = (dz < 0) & (z + dz * step < BALL_RADIUS)
+            wall_high = (dz > 0) & (z + dz * step > FIELD_WIDTH - BALL_RADIUS)
+            wall_time = np.where(wall_low, (BALL_RADIUS - z) / dz, (FIELD_WIDTH - BALL_RADIUS - z) / dz)
+            wall = wall_low | wall_high
+            impact = np.where(wall, np.maximum(0.0, wall_time), step)
+
+            left = dx < 0
+            face = np.where(left, face_1, face_2)
+            paddle_z = np.where(left, p1_z, p2_z)
+            crossing = np.where(left, (x >= face) & (x + dx * impact < face),
+                                (dx > 0) & (x <= face) & (x + dx * impact > face))
+            time = (face - x) / dx
+            hit_z = z + dz * time
+            paddle = crossing & (np.abs(hit_z - paddle_z) <= PADDLE_WIDTH / 2)
+        impact = np.where(paddle, time, impact)
+        return impact, wall & ~paddle, paddle & left, paddle & ~left
+
+    # _set_deltas method
+    # Ball.set_deltas for the masked games
+    def _set_deltas(self, mask, n: int) -> None:
+        radians = np.radians(self.direction[:n][mask])
+        self.dx[:n][mask] = np.cos(radians) * self.speed[:n][mask]
+        self.dz[:n][mask] = np.sin(radians) * self.speed[:n][mask]
+
+    # _bounce_from_paddle method
+    # Ball.bounce_from_paddle for the masked games, one branch-free pass over all of them
+    # Returns the absolute hit positions of the masked games
+    def _bounce_from_paddle(self, mask, paddle_z, n: int):
+        direction_all, speed_all = self.direction[:n], self.speed[:n]
+        z = self.z[:n][mask]
+
+        direction = np.mod(direction_all[mask], 360)
+        direction_all[mask] = direction
+        self._set_deltas(mask, n)
+        speed = speed_all[mask]
+        hitpos = (z - paddle_z) / (PADDLE_WIDTH / 2)
+        speedboost = np.abs(hitpos) * 1.2
+        dz_factor = (self.dz[:n][mask] / speed) * 10
+        direction_mod = np.abs(np.mod(direction, 180) - 90)
+        direction_mod = np.where(direction_mod > MAX_BOUNCE_ANGLE_ADJUSTMENT,
+                                 MAX_BOUNCE_ANGLE_ADJUSTMENT * 2 - direction_mod, direction_mod)
+        adjustment = np.abs(MAX_BOUNCE_ANGLE_ADJUSTMENT - direction_mod) + 5 * np.abs(hitpos) + dz_factor
+        adjustment = np.minimum(adjustment, MAX_BOUNCE_ANGLE_ADJUSTMENT)
+
+        center = ((hitpos >= 0) & (hitpos < 0.2)) | ((hitpos < 0) & (hitpos > -.2))
+        boost = np.where(center & (np.abs(hitpos) < 0.1), 1.3, speedboost)
+        speed_all[mask] = speed + boost
+        self._set_deltas(mask, n)
+        going_down = self.dz[:n][mask] < 0.0
+        going_left = self.dx[:n][mask] < 0.0
+        top = hitpos > 0.0
+
+        center_direction = np.where(
+            going_down,
+            np.where(going_left, 357 - hitpos * adjustment, 177 - hitpos * adjustment),
+            np.where(going_left, 3 + hitpos * adjustment, 183 + hitpos * adjustment),
+        )
+        edge_direction = np.where(
+            going_down,
+            np.where(direction > 270,
+                     np.where(top, 170 - adjustment * 0.5, 190 + adjustment),
+                     np.where(top, 10 + adjustment * 0.5, 350 - adjustment)),
+            np.where(direction > 90,
+                     np.where(top, 10 + adjustment, 350 - adjustment * 0.5),
+                     np.where(top, 170 - adjustment, 190 + adjustment * 0.5)),
+        )
+        direction_all[mask] = np.mod(np.where(center, center_direction, edge_direction), 360)
+        self._set_deltas(mask, n)
+        return np.abs(hitpos)
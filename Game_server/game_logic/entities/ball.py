@@ -3,7 +3,8 @@ from game_logic.entities.position import Position
 from game_logic.game_defaults import *
 from game_logic.entities.paddle import Paddle
 from game_logic.game_defaults import *
-import logging
+
+WALL = 'wall'  # what next_impact returns when the ball hits a wall
 
 # Ball class
 # Represents a ball in the game
@@ -12,7 +13,10 @@ import logging
 #   - radius: the radius of the ball
 #   - speed: the speed of the ball
 #   - direction: the direction of the ball
+# The per-tick methods work on the slots directly, the properties are for everyone else
 class Ball:
+    __slots__ = ('_position', '_delta_x', '_delta_z', '_radius', '_speed', '_direction')
+
     def __init__(self, x: float, z: float, radius: float, speed: float, direction: float):
         self._position: Position = Position(x, 0, z)
         self._delta_x: float = 0
@@ -99,9 +103,9 @@ class Ball:
     # set_deltas method
     # calculates the x and z deltas based on the speed and direction of the ball
     def set_deltas(self) -> None:
-        radians: float = math.radians(self.direction)
-        self._delta_x = math.cos(radians) * self.speed
-        self._delta_z = math.sin(radians) * self.speed
+        radians: float = math.radians(self._direction)
+        self._delta_x = math.cos(radians) * self._speed
+        self._delta_z = math.sin(radians) * self._speed
     
     @property
     def delta_x(self) -> float:
@@ -111,6 +115,18 @@ class Ball:
     def delta_z(self) -> float:
         return self._delta_z
     
+    # set_state method
+    # sets position, speed, direction and deltas at once, without recalculating the deltas
+    # used by the batch physics engine to write its results back
+    def set_state(self, x: float, z: float, speed: float, direction: float,
+                  delta_x: float, delta_z: float) -> None:
+        self._position.x = x
+        self._position.z = z
+        self._speed = speed
+        self._direction = direction
+        self._delta_x = delta_x
+        self._delta_z = delta_z
+
     # speed_up method
     # increases the speed of the ball by the given increment
     def speed_up(self, increment: float) -> None:
@@ -118,35 +134,73 @@ class Ball:
 
     # update_position method
     # updates the position of the ball based on its speed and direction
-    def update_position(self) -> None:
-        self._position.x += self.delta_x
-        self._position.z += self.delta_z
+    # step: fraction of a BASE_TICK_RATE tick to move, 1.0 at the base rate
+    def update_position(self, step: float = 1.0) -> None:
+        position = self._position
+        position.x += self._delta_x * step
+        position.z += self._delta_z * step
     
+    # next_impact method
+    # swept collision check along the ball's path for the next `step`
+    # computes the time of impact with the walls and the faces of the paddles,
+    # paddle1 is the left paddle, paddle2 the right one
+    # a paddle is only hit if the ball crosses its face moving towards it, within the paddle's width
+    # returns (time of impact, WALL / the paddle hit), or (step, None) if nothing is hit
+    # the time is in the same unit as step, see update_position
+    def next_impact(self, step: float, paddle1, paddle2) -> tuple:
+        x, z = self._position.x, self._position.z
+        delta_x, delta_z = self._delta_x, self._delta_z
+        impact, target = step, None
+
+        # walls, the ball touches them when its center is BALL_RADIUS away
+        if delta_z < 0 and z + delta_z * step < BALL_RADIUS:
+            impact, target = max(0.0, (BALL_RADIUS - z) / delta_z), WALL
+        elif delta_z > 0 and z + delta_z * step > FIELD_WIDTH - BALL_RADIUS:
+            impact, target = max(0.0, (FIELD_WIDTH - BALL_RADIUS - z) / delta_z), WALL
+
+        # paddle faces, the ball can only hit the one it moves towards
+        if delta_x < 0:
+            paddle = paddle1
+            face = paddle.position.x + paddle.depth / 2 + BALL_RADIUS
+            crossing = x >= face and x + delta_x * impact < face
+        else:
+            paddle = paddle2
+            face = paddle.position.x - paddle.depth / 2 - BALL_RADIUS
+            crossing = delta_x > 0 and x <= face and x + delta_x * impact > face
+        if crossing:
+            time = (face - x) / delta_x
+            hit_z = z + delta_z * time
+            if abs(hit_z - paddle.position.z) <= paddle.width / 2:
+                impact, target = time, paddle
+        return impact, target
+
     # check_collision method
     # collision check algorithm with paddle
     # returns false if no collision, true if collision
     # takes a paddle as argument
     # returns false immediately if ball is not in same x coordinates as paddles
-    def check_collision(self, paddle):
+    # step: fraction of a BASE_TICK_RATE tick the ball moves next, see update_position
+    def check_collision(self, paddle, step: float = 1.0):
         # Calculate the ball's next position
-        expected_x = self.position.x + self.delta_x
-        expected_z = self.position.z + self.delta_z
+        expected_x = self._position.x + self._delta_x * step
+        expected_z = self._position.z + self._delta_z * step
+        paddle_position = paddle.position
 
         # Check collision for the left paddle (positioned at x = 0)
-        if paddle.x == PLAYER1_START_X and expected_x - BALL_RADIUS <= 0:
+        if paddle_position.x == PLAYER1_START_X and expected_x - BALL_RADIUS <= 0:
             # Calculate the paddle's boundaries along the z-axis
-            paddle_z_bottom = paddle.z - PADDLE_WIDTH / 2
-            paddle_z_top = paddle.z + PADDLE_WIDTH / 2
+            paddle_z_bottom = paddle_position.z - PADDLE_WIDTH / 2
+            paddle_z_top = paddle_position.z + PADDLE_WIDTH / 2
 
             # Check if the ball's z position is within the paddle's z-axis range
             if paddle_z_bottom <= expected_z <= paddle_z_top:
                 return True  # Collision detected
 
         # Check collision for the right paddle (positioned at x = FIELD_DEPTH)
-        elif paddle.x == PLAYER2_START_X and expected_x + BALL_RADIUS >= FIELD_DEPTH:
+        elif paddle_position.x == PLAYER2_START_X and expected_x + BALL_RADIUS >= FIELD_DEPTH:
             # Calculate the paddle's boundaries along the z-axis
-            paddle_z_bottom = paddle.z - PADDLE_WIDTH / 2
-            paddle_z_top = paddle.z + PADDLE_WIDTH / 2
+            paddle_z_bottom = paddle_position.z - PADDLE_WIDTH / 2
+            paddle_z_top = paddle_position.z + PADDLE_WIDTH / 2
 
             # Check if the ball's z position is within the paddle's z-axis range
             if paddle_z_bottom <= expected_z <= paddle_z_top:
@@ -181,7 +235,6 @@ class Ball:
                 self.speed_up(1.3)
             else:
                 self.speed_up(speedboost)
-            logging.info(hitpos)
             if self.delta_z < 0.0:
                 self.direction = 357 - (hitpos * adjustment) if self.delta_x < 0.0 else 177 - (hitpos * adjustment)
             else:
@@ -218,6 +271,7 @@ class Ball:
     # bounce_from_wall method
     # reflects the direction of the ball when it bounces from a wall
     def bounce_from_wall(self) -> None:
-        self.direction = (360 - self.direction) % 360
+        self._direction = (360 - self._direction) % 360
+        self.set_deltas()
         # reflects the direction when ball bounces from wall
 
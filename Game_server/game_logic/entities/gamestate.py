@@ -1,5 +1,5 @@
 from game_logic.entities.player import Player
-from game_logic.entities.ball import Ball
+from game_logic.entities.ball import Ball, WALL
 from game_logic.game_defaults import *
 import random
 import time
@@ -17,8 +17,14 @@ import logging
 #   - current_rally: length of current rally so far
 #   - longest_rally: length of the longest rally in the game
 #   - paused: whether the game is paused or not
+#   - rng: the game's own random number generator, seeded with the seed given at creation,
+#     games created without a seed share the random module's (a generator is ~2.5 KB)
+# handle_collisions and check_goal run on every tick and work on the slots directly
 class GameState:
-    def __init__(self, game_id: int, player1: Player, player2: Player, ball: Ball):
+    __slots__ = ('_game_id', '_player1', '_player2', '_ball', '_time_remaining', '_current_rally',
+                 '_longest_rally', '_paused', '_in_progress', '_bounce', '_hitpos', '_rng')
+
+    def __init__(self, game_id: int, player1: Player, player2: Player, ball: Ball, seed=None):
         self._game_id: int = game_id
         self._player1: Player = player1
         self._player2: Player = player2
@@ -30,6 +36,7 @@ class GameState:
         self._in_progress: bool = True
         self._bounce: bool = False
         self._hitpos: float = 0.0
+        self._rng = random.Random(seed) if seed is not None else random
     
     # getter for game_id
     @property
@@ -51,6 +58,11 @@ class GameState:
     def ball(self):
         return self._ball
     
+    # getter for rng
+    @property
+    def rng(self):
+        return self._rng
+
     # getter for time_remaining
     @property
     def time_remaining(self):
@@ -154,47 +166,77 @@ class GameState:
     # handle_collisions method
     # handles the collisions between the ball and the walls or paddles
     # and updates the ball's direction and player's hitcount accordingly
-    def handle_collisions(self) -> None:
-        self.bounce = False
-        if self.ball.x < 0 or self.ball.x > FIELD_DEPTH:
+    # step: fraction of a BASE_TICK_RATE tick the ball moves per tick
+    def handle_collisions(self, step: float = 1.0) -> None:
+        self._bounce = False
+        ball = self._ball
+        position = ball.position
+        if position.x < 0 or position.x > FIELD_DEPTH:
             return
-        if self.ball.z - BALL_RADIUS <= 0 or self.ball.z + BALL_RADIUS >= FIELD_WIDTH:
-            self.ball.bounce_from_wall()
-        elif self.ball.check_collision(self.player1.paddle):
-            self.player1.add_hit()
-            self.bounce = True
-            self.hitpos = self.ball.bounce_from_paddle(self.player1.paddle)
-        elif self.ball.check_collision(self.player2.paddle):
-            self.player2.add_hit()
-            self.bounce = True
-            self.hitpos = self.ball.bounce_from_paddle(self.player2.paddle)
+        if position.z - BALL_RADIUS <= 0 or position.z + BALL_RADIUS >= FIELD_WIDTH:
+            ball.bounce_from_wall()
+        elif ball.check_collision(self._player1.paddle, step):
+            self._player1.add_hit()
+            self._bounce = True
+            self._hitpos = ball.bounce_from_paddle(self._player1.paddle)
+        elif ball.check_collision(self._player2.paddle, step):
+            self._player2.add_hit()
+            self._bounce = True
+            self._hitpos = ball.bounce_from_paddle(self._player2.paddle)
             
+    # advance_ball method
+    # moves the ball by one step with swept collision detection, see Ball.next_impact
+    # the ball bounces at the point of impact and moves on for the rest of the step,
+    # so a fast ball can not go through a paddle or a wall between two ticks
+    # up to MAX_IMPACTS_PER_STEP bounces are resolved within one step
+    # step: fraction of a BASE_TICK_RATE tick the ball moves
+    def advance_ball(self, step: float = 1.0) -> None:
+        self._bounce = False
+        ball = self._ball
+        paddle1, paddle2 = self._player1.paddle, self._player2.paddle
+        remaining = step
+        for _ in range(MAX_IMPACTS_PER_STEP):
+            time, target = ball.next_impact(remaining, paddle1, paddle2)
+            ball.update_position(time)
+            remaining -= time
+            if target is None:
+                return
+            if target is WALL:
+                ball.bounce_from_wall()
+                continue
+            player = self._player1 if target is paddle1 else self._player2
+            player.add_hit()
+            self._bounce = True
+            self._hitpos = ball.bounce_from_paddle(target)
+
     # check_goal method
     # checks if the ball has scored a goal
     # and updates the score of the appropriate player
     # returns True if a goal was scored, False otherwise
     def check_goal(self) -> None:
-        if self.ball.x < 0:
-            self.update_player_score(self.player2.id)
+        x = self._ball.position.x
+        if x < 0:
+            self.update_player_score(self._player2.id)
             return True
-        elif self.ball.x > FIELD_DEPTH:
-            self.update_player_score(self.player1.id)
+        elif x > FIELD_DEPTH:
+            self.update_player_score(self._player1.id)
             return True
         return False
 
     # reset_ball method
     # resets the ball to the center of the field
-    # and gives it a random direction
+    # and gives it a random direction, from the game's own rng
     def reset_ball(self):
+        rng = self._rng
         if self.ball.x < 0:
-            self.ball.direction = random.randrange(-40, 40) #random direction towards player 2 
+            self.ball.direction = rng.randrange(-40, 40) #random direction towards player 2 
         elif self.ball.x > FIELD_DEPTH:
-            self.ball.direction = random.randrange(140, 220)  #random direction towards player 1
+            self.ball.direction = rng.randrange(140, 220)  #random direction towards player 1
         else:
-            if random.random() >= .5:
-                self.ball.direction = random.randrange(-12, 12)
+            if rng.random() >= .5:
+                self.ball.direction = rng.randrange(-12, 12)
             else:
-                self.ball.direction = random.randrange(168, 192)
+                self.ball.direction = rng.randrange(168, 192)
         self.ball.speed = BALL_SPEED
         self.ball.position = BALL_DEFAULT_X, 0, BALL_DEFAULT_Z
 
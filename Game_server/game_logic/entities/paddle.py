@@ -7,11 +7,15 @@ from game_logic.game_defaults import *
 #    - position: the position of the paddle
 #    - width: the width of the paddle (read only)
 #    - depth: the depth of the paddle (read only)
+#    - direction: the direction the paddle is held in, -1 (down), 0 or 1 (up)
 class Paddle:
+    __slots__ = ('_position', '_width', '_depth', '_direction')
+
     def __init__(self, x_position: float):
         self._position: Position = Position(x_position, 0, PLAYER_START_Z)
         self._width: float = PADDLE_WIDTH
         self._depth: float = PADDLE_DEPTH
+        self._direction: int = 0
     
     # getter for position
     @property
@@ -43,16 +47,38 @@ class Paddle:
     def depth(self) -> float:
         return self._depth
 
+    # getter for direction
+    @property
+    def direction(self) -> int:
+        return self._direction
+
+    # setter for direction
+    # anything other than -1, 0 or 1 is clamped to that range
+    @direction.setter
+    def direction(self, value: int) -> None:
+        self._direction = max(-1, min(1, int(value)))
+
+    # move_held method
+    # moves the paddle PADDLE_SPEED in its held direction
+    # step: fraction of a BASE_TICK_RATE tick to move, 1.0 at the base rate
+    # returns True if the paddle was moving
+    def move_held(self, step: float = 1.0) -> bool:
+        if self._direction == 0:
+            return False
+        self.move(self._direction * PADDLE_SPEED * step, step)
+        return True
+
     # move method
-    # moves the paddle by the given delta z
-    def move(self, delta_z: float) -> None:
-        ## TODO: make sure paddle doesn't move out of bounds
-        if abs(delta_z) > PADDLE_SPEED:
-            delta_z = PADDLE_SPEED
-        paddle_top = self.position.z + (PADDLE_WIDTH / 2)
-        paddle_bottom = self.position.z - (PADDLE_WIDTH / 2)
+    # moves the paddle by the given delta z, at most PADDLE_SPEED per base tick either way
+    # step: fraction of a BASE_TICK_RATE tick the move is for, 1.0 at the base rate
+    def move(self, delta_z: float, step: float = 1.0) -> None:
+        cap = PADDLE_SPEED * step
+        delta_z = max(-cap, min(cap, delta_z))
+        position = self._position
+        paddle_top = position.z + (PADDLE_WIDTH / 2)
+        paddle_bottom = position.z - (PADDLE_WIDTH / 2)
         if paddle_top + delta_z > FIELD_WIDTH:
             delta_z = FIELD_WIDTH - paddle_top
         elif paddle_bottom + delta_z < 0:
             delta_z = -paddle_bottom
-        self.position.move(0, 0, delta_z)
+        position.z += delta_z
@@ -7,6 +7,8 @@ from game_logic.entities.paddle import Paddle
 #   - paddle: the paddle of the player
 #   - score: the score of the player
 class Player:
+    __slots__ = ('_id', '_paddle', '_score', '_hits')
+
     def __init__(self, id: int, x_position: float):
         self._id: int = id
         self._paddle: Paddle = Paddle(x_position)
@@ -50,8 +52,9 @@ class Player:
     
     # move_paddle method
     # moves the player's paddle by the given delta z
-    def move_paddle(self, delta_z: float) -> None:
-        self.paddle.move(delta_z)
+    # step: fraction of a BASE_TICK_RATE tick the move is for, 1.0 at the base rate
+    def move_paddle(self, delta_z: float, step: float = 1.0) -> None:
+        self._paddle.move(delta_z, step)
 
     # update_score method
     # increments the player's score by 1
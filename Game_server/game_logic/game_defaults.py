@@ -26,3 +26,11 @@ BALL_DEFAULT_Z = FIELD_WIDTH / 2
 BALL_DEFAULT_DIRECTION = 0 # angle in degrees
 
 MAX_BOUNCE_ANGLE_ADJUSTMENT = 80
+MAX_IMPACTS_PER_STEP = 8 # bounces resolved within one tick, the rest of a step with more is dropped
+
+BASE_TICK_RATE = 60 # speeds are given in units per tick at this rate
+TICK_RATE = 60 # default game loop ticks per second
+SNAPSHOT_RATE = 60 # default game state messages per second
+MAX_TICK_RATE = 120 # rate of the shared clock, game tick rates must divide it
+SERVE_DELAY = 1.0 # seconds between the ball reset and the start of the rally
+POST_RALLY_FRAMES = 60 # frames the ball keeps moving after a goal (aka going through the goal)
@@ -0,0 +1,171 @@
+import argparse
+import hashlib
+import json
+import random
+import struct
+import time
+from game_logic.game_defaults import *
+from server import PongGame
+
+# Headless simulation
+# Runs games without Socket.IO, the tick scheduler or any sleeping: PongGame.step() is
+# called in a loop as fast as the CPU allows, and nothing is ever flushed to clients.
+# Every game has its own seeded RNG, and the paddles are driven by scripted or recorded
+# inputs, or by bots, so the same seed and inputs always play the same game.
+# Every tick's state goes into a trajectory hash, two runs played the same game if their
+# hashes are equal. Used by regression tests, physics benchmarks and offline analysis.
+# Usage, from Game_server:
+#   python headless.py --games 10 --seed 1          # bot vs bot, prints the results as JSON
+#   python headless.py --record inputs.json         # also saves the inputs that were played
+#   python headless.py --replay inputs.json         # plays saved inputs again, no bots
+# Inputs are dicts, {'tick': n, 'player': 1 or 2, 'direction': -1, 0 or 1} for held-key
+# input and {'tick': n, 'player': 1 or 2, 'delta': dz} for move_paddle input.
+
+PLAYER_IDS = (1, 2)
+MAX_TICKS = 60 * 60 * TICK_RATE  # an hour of play, games end long before
+STATE_STRUCT = struct.Struct('<I6dII')  # tick, ball x/z/dx/dz, paddle z's, scores
+
+
+# PaddleBot class
+# Follows the ball with held-key input, with a new aiming error every rally so it misses sometimes
+# Only sends input when its direction changes, like the clients do
+class PaddleBot:
+    def __init__(self, player: int, seed: int, skill: float = 0.8):
+        self.player = player
+        self.rng = random.Random(seed)
+        self.skill = skill
+        self.direction = 0
+        self.error = 0.0
+        self.rally = None
+
+    # inputs method
+    # Returns the inputs of the bot for the coming tick
+    def inputs(self, tick: int, game: PongGame) -> list:
+        state = game.game_state
+        if state.current_rally == 0 and self.rally != 0:
+            self.error = self.rng.uniform(-1, 1) * PADDLE_WIDTH * (1 - self.skill)
+        self.rally = state.current_rally
+        paddle = (state.player1 if self.player == 1 else state.player2).paddle
+        target = state.ball.z + self.error
+        direction = 0
+        if abs(target - paddle.z) > PADDLE_SPEED:
+            direction = 1 if target > paddle.z else -1
+        if direction == self.direction:
+            return []
+        self.direction = direction
+        return [{'tick': tick, 'player': self.player, 'direction': direction}]
+
+
+# apply_input function
+# Queues an input in the game, the same way the paddle_input and move_paddle events do
+def apply_input(game: PongGame, data: dict, seq: int) -> None:
+    state = game.game_state
+    player_id = (state.player1 if data['player'] == 1 else state.player2).id
+    if 'direction' in data:
+        game.inputs[player_id].push_direction(data['direction'], seq)
+    else:
+        game.queue_move(player_id, data['delta'])
+
+
+# state_hash_bytes function
+# Packs the state of a tick for the trajectory hash
+def state_hash_bytes(game: PongGame) -> bytes:
+    state = game.game_state
+    ball = state.ball
+    return STATE_STRUCT.pack(
+        game.tick, ball.x, ball.z, ball.delta_x, ball.delta_z,
+        state.player1.paddle.z, state.player2.paddle.z,
+        state.player1.score, state.player2.score,
+    )
+
+
+# run_game function
+# Plays one game headless until it is over or max_ticks ticks went by
+# Parameters:
+#   - seed: seed of the game's RNG and of the bots
+#   - inputs: scripted or recorded inputs, played on their tick
+#   - bots: players (1 and/or 2) that are played by a PaddleBot
+#   - physics: a BatchPhysicsEngine to move the ball with, None for the entities
+# Returns a dict with the ticks played, the score, the trajectory hash and every input played
+def run_game(seed: int = 0, inputs=(), bots=(1, 2), tick_rate: int = TICK_RATE,
+             max_ticks: int = MAX_TICKS, physics=None) -> dict:
+    game = PongGame(seed, PLAYER_IDS[0], PLAYER_IDS[1], False, tick_rate, seed=seed)
+    game.physics = physics
+    players = [PaddleBot(player, seed * 2 + player) for player in bots]
+    scripted = {}
+    for data in inputs:
+        scripted.setdefault(data['tick'], []).append(data)
+    played = []
+    trajectory = hashlib.sha256()
+    game.start_rally()
+    while game.game_state.in_progress and game.tick < max_ticks:
+        tick = game.tick + 1
+        tick_inputs = list(scripted.get(tick, ()))
+        for bot in players:
+            tick_inputs.extend(bot.inputs(tick, game))
+        for data in tick_inputs:
+            apply_input(game, data, len(played))
+            played.append(data)
+        game.step()
+        if physics is not None:
+            physics.run()
+        game.trajectory_changes.clear()
+        trajectory.update(state_hash_bytes(game))
+    state = game.game_state
+    return {
+        'seed': seed,
+        'ticks': game.tick,
+        'score': [state.player1.score, state.player2.score],
+        'longest_rally': state.longest_rally,
+        'hash': trajectory.hexdigest(),
+        'inputs': played,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless, deterministic Pong simulation')
+    parser.add_argument('--games', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game, the others count up')
+    parser.add_argument('--tick-rate', type=int, default=TICK_RATE)
+    parser.add_argument('--max-ticks', type=int, default=MAX_TICKS)
+    parser.add_argument('--physics', choices=('object', 'batch'), default='object')
+    parser.add_argument('--record', metavar='FILE', help='save the inputs of every game as JSON')
+    parser.add_argument('--replay', metavar='FILE', help='play the inputs saved with --record, no bots')
+    args = parser.parse_args()
+
+    physics = None
+    if args.physics == 'batch':
+        from game_logic.batch_engine import BatchPhysicsEngine
+        physics = BatchPhysicsEngine()
+    replays = None
+    if args.replay:
+        with open(args.replay) as f:
+            replays = json.load(f)
+    seeds = [game['seed'] for game in replays] if replays else range(args.seed, args.seed + args.games)
+
+    start = time.perf_counter()
+    results = []
+    for index, seed in enumerate(seeds):
+        if replays:
+            result = run_game(seed, replays[index]['inputs'], (), args.tick_rate, args.max_ticks, physics)
+        else:
+            result = run_game(seed, (), (1, 2), args.tick_rate, args.max_ticks, physics)
+        results.append(result)
+    elapsed = time.perf_counter() - start
+
+    if args.record:
+        with open(args.record, 'w') as f:
+            json.dump([{'seed': result['seed'], 'inputs': result['inputs']} for result in results], f)
+    ticks = sum(result['ticks'] for result in results)
+    print(json.dumps({
+        'games': len(results),
+        'ticks': ticks,
+        'seconds': round(elapsed, 3),
+        'ticks_per_second': round(ticks / elapsed) if elapsed else None,
+        'realtime_factor': round(ticks / args.tick_rate / elapsed, 1) if elapsed else None,
+        'results': [{key: value for key, value in result.items() if key != 'inputs'} for result in results],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
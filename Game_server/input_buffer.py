@@ -0,0 +1,49 @@
+from collections import deque
+
+INPUT_BUFFER_SIZE = 32  # paddle moves a player can have queued, older ones are dropped
+
+
+# PlayerInputBuffer class
+# Collects a player's paddle input between two ticks, the game applies it in one
+# batch at the start of the next tick (see PongGame.apply_inputs)
+# Properties:
+#   - deltas: queued move_paddle deltas, bounded to INPUT_BUFFER_SIZE
+#   - direction: the latest held direction from paddle_input, None if it did not change
+#   - seq: sequence number of that paddle_input
+#   - dropped: number of deltas dropped because the buffer was full
+class PlayerInputBuffer:
+    def __init__(self, size: int = INPUT_BUFFER_SIZE):
+        self.deltas: deque = deque(maxlen=size)
+        self.direction = None
+        self.seq = None
+        self.dropped: int = 0
+
+    # push_delta method
+    # Queues a move_paddle delta, the oldest one is dropped when the buffer is full
+    def push_delta(self, delta_z: float) -> None:
+        if len(self.deltas) == self.deltas.maxlen:
+            self.dropped += 1
+        self.deltas.append(delta_z)
+
+    # push_direction method
+    # Stores a held direction, only the latest one before a tick is applied
+    def push_direction(self, direction: int, seq: int) -> None:
+        self.direction = direction
+        self.seq = seq
+
+    # take_direction method
+    # Returns the pending (direction, seq) and clears it, direction is None if there is none
+    def take_direction(self) -> tuple:
+        direction, seq = self.direction, self.seq
+        self.direction = None
+        self.seq = None
+        return direction, seq
+
+    # take_deltas method
+    # Sums up the deltas queued during the tick and clears them, the sum is clamped to
+    # [-limit, limit], whatever does not fit in the tick is dropped: carrying it over would
+    # keep the paddle moving after the client stopped it
+    def take_deltas(self, limit: float) -> float:
+        total = sum(self.deltas)
+        self.deltas.clear()
+        return max(-limit, min(limit, total))
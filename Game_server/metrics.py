@@ -0,0 +1,201 @@
+import bisect
+
+# Game server metrics
+# Served in the Prometheus text format on http://<host>:8010/metrics, next to Socket.IO
+# (see MetricsApp). Every worker of a sharded server serves its own on its own port.
+# Recording a metric is cheap enough for the tick loop: histograms have fixed buckets, so an
+# observation is a bisect and two increments, nothing is allocated per tick and nothing is
+# computed until the metrics are scraped. Gauges that are the size of something (active
+# games, pending requests...) are read only when scraped.
+
+METRICS_PATH = '/metrics'
+
+# Bucket upper bounds, in seconds
+TICK_BUCKETS = (0.0005, 0.001, 0.002, 0.004, 0.008, 0.016, 0.033, 0.066, 0.125, 0.25, 0.5, 1.0)
+EMIT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+EVENT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+
+
+# Counter class
+# A number that only goes up
+class Counter:
+    __slots__ = ('name', 'description', 'value')
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def render(self, lines: list) -> None:
+        lines.append(f"# HELP {self.name} {self.description}")
+        lines.append(f"# TYPE {self.name} counter")
+        lines.append(f"{self.name} {self.value}")
+
+
+# Gauge class
+# A number that goes up and down, or, with a function, the value it returns when scraped
+class Gauge:
+    __slots__ = ('name', 'description', 'value', 'function')
+
+    def __init__(self, name: str, description: str, function=None):
+        self.name = name
+        self.description = description
+        self.value = 0
+        self.function = function
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: int = 1) -> None:
+        self.value -= amount
+
+    def render(self, lines: list) -> None:
+        value = self.function() if self.function is not None else self.value
+        lines.append(f"# HELP {self.name} {self.description}")
+        lines.append(f"# TYPE {self.name} gauge")
+        lines.append(f"{self.name} {value}")
+
+
+# Histogram class
+# Counts observations in fixed buckets
+# Properties:
+#   - bounds: upper bounds of the buckets, ascending, a last bucket takes everything above
+#   - counts: observations per bucket (not cumulative)
+#   - sum, count: of all observations
+class Histogram:
+    __slots__ = ('name', 'description', 'bounds', 'counts', 'sum', 'count', 'labels')
+
+    def __init__(self, name: str, description: str, bounds: tuple, labels: str = ''):
+        self.name = name
+        self.description = description
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.labels = labels
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, lines: list, header: bool = True) -> None:
+        if header:
+            lines.append(f"# HELP {self.name} {self.description}")
+            lines.append(f"# TYPE {self.name} histogram")
+        labels = f"{self.labels}," if self.labels else ''
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{{labels}le="+Inf"}} {self.count}')
+        suffix = f"{{{self.labels}}}" if self.labels else ''
+        lines.append(f"{self.name}_sum{suffix} {self.sum}")
+        lines.append(f"{self.name}_count{suffix} {self.count}")
+
+
+# HistogramFamily class
+# Histograms of the same thing, one per value of a label, e.g. one per event type
+# Get the histogram of a label value once, with labels(), and observe it from then on
+class HistogramFamily:
+    def __init__(self, name: str, description: str, label: str, bounds: tuple):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.bounds = bounds
+        self.histograms: dict = {}
+
+    def labels(self, value: str) -> Histogram:
+        histogram = self.histograms.get(value)
+        if histogram is None:
+            histogram = self.histograms[value] = Histogram(
+                self.name, self.description, self.bounds, labels=f'{self.label}="{value}"')
+        return histogram
+
+    def render(self, lines: list) -> None:
+        lines.append(f"# HELP {self.name} {self.description}")
+        lines.append(f"# TYPE {self.name} histogram")
+        for value in sorted(self.histograms):
+            self.histograms[value].render(lines, header=False)
+
+
+# Metrics class
+# The metrics of one game server process
+class Metrics:
+    def __init__(self):
+        self.tick_duration = Histogram(
+            'pong_tick_duration_seconds', 'Time to step and flush every game in one scheduler tick', TICK_BUCKETS)
+        self.tick_lateness = Histogram(
+            'pong_tick_lateness_seconds', 'How late the tick scheduler woke up after a tick deadline', TICK_BUCKETS)
+        self.emit_duration = Histogram(
+            'pong_game_emit_seconds', 'Time to send the messages of one game in one tick', EMIT_BUCKETS)
+        self.event_duration = HistogramFamily(
+            'pong_event_handling_seconds', 'Time to handle an inbound Socket.IO event', 'event', EVENT_BUCKETS)
+        self.games_completed = Counter('pong_games_completed_total', 'Games that ended normally')
+        self.games_cancelled = Counter('pong_games_cancelled_total', 'Games cancelled because a player left')
+        self.games_dropped = Counter('pong_games_dropped_total', 'Games stopped because their loop failed')
+        self.metrics: list = [
+            self.tick_duration, self.tick_lateness, self.emit_duration, self.event_duration,
+            self.games_completed, self.games_cancelled, self.games_dropped,
+        ]
+
+    # add_counter method
+    # Adds a counter
+    def add_counter(self, name: str, description: str) -> Counter:
+        counter = Counter(name, description)
+        self.metrics.append(counter)
+        return counter
+
+    # add_histogram method
+    # Adds a histogram with the given bucket bounds
+    def add_histogram(self, name: str, description: str, bounds: tuple) -> Histogram:
+        histogram = Histogram(name, description, bounds)
+        self.metrics.append(histogram)
+        return histogram
+
+    # add_gauge method
+    # Adds a gauge whose value is returned by the function when the metrics are scraped
+    def add_gauge(self, name: str, description: str, function) -> Gauge:
+        gauge = Gauge(name, description, function)
+        self.metrics.append(gauge)
+        return gauge
+
+    # render method
+    # Returns the metrics in the Prometheus text format
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            metric.render(lines)
+        return '\n'.join(lines) + '\n'
+
+
+# MetricsApp class
+# ASGI app serving the metrics on METRICS_PATH, used as Socket.IO's other_asgi_app so it
+# is served on the same port as the game server
+class MetricsApp:
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        if scope['path'] != METRICS_PATH or scope['method'] not in ('GET', 'HEAD'):
+            await self._respond(send, 404, b'Not Found', b'text/plain')
+            return
+        body = self.metrics.render().encode()
+        await self._respond(send, 200, body if scope['method'] == 'GET' else b'',
+                            b'text/plain; version=0.0.4; charset=utf-8', len(body))
+
+    async def _respond(self, send, status: int, body: bytes, content_type: bytes, length: int = None) -> None:
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', content_type),
+                (b'content-length', str(len(body) if length is None else length).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
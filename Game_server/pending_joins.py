@@ -0,0 +1,118 @@
+import heapq
+import itertools
+import logging
+import time
+from server_utils import sio
+
+REQUEST_TIMEOUT = 10.0  # seconds a join_game request waits for the other player
+SWEEP_INTERVAL = 0.5    # seconds between two sweeps of the expired requests
+
+
+# GameRequest class
+# A join_game request waiting for the other player of the game
+# Properties:
+#   - key: (game_id, player1_id, player2_id), the other player's request has the same key
+#   - player_id: the player that sent the request
+#   - expires_at: when the request is cancelled if nobody paired with it
+class GameRequest:
+    __slots__ = ('sid', 'game_id', 'player1_id', 'player2_id', 'player_id', 'is_remote', 'expires_at')
+
+    def __init__(self, sid, game_id: int, player1_id, player2_id, player_id, is_remote):
+        self.sid = sid
+        self.game_id = game_id
+        self.player1_id = player1_id
+        self.player2_id = player2_id
+        self.player_id = player_id
+        self.is_remote = is_remote
+        self.expires_at = None
+
+    @property
+    def key(self) -> tuple:
+        return (self.game_id, self.player1_id, self.player2_id)
+
+    # cancel method
+    # Tells the waiting client that nobody joined the game in time
+    async def cancel(self) -> None:
+        logging.info(f"Request for game {self.game_id} has timed out, sending cancel_game")
+        json_data = {
+            "type": "cancel_game",
+            "gameId": self.game_id,
+        }
+        await sio.emit('cancel_game', json_data, room=self.sid)
+
+
+# PendingJoins class
+# Index of the join_game requests waiting for their other player
+# Pairing is a dict lookup on the request's key, expiry a min-heap of (expires_at, ...),
+# so both stay cheap however many players are waiting
+# Every session has at most one waiting request: a new request of the same session, or of
+# the same player for the same game, replaces the old one
+# Entries of requests that were paired or replaced stay in the heap and are skipped when
+# they come out of it
+class PendingJoins:
+    def __init__(self, timeout: float = REQUEST_TIMEOUT, clock=time.monotonic):
+        self._timeout = timeout
+        self._clock = clock
+        self._requests: dict = {}  # key -> GameRequest
+        self._by_sid: dict = {}    # sid -> key of its request
+        self._expiry: list = []    # heap of (expires_at, order, request)
+        self._order = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._requests)
+
+    # pair method
+    # Takes the request of the other player of the game out of the index
+    # Returns it, or None if the other player is not waiting
+    def pair(self, game_id, player1_id, player2_id, player_id):
+        key = (game_id, player1_id, player2_id)
+        request = self._requests.get(key)
+        if request is None or request.player_id == player_id:
+            return None
+        self._remove(request)
+        return request
+
+    # add method
+    # Makes the request wait for the other player, until it times out
+    def add(self, request: GameRequest) -> None:
+        self.remove_sid(request.sid)
+        waiting = self._requests.get(request.key)
+        if waiting is not None:
+            self._remove(waiting)
+        request.expires_at = self._clock() + self._timeout
+        self._requests[request.key] = request
+        self._by_sid[request.sid] = request.key
+        heapq.heappush(self._expiry, (request.expires_at, next(self._order), request))
+
+    # remove_sid method
+    # Drops the waiting request of a session, returns it or None
+    def remove_sid(self, sid):
+        key = self._by_sid.get(sid)
+        if key is None:
+            return None
+        request = self._requests[key]
+        self._remove(request)
+        return request
+
+    # expired method
+    # Takes the requests that timed out out of the index and returns them
+    def expired(self) -> list:
+        now = self._clock()
+        expired = []
+        while self._expiry and self._expiry[0][0] <= now:
+            _, _, request = heapq.heappop(self._expiry)
+            if self._requests.get(request.key) is request:
+                self._remove(request)
+                expired.append(request)
+        return expired
+
+    def _remove(self, request: GameRequest) -> None:
+        del self._requests[request.key]
+        del self._by_sid[request.sid]
+        # Compact the heap when it is mostly entries of requests that are gone
+        if len(self._expiry) > 64 and len(self._expiry) > 4 * len(self._requests):
+            self._expiry = [entry for entry in self._expiry if self._requests.get(entry[2].key) is entry[2]]
+            heapq.heapify(self._expiry)
+
+
+pending_joins = PendingJoins()
@@ -0,0 +1,144 @@
+import functools
+import logging
+import time
+from server_utils import sio, metrics
+
+# Message budget of every client event: (messages per second, burst)
+# move_paddle is sent once per frame while a key is held, its budget fits 240 Hz displays
+EVENT_BUDGETS = {
+    'move_paddle': (300, 150),
+    'paddle_input': (30, 30),
+    'ack_snapshot': (120, 60),
+    'start_game': (2, 5),
+    'join_game': (2, 5),
+    'quit_game': (2, 5),
+    'list_games': (1, 5),
+    'spectate': (2, 5),
+    'stop_spectating': (2, 5),
+    'message': (5, 10),
+    'test': (1, 5),
+}
+DEFAULT_BUDGET = (10, 20)
+
+# A client is disconnected when it goes over an event's budget at least DISCONNECT_AFTER_DROPS
+# times within DROP_WINDOW seconds, and its messages are dropped at FLOOD_FACTOR times the
+# event's rate or more, i.e. it sends more than (1 + FLOOD_FACTOR) times its budget.
+# A client only a little over budget (a display faster than expected) only loses messages.
+DISCONNECT_AFTER_DROPS = 200
+DROP_WINDOW = 10.0
+FLOOD_FACTOR = 1.0
+
+
+# TokenBucket class
+# Classic token bucket, refilled at 'rate' tokens per second up to 'burst' tokens
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    # take method
+    # Takes one token, returns False if the bucket is empty
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+# RateLimiter class
+# Keeps a token bucket for every session ID and event type
+# Properties:
+#   - budgets: event -> (messages per second, burst)
+#   - dropped: event -> number of messages dropped for going over budget
+#   - disconnected: number of sessions disconnected for going over budget too often
+class RateLimiter:
+    def __init__(self, budgets: dict = EVENT_BUDGETS, clock=time.monotonic,
+                 disconnect_after: int = DISCONNECT_AFTER_DROPS, drop_window: float = DROP_WINDOW,
+                 flood_factor: float = FLOOD_FACTOR):
+        self.budgets: dict = budgets
+        self.dropped: dict = {}
+        self.disconnected: int = 0
+        self._clock = clock
+        self._disconnect_after = disconnect_after
+        self._drop_window = drop_window
+        self._flood_factor = flood_factor
+        self._buckets: dict = {}  # sid -> {event: TokenBucket}
+        self._strikes: dict = {}  # sid -> {event: [window start, drops in window]}
+
+    # allow method
+    # Returns True if the session may send the event now, False if the message must be dropped
+    def allow(self, sid, event: str) -> bool:
+        now = self._clock()
+        buckets = self._buckets.get(sid)
+        if buckets is None:
+            buckets = self._buckets[sid] = {}
+        bucket = buckets.get(event)
+        if bucket is None:
+            rate, burst = self.budgets.get(event, DEFAULT_BUDGET)
+            bucket = buckets[event] = TokenBucket(rate, burst, now)
+        if bucket.take(now):
+            return True
+        self.dropped[event] = self.dropped.get(event, 0) + 1
+        return False
+
+    # strike method
+    # Records a dropped message of the session
+    # Returns True if the session floods the event and should be disconnected
+    # The drop rate is measured over at least one second, so a single burst is not a flood
+    def strike(self, sid, event: str) -> bool:
+        now = self._clock()
+        events = self._strikes.get(sid)
+        if events is None:
+            events = self._strikes[sid] = {}
+        strikes = events.get(event)
+        if strikes is None or now - strikes[0] > self._drop_window:
+            strikes = events[event] = [now, 0]
+        strikes[1] += 1
+        if strikes[1] < self._disconnect_after:
+            return False
+        rate = self.budgets.get(event, DEFAULT_BUDGET)[0]
+        return strikes[1] / max(now - strikes[0], 1.0) >= self._flood_factor * rate
+
+    # forget method
+    # Drops everything known about a session, called on disconnect
+    def forget(self, sid) -> None:
+        self._strikes.pop(sid, None)
+        self._buckets.pop(sid, None)
+
+
+rate_limiter = RateLimiter()
+
+
+# rate_limited decorator
+# Enforces the event's budget before the handler runs
+# Messages over budget are dropped and counted, clients flooding the event are disconnected
+# The time the handler takes is observed in the event's histogram (see metrics.py)
+# Use it below @sio.event, e.g.
+#   @sio.event
+#   @rate_limited('move_paddle')
+#   async def move_paddle(sid, data):
+def rate_limited(event: str):
+    def decorator(handler):
+        histogram = metrics.event_duration.labels(event)
+
+        @functools.wraps(handler)
+        async def wrapper(sid, *args):
+            if rate_limiter.allow(sid, event):
+                started = time.perf_counter()
+                try:
+                    return await handler(sid, *args)
+                finally:
+                    histogram.observe(time.perf_counter() - started)
+            if rate_limiter.strike(sid, event):
+                logging.warning(f"Disconnecting {sid}: too many messages over budget")
+                rate_limiter.disconnected += 1
+                rate_limiter.forget(sid)
+                await sio.disconnect(sid)
+        return wrapper
+    return decorator
@@ -0,0 +1,239 @@
+import json
+import mmap
+import os
+import struct
+import time
+
+# Match recording
+# With RECORDINGS_DIR set, every game the server runs is recorded into an append-only binary
+# log, <RECORDINGS_DIR>/game-<game_id>-<start time>.pongrec, which replay_service.py
+# streams back to clients.
+# Between two changes the ball and the paddles move in straight lines, so only the changes
+# are recorded, the same ones the events wire format sends (see PongGame.record_trajectory):
+# the ball when its trajectory changes (serve, launch, bounces, goals) and a paddle when its
+# velocity changes, which is where the players' input shows.
+# Every KEYFRAME_INTERVAL seconds a keyframe (the ball and both paddles) is written, replays
+# seek to keyframes. Every state in between is extrapolated from the last records.
+# The file is a HEADER_STRUCT header, the game's metadata and RECORD_STRUCT records, little-endian:
+#   - header: magic, version, tick rate, start time, length of the metadata
+#   - metadata: UTF-8 JSON, {"game_id": ..., "player1_id": ..., "player2_id": ...}
+#   - record: tick uint32, kind uint8, arg uint8, score 1 uint8, score 2 uint8, 2 x float32
+#       KIND_KEYFRAME, KIND_BALL: ball x, z, arg is the change (CHANGES), a KIND_VELOCITY follows
+#       KIND_VELOCITY: ball vx, vz
+#       KIND_PADDLE: paddle z, vz, arg is the player (0 or 1)
+#       KIND_END: ball x, z, the last record, written when the game is over
+# Velocities are in units per second. Records are 16 bytes, a 5 minute game is a few thousand
+# of them, tens of KB. They are packed into a small in-memory ring buffer that is copied into
+# the memory-mapped file when it is full, so recording costs the game loop next to no
+# system calls.
+
+RECORDINGS_DIR = os.environ.get('RECORDINGS_DIR')
+RECORDING_SUFFIX = '.pongrec'
+MAGIC = b'PONGREC1'
+RECORDING_VERSION = 1
+HEADER_STRUCT = struct.Struct('<8sHHdH')
+RECORD_STRUCT = struct.Struct('<IBBBB2f')
+KEYFRAME_INTERVAL = 5.0  # seconds
+BUFFER_RECORDS = 256     # records packed in memory before they are copied into the file
+FILE_CHUNK = 64 * 1024   # the file grows by this many bytes when it is full
+
+KIND_KEYFRAME = 0
+KIND_BALL = 1
+KIND_VELOCITY = 2
+KIND_PADDLE = 3
+KIND_END = 4
+
+# Trajectory changes, by their code in ball records
+CHANGES = ('sync', 'serve', 'launch', 'wall_bounce', 'paddle_bounce', 'goal')
+CHANGE_CODES = {change: code for code, change in enumerate(CHANGES)}
+
+
+# recording_path function
+# Returns the path of a new recording of the game
+def recording_path(game_id, directory: str = None) -> str:
+    return os.path.join(directory or RECORDINGS_DIR, f"game-{game_id}-{int(time.time())}{RECORDING_SUFFIX}")
+
+
+# MatchRecorder class
+# Records one game, see the top of the file for the format
+# Properties:
+#   - path: path of the recording
+#   - records: number of records written so far
+class MatchRecorder:
+    def __init__(self, path: str, game_id, tick_rate: int, player1_id, player2_id):
+        self.path = path
+        self.records = 0
+        self.tick_rate = tick_rate
+        self._keyframe_ticks = max(1, int(KEYFRAME_INTERVAL * tick_rate))
+        self._next_keyframe = 0
+        self._buffer = bytearray(BUFFER_RECORDS * RECORD_STRUCT.size)
+        self._buffered = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'w+b')
+        self._file.truncate(FILE_CHUNK)
+        self._map = mmap.mmap(self._file.fileno(), FILE_CHUNK)
+        metadata = json.dumps({'game_id': game_id, 'player1_id': player1_id, 'player2_id': player2_id}).encode()
+        HEADER_STRUCT.pack_into(self._map, 0, MAGIC, RECORDING_VERSION, tick_rate, time.time(), len(metadata))
+        self._offset = HEADER_STRUCT.size + len(metadata)
+        self._map[HEADER_STRUCT.size:self._offset] = metadata
+
+    # record method
+    # Records the changes of a tick, called by PongGame.flush after every tick
+    # Parameters:
+    #   - game: the PongGame
+    #   - changes: the tick's trajectory changes, as recorded by PongGame.record_trajectory
+    def record(self, game, changes: list) -> None:
+        state = game.game_state
+        if game.tick >= self._next_keyframe:
+            self._next_keyframe = game.tick + self._keyframe_ticks
+            self._ball(game, KIND_KEYFRAME, 'sync')
+            self._paddle(game, 0)
+            self._paddle(game, 1)
+            return
+        ball_change = None
+        for change in changes:
+            kind = change['kind']
+            if kind == 'paddle_velocity':
+                self._paddle(game, 0 if change['player'] == state.player1.id else 1)
+            else:
+                ball_change = kind
+        if ball_change is not None:
+            self._ball(game, KIND_BALL, ball_change)
+
+    def _ball(self, game, kind: int, change: str) -> None:
+        state = game.game_state
+        score1, score2 = state.player1.score, state.player2.score
+        self._append(game.tick, kind, CHANGE_CODES.get(change, 0), score1, score2, state.ball.x, state.ball.z)
+        if kind != KIND_END:
+            self._append(game.tick, KIND_VELOCITY, 0, score1, score2, *game.ball_velocity())
+
+    def _paddle(self, game, index: int) -> None:
+        state = game.game_state
+        player = state.player1 if index == 0 else state.player2
+        self._append(game.tick, KIND_PADDLE, index, state.player1.score, state.player2.score,
+                     player.paddle.z, game.paddle_velocity[index])
+
+    def _append(self, *fields) -> None:
+        RECORD_STRUCT.pack_into(self._buffer, self._buffered * RECORD_STRUCT.size, *fields)
+        self._buffered += 1
+        self.records += 1
+        if self._buffered == BUFFER_RECORDS:
+            self.flush()
+
+    # flush method
+    # Copies the buffered records into the file
+    def flush(self) -> None:
+        size = self._buffered * RECORD_STRUCT.size
+        if not size:
+            return
+        if self._offset + size > len(self._map):
+            self._map.resize(len(self._map) + FILE_CHUNK)
+        self._map[self._offset:self._offset + size] = self._buffer[:size]
+        self._offset += size
+        self._buffered = 0
+
+    # close method
+    # Ends the recording, the file is cut to the size of its records
+    def close(self, game=None) -> None:
+        if self._map is None:
+            return
+        if game is not None and game.game_state is not None:
+            self._ball(game, KIND_END, 'sync')
+        self.flush()
+        self._map.flush()
+        self._map.close()
+        self._map = None
+        self._file.truncate(self._offset)
+        self._file.close()
+
+
+# Recording class
+# A recording read back from its file
+# Properties:
+#   - game_id, tick_rate, player1_id, player2_id, started: from the header and metadata
+#   - records: list of (tick, kind, arg, score1, score2, a, b) tuples
+#   - keyframes: indexes of the keyframe records, in tick order
+class Recording:
+    def __init__(self, data: bytes):
+        if len(data) < HEADER_STRUCT.size:
+            raise ValueError("Not a recording")
+        magic, version, self.tick_rate, self.started, metadata_size = HEADER_STRUCT.unpack_from(data, 0)
+        if magic != MAGIC or version != RECORDING_VERSION:
+            raise ValueError("Not a recording of this version")
+        start = HEADER_STRUCT.size + metadata_size
+        metadata = json.loads(bytes(data[HEADER_STRUCT.size:start]))
+        self.game_id = metadata.get('game_id')
+        self.player1_id = metadata.get('player1_id')
+        self.player2_id = metadata.get('player2_id')
+        body = memoryview(data)[start:]
+        body = body[:len(body) - len(body) % RECORD_STRUCT.size]
+        self.records: list = list(RECORD_STRUCT.iter_unpack(body))
+        # A game still being recorded has zeroed space after its last record, ticks start at 1
+        while self.records and self.records[-1][0] == 0:
+            self.records.pop()
+        self.keyframes: list = [index for index, record in enumerate(self.records) if record[1] == KIND_KEYFRAME]
+
+    @classmethod
+    def load(cls, path: str) -> 'Recording':
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+    @property
+    def last_tick(self) -> int:
+        return self.records[-1][0] if self.records else 0
+
+
+# ReplayCursor class
+# Plays a recording forward tick by tick, and rebuilds the state of any tick
+# from the records before it
+class ReplayCursor:
+    def __init__(self, recording: Recording):
+        self.recording = recording
+        self.seek(0)
+
+    # seek method
+    # Moves the cursor to a keyframe
+    def seek(self, keyframe: int) -> None:
+        keyframes = self.recording.keyframes
+        self.index = keyframes[max(0, min(keyframe, len(keyframes) - 1))] if keyframes else 0
+        self.ball = None    # (tick, x, z, vx, vz)
+        self.paddles = [None, None]  # (tick, z, vz) of player 1 and 2
+        self.score = (0, 0)
+        self.ended = False
+        self.tick = self.recording.records[self.index][0] if self.recording.records else 0
+
+    # advance method
+    # Applies the records up to the given tick
+    def advance(self, tick: int) -> None:
+        records = self.recording.records
+        while self.index < len(records) and records[self.index][0] <= tick:
+            record_tick, kind, arg, score1, score2, a, b = records[self.index]
+            if kind == KIND_PADDLE:
+                self.paddles[arg] = (record_tick, a, b)
+            elif kind == KIND_VELOCITY:
+                self.ball = (record_tick, self.ball[1], self.ball[2], a, b)
+            else:
+                self.ball = (record_tick, a, b, 0.0, 0.0)
+                self.ended = kind == KIND_END
+            self.score = (score1, score2)
+            self.index += 1
+        self.tick = tick
+
+    @property
+    def finished(self) -> bool:
+        return self.ended or self.index >= len(self.recording.records)
+
+    # state method
+    # Returns the state at the cursor's tick, extrapolated from the last records
+    def state(self) -> dict:
+        rate = self.recording.tick_rate
+        state = {'tick': self.tick, 'score': list(self.score)}
+        if self.ball is not None:
+            tick, x, z, vx, vz = self.ball
+            seconds = (self.tick - tick) / rate
+            state['ball'] = {'x': x + vx * seconds, 'z': z + vz * seconds}
+        for index, paddle in enumerate(self.paddles):
+            if paddle is not None:
+                tick, z, vz = paddle
+                state[f'player{index + 1}'] = {'z': z + vz * (self.tick - tick) / rate}
+        return state
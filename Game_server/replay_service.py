@@ -0,0 +1,211 @@
+import asyncio
+import bisect
+import logging
+import logging.config
+import os
+import socketio
+import uvicorn
+from recording import RECORDINGS_DIR, RECORDING_SUFFIX, Recording, ReplayCursor
+from service_config import logging_config, full_host_url
+
+# Replay service
+# Streams the games recorded by the game server (see recording.py) back to clients over
+# Socket.IO. It runs as its own process, next to the game server, and only reads the
+# recordings directory, so watching replays never takes CPU from the live games.
+# Events:
+#   - list_replays: answered with 'replay_list', the recordings, newest first
+#   - watch_replay {name, speed, keyframe}: starts streaming a recording, 'replay_start' is sent
+#     first, then 'replay_frame' events at REPLAY_FRAME_RATE and 'replay_end' at the end
+#   - replay_seek {keyframe}: jumps to a keyframe (one every KEYFRAME_INTERVAL seconds of game)
+#   - replay_speed {speed}: plays faster, from 1 up to MAX_REPLAY_SPEED times the game's speed
+#   - stop_replay: stops streaming
+# Usage, from Game_server: RECORDINGS_DIR=... python replay_service.py
+
+REPLAY_PORT = int(os.environ.get('REPLAY_PORT', '8020'))
+REPLAY_FRAME_RATE = 30  # frames per second sent to the client, whatever the replay speed
+MAX_REPLAY_SPEED = 8
+
+sio = socketio.AsyncServer(
+    async_mode='asgi',
+    cors_allowed_origins=full_host_url,
+    logger=False,
+    engineio_logger=False,
+)
+app = socketio.ASGIApp(sio)
+
+
+# Replay class
+# A recording being streamed to one client
+# Properties:
+#   - cursor: position in the recording
+#   - speed: how many times faster than the game the replay plays
+#   - task: the task that streams the frames
+class Replay:
+    def __init__(self, sid, recording: Recording, speed: float = 1.0):
+        self.sid = sid
+        self.recording = recording
+        self.cursor = ReplayCursor(recording)
+        self.speed = speed
+        self.task = None
+
+    # frame method
+    # Returns the 'replay_frame' message of the cursor's position
+    def frame(self) -> dict:
+        return {'type': 'replay_frame', 'keyframe': self.keyframe(), **self.cursor.state()}
+
+    # keyframe method
+    # Returns the index of the last keyframe the cursor went past
+    def keyframe(self) -> int:
+        return max(0, bisect.bisect_left(self.recording.keyframes, self.cursor.index) - 1)
+
+    # stream method
+    # Sends the recording frame by frame, REPLAY_FRAME_RATE frames per second of wall time
+    async def stream(self) -> None:
+        interval = 1.0 / REPLAY_FRAME_RATE
+        ticks_per_frame = self.recording.tick_rate / REPLAY_FRAME_RATE
+        position = float(self.cursor.tick)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            self.cursor.advance(min(int(position), self.recording.last_tick))
+            await sio.emit('replay_frame', self.frame(), room=self.sid)
+            if self.cursor.finished:
+                break
+            position = max(position, self.cursor.tick) + ticks_per_frame * self.speed
+            deadline += interval
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+        await sio.emit('replay_end', {'type': 'replay_end', 'gameId': self.recording.game_id}, room=self.sid)
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.stream())
+
+    def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
+# Replays being streamed, by session ID
+replays = {}
+
+
+# replay_speed_from function
+# Reads a replay speed from the client's data, clamped to 1..MAX_REPLAY_SPEED
+def replay_speed_from(data, default: float = 1.0) -> float:
+    speed = data.get('speed', default) if isinstance(data, dict) else default
+    if not isinstance(speed, (int, float)):
+        return default
+    return float(min(max(speed, 1), MAX_REPLAY_SPEED))
+
+
+# recording_file function
+# Returns the path of a recording by its name, or None if there is no such recording
+# Only plain names of files in RECORDINGS_DIR are accepted
+def recording_file(name):
+    if not RECORDINGS_DIR or not isinstance(name, str) or not name.endswith(RECORDING_SUFFIX):
+        return None
+    if os.path.basename(name) != name:
+        return None
+    path = os.path.join(RECORDINGS_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+# list_recordings function
+# Returns the recordings in RECORDINGS_DIR, newest first
+def list_recordings() -> list:
+    if not RECORDINGS_DIR or not os.path.isdir(RECORDINGS_DIR):
+        return []
+    entries = [entry for entry in os.scandir(RECORDINGS_DIR)
+               if entry.is_file() and entry.name.endswith(RECORDING_SUFFIX)]
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    return [{'name': entry.name, 'size': entry.stat().st_size} for entry in entries]
+
+
+@sio.event
+async def connect(sid, environ, auth=None):
+    logging.info(f'Replay client connected: {sid}')
+
+
+@sio.event
+async def disconnect(sid):
+    replay = replays.pop(sid, None)
+    if replay is not None:
+        replay.stop()
+
+
+# Event handler for list_replays message
+@sio.event
+async def list_replays(sid, data=None):
+    await sio.emit('replay_list', {'type': 'replay_list', 'replays': list_recordings()}, room=sid)
+
+
+# Event handler for watch_replay message
+# The recording is read in a thread, reading a file must not stall the other replays
+@sio.event
+async def watch_replay(sid, data):
+    path = recording_file(data.get('name') if isinstance(data, dict) else None)
+    if path is None:
+        await sio.emit('error', {'message': 'No such replay'}, room=sid)
+        return
+    try:
+        recording = await asyncio.to_thread(Recording.load, path)
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not read replay {path}: {e}")
+        await sio.emit('error', {'message': 'Could not read replay'}, room=sid)
+        return
+    previous = replays.pop(sid, None)
+    if previous is not None:
+        previous.stop()
+    replay = Replay(sid, recording, replay_speed_from(data))
+    keyframe = data.get('keyframe', 0)
+    if isinstance(keyframe, int):
+        replay.cursor.seek(keyframe)
+    replays[sid] = replay
+    json_data = {
+        'type': 'replay_start',
+        'gameId': recording.game_id,
+        'player1Id': recording.player1_id,
+        'player2Id': recording.player2_id,
+        'tickRate': recording.tick_rate,
+        'lastTick': recording.last_tick,
+        'keyframes': len(recording.keyframes),
+        'speed': replay.speed,
+    }
+    await sio.emit('replay_start', json_data, room=sid)
+    replay.start()
+
+
+# Event handler for replay_seek message
+# Jumps to a keyframe, the stream goes on from there
+@sio.event
+async def replay_seek(sid, data):
+    replay = replays.get(sid)
+    keyframe = data.get('keyframe') if isinstance(data, dict) else None
+    if replay is None or not isinstance(keyframe, int):
+        return
+    replay.stop()
+    replay.cursor.seek(keyframe)
+    replay.start()
+
+
+# Event handler for replay_speed message
+@sio.event
+async def replay_speed(sid, data):
+    replay = replays.get(sid)
+    if replay is not None:
+        replay.speed = replay_speed_from(data, replay.speed)
+
+
+# Event handler for stop_replay message
+@sio.event
+async def stop_replay(sid, data=None):
+    replay = replays.pop(sid, None)
+    if replay is not None:
+        replay.stop()
+
+
+if __name__ == '__main__':
+    logging.config.dictConfig(logging_config)
+    if not RECORDINGS_DIR:
+        logging.warning("RECORDINGS_DIR is not set, there are no replays to serve")
+    uvicorn.run(app, host='0.0.0.0', port=REPLAY_PORT, log_level="info", log_config=logging_config)
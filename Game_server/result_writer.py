@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+import requests
+
+# Write-behind persistence of game results
+# end_game puts the result of a remote game on an in-process queue and moves on, a background
+# task sends the queued results to the game history service in batches
+# (POST /game-results/), in a thread so the event loop keeps running.
+# Every result carries an idempotency key, the game history service stores a result only
+# once however often it is sent, so batches that failed or timed out are simply sent again.
+# A batch that fails is retried with exponential backoff. After MAX_ATTEMPTS failures its
+# results are dropped and logged. Results the service rejects are dropped at once.
+
+GAME_HISTORY = os.environ.get('GAME_HISTORY')
+RESULTS_PATH = '/game-results/'
+SERVICE_SECRET = os.environ.get('DJANGO_SECRET')
+BATCH_SIZE = 50
+FLUSH_INTERVAL = 1.0     # seconds results wait for more results to send them with
+MAX_QUEUED = 10000       # results kept while the service is unreachable, the oldest are dropped
+MAX_ATTEMPTS = 8
+RETRY_DELAY = 0.5        # seconds before the first retry, doubled after every failure
+MAX_RETRY_DELAY = 30.0
+REQUEST_TIMEOUT = 5.0
+
+
+# result_key function
+# Idempotency key of a game's result, the same on every node and every attempt
+def result_key(game_id) -> str:
+    return f'pong-result-{game_id}'
+
+
+# ResultWriter class
+# Queues game results and writes them to the game history service in the background
+# Properties:
+#   - queue: results waiting to be sent, as [result, failed attempts]
+#   - written: results the service stored (or already had)
+#   - rejected: results the service refused, they are not sent again
+#   - dropped: results given up on, after MAX_ATTEMPTS or because the queue was full
+class ResultWriter:
+    def __init__(self, url: str = None, secret: str = SERVICE_SECRET, send=None,
+                 sleep=asyncio.sleep, batch_size: int = BATCH_SIZE, max_queued: int = MAX_QUEUED):
+        self.url = url or (f"{GAME_HISTORY}{RESULTS_PATH}" if GAME_HISTORY else None)
+        self.secret = secret
+        self.queue: deque = deque()
+        self.written: int = 0
+        self.rejected: int = 0
+        self.dropped: int = 0
+        self._send = send or self.post
+        self._sleep = sleep
+        self._batch_size = batch_size
+        self._max_queued = max_queued
+        self._wakeup = None
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+    # put method
+    # Queues a result, never blocks
+    def put(self, result: dict) -> None:
+        if len(self.queue) >= self._max_queued:
+            self.queue.popleft()
+            self.dropped += 1
+            logging.error("Game result queue is full, dropped the oldest result")
+        self.queue.append([result, 0])
+        if self._wakeup is not None and len(self.queue) >= self._batch_size:
+            self._wakeup.set()
+
+    def post(self, batch: list) -> dict:
+        response = requests.post(self.url, json={'results': batch},
+                                 headers={'X-SERVICE-SECRET': self.secret or ''}, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    # flush method
+    # Sends one batch of queued results
+    # Returns False if the batch failed and was queued again, True otherwise
+    async def flush(self) -> bool:
+        if not self.queue:
+            return True
+        entries = [self.queue.popleft() for _ in range(min(self._batch_size, len(self.queue)))]
+        try:
+            response = await asyncio.to_thread(self._send, [result for result, _ in entries])
+        except Exception as e:
+            logging.warning(f"Could not write {len(entries)} game results: {e}")
+            for entry in reversed(entries):
+                entry[1] += 1
+                if entry[1] >= MAX_ATTEMPTS:
+                    self.dropped += 1
+                    logging.error(f"Gave up writing the result of game {entry[0]['game_id']}")
+                else:
+                    self.queue.appendleft(entry)
+            return False
+        statuses = {item.get('idempotency_key'): item for item in response.get('results', [])}
+        for result, _ in entries:
+            item = statuses.get(result['idempotency_key'], {})
+            if item.get('status') in ('created', 'duplicate'):
+                self.written += 1
+            else:
+                self.rejected += 1
+                logging.error(f"Game history rejected the result of game {result['game_id']}: {item.get('error')}")
+        return True
+
+    # run method
+    # Sends the queued results every FLUSH_INTERVAL seconds, or as soon as a batch is full,
+    # and backs off while the game history service fails
+    async def run(self) -> None:
+        self._wakeup = asyncio.Event()
+        delay = RETRY_DELAY
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self.queue:
+                if await self.flush():
+                    delay = RETRY_DELAY
+                    continue
+                await self._sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    # drain method
+    # Tries to send everything that is still queued, called when the server shuts down
+    async def drain(self, deadline: float = REQUEST_TIMEOUT) -> None:
+        end = time.monotonic() + deadline
+        while self.queue and time.monotonic() < end:
+            if not await self.flush():
+                break
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import os
+import uvicorn
+
+# Runtime profile of the game server
+# GAME_SERVER_RUNTIME=fast (the default) runs the server on the fastest pieces that are installed:
+#   - orjson encodes and decodes every Socket.IO and Engine.IO packet, instead of the json module
+#   - the event loop is uvloop's, instead of asyncio's
+#   - uvicorn parses HTTP with httptools, instead of h11
+# Each falls back to the standard one, with a warning, when it is not installed.
+# GAME_SERVER_RUNTIME=standard always uses the standard ones, to compare the two
+# (see benchmarks/runtime.py and the --runtime option of benchmarks/loadtest.py).
+
+RUNTIME = os.environ.get('GAME_SERVER_RUNTIME', 'fast')
+
+orjson = None
+ORJSON_OPTIONS = 0
+uvloop = None
+httptools = None
+if RUNTIME == 'fast':
+    try:
+        import orjson
+        ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    except ImportError:
+        logging.warning("orjson is not installed, Socket.IO packets are encoded with the json module")
+    try:
+        import uvloop
+    except ImportError:
+        logging.warning("uvloop is not installed, running on the asyncio event loop")
+    try:
+        import httptools
+    except ImportError:
+        logging.warning("httptools is not installed, uvicorn parses HTTP with h11")
+
+
+# OrjsonModule class
+# The json module interface Socket.IO expects (dumps returning str, loads), backed by orjson
+# Arguments of the json module, like separators, are accepted and ignored, orjson always
+# writes compact JSON
+class OrjsonModule:
+    @staticmethod
+    def dumps(obj, **kwargs) -> str:
+        return orjson.dumps(obj, option=ORJSON_OPTIONS).decode()
+
+    @staticmethod
+    def loads(s, **kwargs):
+        return orjson.loads(s)
+
+
+# json_module function
+# Returns the json module the Socket.IO server should use, None for its default one
+def json_module():
+    return OrjsonModule() if orjson is not None else None
+
+
+# uvicorn_config function
+# Returns the uvicorn configuration of the game server on the given port
+# The event loop is not uvicorn's to choose, the server is served on the one run() started
+def uvicorn_config(app, port: int, log_config=None) -> uvicorn.Config:
+    return uvicorn.Config(
+        app, host='0.0.0.0', port=port, log_level="info", log_config=log_config,
+        http='httptools' if httptools is not None else 'h11',
+    )
+
+
+# run function
+# Runs the coroutine on the main thread until it returns, on uvloop's event loop if available
+def run(coroutine):
+    loop_factory = uvloop.new_event_loop if uvloop is not None else None
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        return runner.run(coroutine)
+
+
+# describe function
+# Returns what the runtime runs on, for logs and benchmark results
+def describe() -> dict:
+    return {
+        'runtime': RUNTIME,
+        'json': 'orjson' if orjson is not None else 'json',
+        'loop': 'uvloop' if uvloop is not None else 'asyncio',
+        'http': 'httptools' if httptools is not None else 'h11',
+    }
@@ -4,14 +4,29 @@ from game_logic.entities.player import Player
 from game_logic.game_defaults import *
 from game_logic.entities.ball import Ball
 import asyncio
-import threading
+import datetime
+import time
 import json
+import math
 import os
-import requests
 import uvicorn 
+import logging.config
 from server_utils import *
+from input_buffer import PlayerInputBuffer
+from rate_limit import rate_limited, rate_limiter
+from broadcast import GameBroadcaster, WIRE_JSON, WIRE_BINARY, WIRE_EVENTS, WIRE_FORMATS
+from binary_protocol import BINARY_SCHEMA_VERSION
+from supervisor import Supervisor, WORKERS, BASE_PORT, STATS_INTERVAL
+import runtime
+from auth import verify_token, is_authorized
+from pending_joins import GameRequest, pending_joins, SWEEP_INTERVAL
+from result_writer import result_key
+from recording import RECORDINGS_DIR, MatchRecorder, recording_path
 
-TOEKNSERVICE = os.environ.get('TOKEN_SERVICE')
+# Phases of a rally, see PongGame.step
+PHASE_SERVE = 'serve'
+PHASE_RALLY = 'rally'
+PHASE_POST_RALLY = 'post_rally'
 
 # PongGame class
 # Represents a game of Pong
@@ -19,16 +34,54 @@ TOEKNSERVICE = os.environ.get('TOKEN_SERVICE')
 #   - game_id: the ID of the game
 #   - game_state: the game state object
 #   - sids: a list of session IDs of the clients connected to the game
+#   - broadcaster: sends the game's messages to the sids through Socket.IO rooms
 #   - is_remote: a boolean indicating whether the game is remote or local
+#   - phase: the phase of the current rally (serve, rally or post_rally)
+#   - tick_rate: simulation ticks per second
+#   - snapshot_rate: game state messages per second, at most tick_rate
+#   - seed: seed of the game's random number generator, None for a random one
+#   - physics: the batch physics engine that moves the ball, None to move it with the entities
+#   - trajectory_changes: trajectory changes since the last flush, for the events wire format
+#   - recorder: records the game into a replay file (see recording.py), None when not recording
+#   - error: why the game loop failed, None if it did not
+#   - lease_lost: the node lost the game's lease, another node may be running it and writes its result
 class PongGame:
-    def __init__(self, game_id, player1_id, player2_id, is_remote):
+    def __init__(self, game_id, player1_id, player2_id, is_remote,
+                 tick_rate=TICK_RATE, snapshot_rate=SNAPSHOT_RATE, seed=None):
         self.game_id = game_id
-        self.game_state = self.init_game(game_id, player1_id, player2_id)
+        self.game_state = self.init_game(game_id, player1_id, player2_id, seed)
         self.sids = []
         self.sid_to_player_id = {}
+        self.broadcaster = GameBroadcaster(game_id)
         self.game_loop_task = None
         self.is_remote = is_remote
         self.is_quit = False
+        self.finished = None
+        self.tick = 0
+        self.input_seq = {}  # player ID -> sequence number of the last applied paddle_input
+        self.inputs = {  # player ID -> input queued since the last tick
+            player1_id: PlayerInputBuffer(),
+            player2_id: PlayerInputBuffer(),
+        }
+        self.tick_rate = tick_rate
+        self.snapshot_rate = min(snapshot_rate, tick_rate)
+        self.step_scale = BASE_TICK_RATE / tick_rate  # ball movement per tick, relative to the base rate
+        self.snapshot_interval = max(1, round(tick_rate / self.snapshot_rate))
+        self.next_snapshot_tick = 0
+        self.snapshot_forced = False
+        self.serve_delay_ticks = int(SERVE_DELAY * tick_rate)
+        self.post_rally_ticks = POST_RALLY_FRAMES * tick_rate // BASE_TICK_RATE
+        self.phase = PHASE_SERVE
+        self.phase_ticks = 0
+        self.state_changed = False
+        self.score_changed = False
+        self.physics = physics_engine
+        self.trajectory_changes = []
+        self.ball_delta = (None, None)  # ball deltas the last trajectory change was recorded with
+        self.paddle_velocity = [0.0, 0.0]  # units per second of player 1's and player 2's paddle
+        self.recorder = None
+        self.error = None
+        self.lease_lost = False
 
     # init_game method
     # Initializes the game state
@@ -36,6 +89,7 @@ class PongGame:
     #   - game_id: the ID of the game
     #   - player1_id: the ID of player 1
     #   - player2_id: the ID of player 2
+    #   - seed: seed of the game's random number generator
     # Returns:
     #   - a new GameState object
     # The game state is initialized with the given game ID, player IDs, and default values
@@ -43,92 +97,297 @@ class PongGame:
     # The ball is placed at the default starting position
     # The game state is returned
     # The game state is responsible for updating the game state and sending the updated state to the client
-    def init_game(self, game_id: int, player1_id: int, player2_id: int) -> GameState:
+    def init_game(self, game_id: int, player1_id: int, player2_id: int, seed=None) -> GameState:
         player1 = Player(player1_id, PLAYER1_START_X)
         player2 = Player(player2_id, PLAYER2_START_X)
         ball = Ball(BALL_DEFAULT_X, BALL_DEFAULT_Z, BALL_RADIUS, BALL_SPEED, BALL_DEFAULT_DIRECTION)
-        game_state = GameState(game_id, player1, player2, ball)
+        game_state = GameState(game_id, player1, player2, ball, seed)
         return game_state
 
     # add_player method
     # Adds a player session to the game
+    # The session joins the game's broadcast room of the wire format it asked for at connect
     async def add_player(self, sid, player_id):
         self.sids.append(sid)
         if self.is_remote:
             self.sid_to_player_id[sid] = player_id
+        await self.broadcaster.add(sid, sid_wire_format.get(sid, WIRE_JSON))
+        if self.broadcaster.has_format(WIRE_EVENTS):
+            self.record_trajectory('sync')
 
     # remove_player method
     # Removes a player session from the game
     async def remove_player(self, sid):
         if sid in self.sids:
             self.sids.remove(sid)
-            player_id = self.sid_to_player_id.pop(sid, None)
-     
+            self.sid_to_player_id.pop(sid, None)
+        await self.broadcaster.remove(sid)
+
     # game_loop method
     # Runs the game loop
-    # The game loop runs until the game is over
-    # The game loop updates the game state and sends the updated state to the client
-    # When goal is scored, the game is paused and the score is sent to the clients
-    # and the post-rally animation is run
-    # If game is not over, the game continues
+    # The game is registered with the shared tick scheduler, which calls step()
+    # and flush() on every tick, and this coroutine waits until the game is over
+    # Cancelling the game loop task removes the game from the scheduler
     async def game_loop(self) -> None:
-        while self.game_state.in_progress:
-            self.game_state.current_rally = 0
-            self.game_state.reset_ball()
-            await self.send_game_state_to_client()
-            await asyncio.sleep(1.0) # Little break before start of the rally
-            self.game_state.paused = False
-            while not self.game_state.paused:
-                await self.update_game_state()
-                await asyncio.sleep(0.016)  # Adjust this to control the speed of the animation
-            if self.game_state.current_rally > self.game_state.longest_rally:
-                self.game_state.longest_rally = self.game_state.current_rally
-            await self.send_score()
-            await self.post_rally_animation()
-            if self.game_state.is_game_over():
-                self.game_state.in_progress = False
-                break  # Ensure the loop exits once the game is over
-
+        self.finished = asyncio.get_running_loop().create_future()
+        self.start_rally()
+        tick_scheduler.register(self)
+        try:
+            await self.finished
+        finally:
+            tick_scheduler.unregister(self)
 
     # run_game method
     # Runs the game loop
     # When game loop is over, calls for end_game method
     async def run_game(self) -> None:
-        for sid in self.sids:
-            await sio.emit('game_start', {'type': 'game_start', 'gameId': self.game_id}, room=sid)
+        await self.broadcaster.send('game_start', {'type': 'game_start', 'gameId': self.game_id})
         await asyncio.sleep(1.0)
+        if RECORDINGS_DIR and self.game_state is not None:
+            self.start_recording(recording_path(self.game_id))
         self.game_loop_task = asyncio.create_task(self.game_loop())
         # Wait for the game loop to finish
-        await self.game_loop_task
+        try:
+            await self.game_loop_task
+        except Exception as e:
+            logging.error(f"Game loop for game {self.game_id} failed: {e}")
         # Call end_game after the
         await self.end_game()
 
+    # start_rally method
+    # Puts the ball back to the middle and waits SERVE_DELAY before the rally starts
+    def start_rally(self) -> None:
+        self.game_state.current_rally = 0
+        self.game_state.reset_ball()
+        self.phase = PHASE_SERVE
+        self.phase_ticks = self.serve_delay_ticks
+        self.state_changed = True
+        self.snapshot_forced = True
+        self.record_trajectory('serve')
+
+    # step method
+    # Advances the game by one tick, called by the tick scheduler
+    # The game goes through three phases for every rally:
+    #   - serve: little break before start of the rally
+    #   - rally: the ball is moving, until a goal is scored
+    #   - post_rally: the post-rally animation (aka ball going through the goal)
+    # If game is not over after the post-rally animation, the next rally is served
+    # Nothing is sent from here, flush() sends what the step produced
+    def step(self) -> None:
+        if not self.game_state.in_progress:
+            self.finish()
+            return
+        self.tick += 1
+        if self.apply_inputs():
+            self.state_changed = True
+        if self.phase == PHASE_SERVE:
+            self.phase_ticks -= 1
+            if self.phase_ticks <= 0:
+                self.game_state.paused = False
+                self.phase = PHASE_RALLY
+                self.snapshot_forced = True
+                self.record_trajectory('launch')
+        elif self.phase == PHASE_RALLY:
+            if self.physics is not None:
+                # the engine moves the ball once all games stepped, then calls physics_done
+                self.game_state.current_rally += 2
+                self.physics.submit(self, self.step_scale)
+            else:
+                self.update_game_state()
+                self.end_rally_tick()
+        elif self.phase == PHASE_POST_RALLY:
+            self.game_state.ball.update_position(self.step_scale)
+            self.state_changed = True
+            self.phase_ticks -= 1
+            if self.phase_ticks <= 0:
+                if self.game_state.is_game_over():
+                    self.game_state.in_progress = False
+                    self.finish()
+                else:
+                    self.start_rally()
+
+    # physics_done method
+    # Called by the batch physics engine after it moved the ball of this tick
+    def physics_done(self, goal: bool) -> None:
+        if goal:
+            self.game_state.paused = True
+        self.state_changed = True
+        self.end_rally_tick()
+
+    # end_rally_tick method
+    # Records the ball's trajectory change of this tick, if it bounced
+    # Ends the rally if the ball went through the goal in this tick
+    def end_rally_tick(self) -> None:
+        ball = self.game_state.ball
+        if (ball.delta_x, ball.delta_z) != self.ball_delta:
+            if self.game_state.bounce:
+                # the paddle the ball moves away from hit it last
+                player = self.game_state.player1 if ball.delta_x > 0 else self.game_state.player2
+                self.record_trajectory('paddle_bounce', player=player.id,
+                                       speed=ball.speed, direction=ball.direction)
+            else:
+                self.record_trajectory('wall_bounce')
+        if self.game_state.paused:
+            scorer = self.game_state.player2 if ball.x < 0 else self.game_state.player1
+            self.record_trajectory('goal', player=scorer.id)
+            if self.game_state.current_rally > self.game_state.longest_rally:
+                self.game_state.longest_rally = self.game_state.current_rally
+            self.score_changed = True
+            self.phase = PHASE_POST_RALLY
+            self.phase_ticks = self.post_rally_ticks
+
+    # apply_inputs method
+    # Applies the paddle input queued since the last tick, in one batch
+    # A paddle moves at most PADDLE_SPEED per base tick, held-key movement first,
+    # queued move_paddle deltas use what is left and the rest is dropped
+    # Returns True if a paddle moved
+    def apply_inputs(self) -> bool:
+        limit = PADDLE_SPEED * self.step_scale
+        moved = False
+        for index, player in enumerate((self.game_state.player1, self.game_state.player2)):
+            start_z = player.paddle.z
+            buffer = self.inputs[player.id]
+            direction, seq = buffer.take_direction()
+            if direction is not None:
+                player.paddle.direction = direction
+                self.input_seq[player.id] = seq
+            budget = limit
+            if player.paddle.move_held(self.step_scale):
+                moved = True
+                budget = 0.0
+            delta_z = buffer.take_deltas(budget)
+            if delta_z:
+                player.move_paddle(delta_z, self.step_scale)
+                moved = True
+            velocity = (player.paddle.z - start_z) * self.tick_rate
+            if velocity != self.paddle_velocity[index]:
+                self.paddle_velocity[index] = velocity
+                self.record_trajectory('paddle_velocity', player=player.id)
+        return moved
+
+    # record_trajectory method
+    # Records a change of the ball's or a paddle's trajectory in this tick
+    # kind: serve, launch, wall_bounce, paddle_bounce, paddle_velocity, goal or sync
+    def record_trajectory(self, kind: str, **details) -> None:
+        ball = self.game_state.ball
+        self.ball_delta = (ball.delta_x, ball.delta_z)
+        self.trajectory_changes.append({'kind': kind, 'tick': self.tick, **details})
+
+    # ball_velocity method
+    # Returns the ball's velocity in units per second, the ball does not move while it is served
+    def ball_velocity(self) -> tuple:
+        if self.phase == PHASE_SERVE:
+            return 0.0, 0.0
+        ball = self.game_state.ball
+        return ball.delta_x * BASE_TICK_RATE, ball.delta_z * BASE_TICK_RATE
+
+    # trajectory_event method
+    # Builds the 'trajectory' message for the events wire format
+    # It carries the changes since the last one and the state at the current tick, with
+    # velocities in units per second, so the client can extrapolate until the next one
+    def trajectory_event(self, changes: list) -> dict:
+        ball = self.game_state.ball
+        vx, vz = self.ball_velocity()
+        return {
+            'type': 'trajectory',
+            'gameId': self.game_id,
+            'tick': self.tick,
+            'serverTime': time.time() * 1000,
+            'tickRate': self.tick_rate,
+            'changes': changes,
+            'ball': {
+                'x': ball.x,
+                'z': ball.z,
+                'vx': vx,
+                'vz': vz,
+            },
+            'player1': {'z': self.game_state.player1.paddle.z, 'vz': self.paddle_velocity[0]},
+            'player2': {'z': self.game_state.player2.paddle.z, 'vz': self.paddle_velocity[1]},
+        }
+
+    # flush method
+    # Sends the updates produced since the last flush, called by the tick scheduler
+    # The game state is sent every snapshot_interval ticks, or right away when the
+    # ball was reset, launched or went through the goal
+    # If the scheduler had to catch up several ticks, only the latest state is sent
+    # Everything produced in the tick goes out together, see GameBroadcaster.flush
+    async def flush(self) -> None:
+        snapshot_due = self.snapshot_forced or self.score_changed or self.tick >= self.next_snapshot_tick
+        if self.state_changed and snapshot_due:
+            self.state_changed = False
+            self.snapshot_forced = False
+            self.next_snapshot_tick = self.tick + self.snapshot_interval
+            self.send_game_state_to_client()
+        if self.score_changed:
+            self.score_changed = False
+            self.send_score()
+        changes, self.trajectory_changes = self.trajectory_changes, []
+        if self.recorder is not None:
+            self.recorder.record(self, changes)
+        if changes and self.broadcaster.has_format(WIRE_EVENTS):
+            self.broadcaster.queue_trajectory(self.trajectory_event(changes))
+        await self.broadcaster.flush()
+
+    # start_recording method
+    # Records the game into a replay file from the next tick on
+    def start_recording(self, path: str) -> None:
+        try:
+            self.recorder = MatchRecorder(path, self.game_id, self.tick_rate,
+                                          self.game_state.player1.id, self.game_state.player2.id)
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not record game {self.game_id}: {e}")
+
+    # stop_recording method
+    # Ends the game's recording, if it is recorded
+    def stop_recording(self) -> None:
+        if self.recorder is None:
+            return
+        try:
+            self.recorder.close(self)
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not finish the recording of game {self.game_id}: {e}")
+        self.recorder = None
+
+    # finish method
+    # Lets game_loop return, so run_game can end the game
+    def finish(self) -> None:
+        if self.finished is not None and not self.finished.done():
+            self.finished.set_result(None)
+
+    # fail method
+    # Called by the tick scheduler when step raised an exception
+    def fail(self, error: Exception) -> None:
+        self.error = error
+        if self.finished is not None and not self.finished.done():
+            self.finished.set_exception(error)
+
     # update_game_state method
     # Updates the game state
     # The ball position is updated
     # Collisions are handled
     # The current rally is incremented
     # If a goal is scored, the game is paused
-    # The updated game state is sent to the client
-    async def update_game_state(self):
+    # The updated game state is sent to the clients on the next flush
+    def update_game_state(self):
         self.game_state.current_rally += 1
-        self.game_state.ball.update_position()
-        self.game_state.handle_collisions()
+        self.game_state.advance_ball(self.step_scale)
         self.game_state.current_rally += 1
         if self.game_state.check_goal():
             self.game_state.paused = True
-        await self.send_game_state_to_client()
- 
+        self.state_changed = True
+
     # send_game_state_to_client method
-    # Sends the game state to the client
+    # Queues the game state for the clients
     # The game state is sent as a JSON object
     # The JSON object contains the game ID, ball position, and player positions
-    # The JSON object is sent to each client session ID in
-    # the game instance's sids list
-    async def send_game_state_to_client(self):
+    # 'tick' and 'serverTime' (milliseconds) let clients interpolate between snapshots
+    # The JSON object is sent to the game's broadcast rooms on the next flush
+    def send_game_state_to_client(self):
         game_state_data = {
             'type': 'send_game_state',
             'gameId': self.game_state.game_id,
+            'tick': self.tick,
+            'serverTime': time.time() * 1000,
             'ballPosition': {
                 'x': self.game_state.ball.x,
                 'y': self.game_state.ball.y,
@@ -146,12 +405,13 @@ class PongGame:
                 'x': self.game_state.player2.paddle.x,
                 'z': self.game_state.player2.paddle.z,
             },
+            'player1Seq': self.input_seq.get(self.game_state.player1.id, 0),
+            'player2Seq': self.input_seq.get(self.game_state.player2.id, 0),
             'bounce' : self.game_state.bounce,
             'hitpos' : self.game_state.hitpos,
             'paused': self.game_state.paused,
         }
-        for sid in self.sids:
-            await sio.emit('send_game_state', game_state_data, room=sid)
+        self.broadcaster.queue('send_game_state', game_state_data)
 
     # end_game method
     # Ends the game
@@ -166,8 +426,15 @@ class PongGame:
                 await self.game_loop_task  # Await to handle cancellation gracefully
             except asyncio.CancelledError:
                 logging.info(f"Game loop for game {self.game_state.game_id} was cancelled.")
+            except Exception as e:
+                logging.error(f"Game loop for game {self.game_state.game_id} ended with an error: {e}")
         else:
             logging.warning("Game loop task is None; cannot await a non-existent task.")
+        self.stop_recording()
+        if self.error is not None:
+            metrics.games_dropped.inc()
+        else:
+            metrics.games_completed.inc()
         
         if self.game_state.player1.score > self.game_state.player2.score:
             winner = self.game_state.player1.id
@@ -184,38 +451,54 @@ class PongGame:
             "player1_hits": self.game_state.player1.hits,
             "player2_hits": self.game_state.player2.hits,
             "longest_rally": self.game_state.longest_rally,
-            "game_duration": GAME_DURATION - self.game_state.time_remaining
+            "game_duration": self.duration()
         }
-        for sid in self.sids:
-            await sio.emit('game_over', json_data, room=sid)
+        await self.broadcaster.send('game_over', json_data)
+        await self.broadcaster.close()
+        if self.is_remote and not self.lease_lost and result_writer.url is not None:
+            result_writer.put(self.game_result(json_data))
+        if cluster is not None:
+            await cluster.release_lease(self.game_id)
         self.sids.clear()  # Clear all session IDs from the game instance
         del active_games[self.game_id]  # Remove the game instance from the active games
         del self.game_state  # If possible, clear the game state
         print_active_games()
         
 
-    # post_rally_animation method
-    # Runs the post-rally animation (aka ball going through the goal)
-    # The ball position is updated for 40 frames
-    # The updated game state is sent to the clients each frame
-    async def post_rally_animation(self):
-        for _ in range(60):  # Adjust the range to control the duration of the animation
-            self.game_state.ball.update_position()
-            await self.send_game_state_to_client()
-            await asyncio.sleep(0.016)  # Adjust this to control the speed of the animation
-    
+    # duration method
+    # Returns how many seconds the game was played, from its first tick to its last
+    def duration(self) -> int:
+        return round(self.tick / self.tick_rate)
+
+    # game_result method
+    # Returns the result of the game as the game history service stores it
+    # Parameters:
+    #   - game_over: the game_over message sent to the clients
+    def game_result(self, game_over: dict) -> dict:
+        return {
+            "idempotency_key": result_key(self.game_id),
+            "game_id": self.game_id,
+            "winner_id": game_over["winner"],
+            "player1_score": game_over["player1_score"],
+            "player2_score": game_over["player2_score"],
+            "player1_hits": game_over["player1_hits"],
+            "player2_hits": game_over["player2_hits"],
+            "longest_rally": game_over["longest_rally"],
+            "game_duration": game_over["game_duration"],
+            "end_time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+
     # send_score method
-    # Sends the player scores to the clients
-    # The player scores are sent as a JSON object
-    async def send_score(self):
+    # Queues the player scores for the clients
+    # The player scores are sent as a JSON object on the next flush
+    def send_score(self):
         data = {
             'type': 'score',
             'gameId': self.game_state.game_id,
             'player1Score': self.game_state.player1.score,
             'player2Score': self.game_state.player2.score,
         }
-        for sid in self.sids:
-            await sio.emit('score', data, room=sid)
+        self.broadcaster.queue('score', data)
  
     async def cancel_game(self):
         # Mark the game as not in progress
@@ -230,6 +513,10 @@ class PongGame:
                 logging.info(f"Game loop for game {self.game_state.game_id} was cancelled.")
             except Exception as e:
                 logging.error(f"Error while awaiting game loop cancellation: {e}")
+        self.stop_recording()
+        metrics.games_cancelled.inc()
+        if cluster is not None:
+            await cluster.release_lease(self.game_id)
 
         # Notify all connected clients about the cancellation
         data = {
@@ -237,11 +524,11 @@ class PongGame:
             'gameId': self.game_state.game_id,
             'message': 'Game has been cancelled',
         }
-        for sid in self.sids:
-            try:
-                await sio.emit('cancel_game', data, room=sid)
-            except Exception as e:
-                logging.error(f"Error sending cancel_game message to {sid}: {e}")
+        try:
+            await self.broadcaster.send('cancel_game', data)
+        except Exception as e:
+            logging.error(f"Error sending cancel_game message for game {self.game_id}: {e}")
+        await self.broadcaster.close()
 
         # Clear all session IDs from the game instance
         self.sids.clear()
@@ -256,7 +543,8 @@ class PongGame:
     # handle_paddle_movement method
     # Handles paddle movement
     # The 'data' parameter is a dictionary containing the paddle movement data
-    async def handle_paddle_movement(self, sid, data):
+    # The movement is queued and applied at the start of the next tick (see apply_inputs)
+    def handle_paddle_movement(self, sid, data):
 
         if not isinstance(data, dict):  # Ensure data is a dictionary
             logging.error("Received data is not a dictionary")
@@ -282,23 +570,64 @@ class PongGame:
                     return
                 
                 p_delta_z = data.get('delta_z')
-                if player_id == self.game_state.player1.id:
-                    self.game_state.move_player(player_id, p_delta_z)
-                elif player_id == self.game_state.player2.id:
-                    self.game_state.move_player(player_id, p_delta_z)
-                else:
-                    logging.error(f"Player ID {player_id} not found in game state")
+                self.queue_move(player_id, p_delta_z)
             else:
                 player1_id = data.get('player1_id')
                 p1_delta_z = data.get('p1_delta_z')
                 player2_id = data.get('player2_id')
                 p2_delta_z = data.get('p2_delta_z')
                 if player1_id is not None and p1_delta_z is not None:
-                    self.game_state.move_player(player1_id, p1_delta_z)
+                    self.queue_move(player1_id, p1_delta_z)
                 
                 if player2_id is not None and p2_delta_z is not None:
-                    self.game_state.move_player(player2_id, p2_delta_z)
-        await self.send_game_state_to_client()
+                    self.queue_move(player2_id, p2_delta_z)
+
+    # queue_move method
+    # Queues a paddle delta of the given player for the next tick
+    # A delta is clamped to what a paddle can move in one tick
+    def queue_move(self, player_id, delta_z) -> None:
+        buffer = self.inputs.get(player_id)
+        if buffer is None:
+            logging.error(f"Player ID {player_id} not found in game state")
+            return
+        if not isinstance(delta_z, (int, float)) or isinstance(delta_z, bool) or not math.isfinite(delta_z):
+            logging.error(f"Invalid paddle delta for player {player_id}: {delta_z}")
+            return
+        limit = PADDLE_SPEED * self.step_scale
+        buffer.push_delta(max(-limit, min(limit, delta_z)))
+
+    # handle_paddle_input method
+    # Handles a held-key paddle input
+    # The 'data' parameter is a dictionary with the game_id, player_id, the direction
+    # the key is held in (-1, 0 for released, or 1) and the input's sequence number
+    # Clients only send this when the direction changes, the paddle keeps moving
+    # PADDLE_SPEED per tick in the held direction (see apply_inputs)
+    # Inputs with a sequence number not above the last received one are ignored,
+    # the last applied sequence number of each player is sent with the game state
+    # In remote games a session can only move the paddle of its own player
+    def handle_paddle_input(self, sid, data):
+        if not isinstance(data, dict) or getattr(self, 'game_state', None) is None:
+            return
+        if data.get('game_id') != self.game_state.game_id:
+            logging.error("Game ID does not match")
+            return
+        player_id = data.get('player_id')
+        direction = data.get('direction')
+        seq = data.get('seq')
+        if direction not in (-1, 0, 1) or not isinstance(seq, int):
+            logging.error(f"Invalid paddle input from {sid}: {data}")
+            return
+        if self.is_remote and self.sid_to_player_id.get(sid) != player_id:
+            logging.error(f"Session {sid} can not move the paddle of player {player_id}")
+            return
+        buffer = self.inputs.get(player_id)
+        if buffer is None:
+            logging.error(f"Player ID {player_id} not found in game state")
+            return
+        last_seq = buffer.seq if buffer.seq is not None else self.input_seq.get(player_id, -1)
+        if seq <= last_seq:
+            return
+        buffer.push_direction(direction, seq)
 
 def print_active_games():
     if active_games:
@@ -313,15 +642,29 @@ def print_active_games():
 # The 'sid' parameter is the session ID of the client
 # The 'environ' parameter contains information about the connection
 # such as the path, headers, and query parameters
+# The 'auth' parameter is the optional auth data sent by the client, its
+# 'wire_format' selects how game messages are delivered (see broadcast.py)
+# and its 'token' authenticates the session for the whole connection (see auth.py)
 @sio.event
-async def connect(sid, environ):
+async def connect(sid, environ, auth=None):
     logging.info(f'Client connected: {sid}, Path: {environ.get("PATH_INFO")}')
+    if isinstance(auth, dict) and auth.get('token'):
+        identity = verify_token(auth.get('token'))
+        if identity is not None:
+            sid_identity[sid] = identity
+    if isinstance(auth, dict) and auth.get('wire_format') in WIRE_FORMATS:
+        wire_format = auth.get('wire_format')
+        # Binary clients must speak the current snapshot schema, otherwise they get JSON
+        if wire_format != WIRE_BINARY or auth.get('schema') == BINARY_SCHEMA_VERSION:
+            sid_wire_format[sid] = wire_format
     json_data = {
         "type": "game_defaults",
         "PADDLE_WIDTH": PADDLE_WIDTH,
         "PADDLE_DEPTH": PADDLE_DEPTH,
         "BALL_RADIUS": BALL_RADIUS,
-        "PADDLE_SPEED": PADDLE_SPEED
+        "PADDLE_SPEED": PADDLE_SPEED,
+        "WIRE_FORMAT": sid_wire_format.get(sid, WIRE_JSON),
+        "BINARY_SCHEMA_VERSION": BINARY_SCHEMA_VERSION
     }
     await sio.emit('game_defaults', json_data, room=sid)
 
@@ -333,12 +676,22 @@ async def connect(sid, environ):
 @sio.event
 async def disconnect(sid):
     logging.info(f'Disconnect: {sid}')
+    sid_wire_format.pop(sid, None)
+    sid_identity.pop(sid, None)
+    rate_limiter.forget(sid)
+    request = pending_joins.remove_sid(sid)
+    if request is not None and cluster is not None:
+        await cluster.cancel_request(request.game_id, request.player1_id, request.player2_id, sid)
+    await leave_spectator_feed(sid)
+    if await forward_event(sid, 'disconnect'):
+        sid_to_node.pop(sid, None)
+        return
     if sid in sid_to_game:
         game_id = sid_to_game.pop(sid, None)
         if game_id is not None and game_id in active_games:
             game_instance = active_games[game_id]
             if sid in game_instance.sids:
-                game_instance.sids.remove(sid)
+                await game_instance.remove_player(sid)
                 if game_instance.is_remote and not game_instance.is_quit and game_instance.sids.__len__() == 1:
                     await game_instance.cancel_game()
                 elif game_instance.sids.__len__() == 0:
@@ -347,10 +700,11 @@ async def disconnect(sid):
 
 # Event handler for messages
 # This function is called when a client sends a message to the server
-# Logs the message, doesnt do anything else
+# Logs the message at debug level, doesnt do anything else
 @sio.event
+@rate_limited('message')
 async def message(sid, data):
-    logging.info(f"Message received from {sid}: {data}")
+    logging.debug(f"Message received from {sid}: {data}")
 
 
 
@@ -362,6 +716,7 @@ async def message(sid, data):
 # The game instance is started in a separate task
 # Currently this only handles the local game
 @sio.event
+@rate_limited('start_game')
 async def start_game(sid, data):
     # Log the received data
     logging.info(f"Start game request from {sid}: {data}")
@@ -374,14 +729,21 @@ async def start_game(sid, data):
     player1_id = data.get('player1_id')
     player2_id = data.get('player2_id')
     is_remote = data.get('is_remote')
+    rates = game_rates(data)
+    if rates is None:
+        await sio.emit('error', {'message': 'Invalid tick_rate or snapshot_rate'}, room=sid)
+        return
+    tick_rate, snapshot_rate = rates
     if game_id in active_games:
         await active_games[game_id].end_game()
         del active_games[game_id]
+    if await claim_game(game_id, sid) is False:
+        return
     # Create a new game instance
     try:
-        game_instance = PongGame(game_id, player1_id, player2_id, is_remote)
+        game_instance = PongGame(game_id, player1_id, player2_id, is_remote, tick_rate, snapshot_rate)
         active_games[game_id] = game_instance  # Track game instance by game_id
-        game_instance.sids = [sid]  # Initialize with the current session id
+        await game_instance.add_player(sid, player1_id)  # Initialize with the current session id
         sid_to_game[sid] = game_id
         
         # Start the game in a separate task
@@ -391,15 +753,27 @@ async def start_game(sid, data):
         await sio.emit('error', {'message': 'Error starting game'}, room=sid)
 
 
-async def start_online_game(p1_sid, p2_sid, game_id, player1_id, player2_id):
+# claim_game function
+# In clustered mode, takes the ownership lease of a game so that no other node runs it
+# Returns False, and tells the client, if another node already runs the game
+async def claim_game(game_id, sid):
+    if cluster is None or await cluster.acquire_lease(game_id):
+        return True
+    await sio.emit('error', {'message': 'Game ID already in use'}, room=sid)
+    logging.error(f"Game ID {game_id} is already run by node {await cluster.owner(game_id)}")
+    return False
+
+async def start_online_game(p1_sid, p2_sid, game_id, player1_id, player2_id,
+                            tick_rate=TICK_RATE, snapshot_rate=SNAPSHOT_RATE):
+    if await claim_game(game_id, p1_sid) is False:
+        return
 
     # Create a new game instance
     try:
-        game_instance = PongGame(game_id, player1_id, player2_id, True)
+        game_instance = PongGame(game_id, player1_id, player2_id, True, tick_rate, snapshot_rate)
         active_games[game_id] = game_instance  # Track game instance by game_id
-        game_instance.sids = [p1_sid, p2_sid]  # Initialize with the current session id
-        #game_instance.add_player(p1_sid, player1_id)
-        #game_instance.add_player(p2_sid, player2_id)
+        await game_instance.add_player(p1_sid, player1_id)
+        await game_instance.add_player(p2_sid, player2_id)
         sid_to_game[p1_sid] = game_id
         sid_to_game[p2_sid] = game_id
         
@@ -409,16 +783,23 @@ async def start_online_game(p1_sid, p2_sid, game_id, player1_id, player2_id):
         logging.error(f"Error starting game: {e}")
         await sio.emit('error', {'message': 'Error starting game'}, room=sid)
 
-def validate_token(id, token):
-    if token:
-        data = {"id" : id, "access" : token, "is_frontend" : True}
-        response = requests.post(f"{TOEKNSERVICE}/auth/token/validate-token/", data=data)
-        response_data = response.json()
-        if "error" not in response_data:
-            return True
-    return False
+# authenticate function
+# Checks that the session is authenticated as the given player, without leaving the event loop
+# Sessions authenticate with the token of their handshake, sessions that connected without
+# one authenticate with the token of their first join_game
+# Once the session's identity has expired, the token of its next join_game replaces it
+# Returns False if the token is invalid, expired or revoked, or belongs to another player
+def authenticate(sid, player_id, token=None):
+    identity = sid_identity.get(sid)
+    if identity is None or identity.expires_at <= time.time():
+        identity = verify_token(token)
+        if identity is None:
+            return False
+        sid_identity[sid] = identity
+    return is_authorized(identity, player_id, denylist)
 
 @sio.event
+@rate_limited('join_game')
 async def join_game(sid, data):
     # Log the received data
     
@@ -433,10 +814,17 @@ async def join_game(sid, data):
     is_remote = data.get('is_remote')
     token = data.get('token')
 
-    if validate_token(local_player_id, token) is False:
+    if authenticate(sid, local_player_id, token) is False:
         await sio.emit('invalid_token', room=sid)
         return
-    couple = coupled_request(game_id, player1_id, player2_id)
+    rates = game_rates(data)
+    if rates is None:
+        await sio.emit('error', {'message': 'Invalid tick_rate or snapshot_rate'}, room=sid)
+        return
+    if cluster is not None:
+        await join_clustered_game(sid, game_id, local_player_id, player1_id, player2_id, rates)
+        return
+    couple = pending_joins.pair(game_id, player1_id, player2_id, local_player_id)
     if couple is not None:
         if player1_id == local_player_id:
             player1_sid = sid
@@ -444,33 +832,97 @@ async def join_game(sid, data):
         else:
             player1_sid = couple.sid
             player2_sid = sid
-        await start_online_game(player1_sid, player2_sid, game_id, player1_id, player2_id)
+        await start_online_game(player1_sid, player2_sid, game_id, player1_id, player2_id, *rates)
     else: 
-        game_request = GameRequest(sid, game_id, player1_id, player2_id, is_remote)
-        remote_game_requests.append(game_request)
+        pending_joins.add(GameRequest(sid, game_id, player1_id, player2_id, local_player_id, is_remote))
         return
 
+# join_clustered_game function
+# Pairs a join_game request through the cluster's shared request index
+# The node of the second player runs the game, if the first player is connected to another
+# node, that node is told to forward the first player's game events here
+async def join_clustered_game(sid, game_id, local_player_id, player1_id, player2_id, rates):
+    sid_to_node.pop(sid, None)  # a new game, the session's last one may have run elsewhere
+    partner = await cluster.pair_request(game_id, player1_id, player2_id, sid, local_player_id,
+                                         sid_wire_format.get(sid, WIRE_JSON))
+    if partner is None:
+        # Also waits here, only for the request to be cancelled when it times out
+        pending_joins.add(GameRequest(sid, game_id, player1_id, player2_id, local_player_id, True))
+        return
+    partner_sid = partner['sid']
+    if partner['node'] == cluster.node_id:
+        pending_joins.remove_sid(partner_sid)
+    else:
+        sid_wire_format[partner_sid] = partner['wire_format']
+        await cluster.forward(partner['node'], 'game_joined', partner_sid, {'game_id': game_id})
+    if player1_id == local_player_id:
+        await start_online_game(sid, partner_sid, game_id, player1_id, player2_id, *rates)
+    else:
+        await start_online_game(partner_sid, sid, game_id, player1_id, player2_id, *rates)
+
+# forward_event function
+# In clustered mode, sends the event of a session whose game runs on another node to that node
+# Returns True if the event was forwarded, and must not be handled here
+async def forward_event(sid, event, data=None):
+    node = sid_to_node.get(sid)
+    if node is None:
+        return False
+    await cluster.forward(node, event, sid, data)
+    return True
+
 # This function is called when a client sends a move_paddle message to the server
 # The 'data' parameter is a dictionary containing the paddle movement data
 # The 'sid' parameter is the session ID of the client
 # The function retrieves the game instance associated with the session ID
 # and calls the handle_paddle_movement method on the game instance
 # If no active game instance is found, an error message is logged
-# The game instance is responsible for updating the game state and sending the updated state to the client
-# The game state is updated in a separate task to avoid blocking the event loop
+# The movement is queued and applied on the next tick, nothing is sent back from here
 @sio.event
+@rate_limited('move_paddle')
 async def move_paddle(sid, data):
+    if await forward_event(sid, 'move_paddle', data):
+        return
     game_id = sid_to_game.get(sid)
     if game_id in active_games:
         game_instance = active_games[game_id]
-        await game_instance.handle_paddle_movement(sid, data)
+        game_instance.handle_paddle_movement(sid, data)
+    else:
+        await sio.emit('error', {'message': 'No active game instance'}, room=sid)
+        logging.error(f"No active game instance for sid: {sid}")
+
+# Event handler for ack_snapshot message
+# Clients using the delta wire format acknowledge the tick of the snapshots they received,
+# the following snapshots are delta compressed against it
+@sio.event
+@rate_limited('ack_snapshot')
+async def ack_snapshot(sid, data):
+    if await forward_event(sid, 'ack_snapshot', data):
+        return
+    game_id = sid_to_game.get(sid)
+    if game_id in active_games and isinstance(data, dict):
+        active_games[game_id].broadcaster.ack(sid, data.get('tick'))
+
+# Event handler for paddle_input message
+# Held-key input: clients send the direction a paddle key is held in, only when it changes
+# The paddle is moved by the tick loop, nothing is sent back from here
+@sio.event
+@rate_limited('paddle_input')
+async def paddle_input(sid, data):
+    if await forward_event(sid, 'paddle_input', data):
+        return
+    game_id = sid_to_game.get(sid)
+    if game_id in active_games:
+        active_games[game_id].handle_paddle_input(sid, data)
     else:
         await sio.emit('error', {'message': 'No active game instance'}, room=sid)
         logging.error(f"No active game instance for sid: {sid}")
 
 @sio.event
+@rate_limited('quit_game')
 async def quit_game(sid, data):
     logging.info(f"Quit game request from {sid}: {data}")
+    if await forward_event(sid, 'quit_game', data):
+        return
     
     game_id = data.get('game_id')
     player_id = data.get('player_id')
@@ -506,10 +958,7 @@ async def quit_game(sid, data):
         }
 
         # Emit the `quit_game` event to all connected clients in the game session
-        for receiver_sid in game_instance.sids:
-            if receiver_sid == sid:
-                continue
-            await sio.emit('quit_game', json_data, room=receiver_sid)
+        await game_instance.broadcaster.send('quit_game', json_data, skip_sid=sid)
 
         # End the game and remove it from active games
         await game_instance.end_game()
@@ -519,28 +968,213 @@ async def quit_game(sid, data):
     else:
         logging.error(f"Game ID {game_id} not found.")
 
+# Event handler for list_games message
+# Sends the client the games running on this server, for spectators to pick one
+@sio.event
+@rate_limited('list_games')
+async def list_games(sid, data=None):
+    games = [
+        {
+            "gameId": game_id,
+            "player1Id": game.game_state.player1.id,
+            "player2Id": game.game_state.player2.id,
+            "player1Score": game.game_state.player1.score,
+            "player2Score": game.game_state.player2.score,
+            "isRemote": game.is_remote,
+            "spectators": len(game.broadcaster.spectators.sids),
+        }
+        for game_id, game in active_games.items() if game.game_state is not None
+    ]
+    await sio.emit('game_list', {"type": "game_list", "games": games}, room=sid)
+
+# Event handler for spectate message
+# Subscribes the client to a game's spectator feed, see SpectatorFeed in broadcast.py
+# Spectators get 'spectator_frame' events, with fewer game states than the players and a bit late
+@sio.event
+@rate_limited('spectate')
+async def spectate(sid, data):
+    game_id = data.get('game_id') if isinstance(data, dict) else None
+    game_instance = active_games.get(game_id)
+    if game_instance is None or game_instance.game_state is None:
+        await sio.emit('error', {'message': 'No active game instance'}, room=sid)
+        return
+    if sid in game_instance.sids:
+        await sio.emit('error', {'message': 'Players can not spectate their own game'}, room=sid)
+        return
+    await leave_spectator_feed(sid)
+    feed = game_instance.broadcaster.spectators
+    await feed.add(sid)
+    sid_spectating[sid] = game_id
+    json_data = {
+        "type": "spectating",
+        "gameId": game_id,
+        "player1Id": game_instance.game_state.player1.id,
+        "player2Id": game_instance.game_state.player2.id,
+        "snapshotRate": feed.rate,
+        "delay": feed.delay,
+    }
+    await sio.emit('spectating', json_data, room=sid)
+
+# Event handler for stop_spectating message
+# Unsubscribes the client from the game it watches
+@sio.event
+@rate_limited('stop_spectating')
+async def stop_spectating(sid, data=None):
+    await leave_spectator_feed(sid)
+
+# leave_spectator_feed function
+# Removes a session from the spectators of the game it watches, if any
+async def leave_spectator_feed(sid):
+    game_id = sid_spectating.pop(sid, None)
+    if game_id in active_games:
+        await active_games[game_id].broadcaster.spectators.remove(sid)
+
 # Event handler for test message
 # This function is called when a client sends a test message to the server
 @sio.event
+@rate_limited('test')
 async def test(sid):
     await sio.emit('test', {'message': 'Test message'}, room=sid)
 
-def start_uvicorn():
-    uvicorn.run(app, host='0.0.0.0', port=8010, log_level="info", log_config=logging_config)
+# Game events of sessions connected to other nodes, handled here when forwarded to this node
+FORWARDED_EVENTS = {
+    'move_paddle': move_paddle,
+    'paddle_input': paddle_input,
+    'ack_snapshot': ack_snapshot,
+    'quit_game': quit_game,
+}
+
+# handle_forwarded function
+# Handles an event forwarded to this node by another node of the cluster
+#   - game_joined: the session is connected here, but its game runs on the sending node
+#   - disconnect: the session's connection to the sending node is gone
+#   - anything else is a game event of the session, handled as if it was received here
+async def handle_forwarded(event, sid, data, node):
+    if event == 'game_joined':
+        pending_joins.remove_sid(sid)
+        sid_to_node[sid] = node
+    elif event == 'disconnect':
+        await disconnect(sid)
+    elif event in FORWARDED_EVENTS:
+        await FORWARDED_EVENTS[event](sid, data)
+
+# lease_lost function
+# Stops a game whose lease this node could not renew, another node may be running it now
+async def lease_lost(game_id):
+    logging.error(f"Lost the lease of game {game_id}, stopping it")
+    if game_id in active_games:
+        active_games[game_id].lease_lost = True
+        active_games[game_id].fail(RuntimeError('game lease lost'))
+
+# start_background_tasks function
+# Runs when the server starts: watches the event loop's lag, cancels join requests that time
+# out, writes game results, keeps the token denylist fresh and, in clustered mode, listens to
+# the events forwarded to this node and renews its game leases
+async def start_background_tasks():
+    loop_watchdog.start()
+    asyncio.create_task(sweep_pending_joins())
+    if result_writer.url is not None:
+        asyncio.create_task(result_writer.run())
+    if denylist.url is not None:
+        asyncio.create_task(denylist.keep_fresh())
+    if cluster is not None:
+        asyncio.create_task(cluster.listen(handle_forwarded))
+        asyncio.create_task(cluster.keep_leases(lease_lost))
+        logging.info(f"Game server node {cluster.node_id} joined the cluster")
 
-async def check_timed_out_requests():
-    for request in remote_game_requests[:]: #make a shallow coppy so it doesnt affect current for loop
-        if await request.has_timed_out() is True:
-            remote_game_requests.remove(request)
+# stop_background_tasks function
+# Runs when the server shuts down, writes the game results that are still queued
+async def stop_background_tasks():
+    loop_watchdog.stop()
+    if result_writer.url is not None:
+        await result_writer.drain()
 
+app.on_startup = start_background_tasks
+app.on_shutdown = stop_background_tasks
 
+# sweep_pending_joins function
+# Cancels the join_game requests that waited too long for their other player
+async def sweep_pending_joins():
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        for request in pending_joins.expired():
+            try:
+                await request.cancel()
+            except Exception as e:
+                logging.error(f"Could not cancel the request of game {request.game_id}: {e}")
+
+
+# Gauges of the metrics endpoint, read when it is scraped
+metrics.add_gauge('pong_active_games', 'Games running on this server', lambda: len(active_games))
+metrics.add_gauge('pong_game_sessions', 'Sessions playing a game', lambda: len(sid_to_game))
+metrics.add_gauge('pong_spectators', 'Sessions spectating a game', lambda: len(sid_spectating))
+metrics.add_gauge('pong_pending_join_requests', 'join_game requests waiting for their other player',
+                  lambda: len(pending_joins))
+metrics.add_gauge('pong_queued_results', 'Game results waiting to be written', lambda: len(result_writer))
+
+# worker_stats function
+# Returns the stats of this server process, reported to the supervisor in sharded mode
+def worker_stats(index):
+    return {
+        'worker': index,
+        'pid': os.getpid(),
+        'active_games': len(active_games),
+        'sessions': len(sid_to_game),
+        'spectators': sum(len(game.broadcaster.spectators.sids) for game in active_games.values()),
+        'pending_requests': len(pending_joins),
+        'queued_results': len(result_writer),
+        'dropped_results': result_writer.dropped,
+        'scheduled_games': len(tick_scheduler),
+        'tick': tick_scheduler.tick,
+        'skipped_ticks': tick_scheduler.skipped_ticks,
+        'dropped_messages': sum(rate_limiter.dropped.values()),
+        'disconnected_sessions': rate_limiter.disconnected,
+        'time': time.time(),
+    }
+
+# report_stats function
+# Sends this worker's stats to the supervisor every STATS_INTERVAL seconds
+async def report_stats(index, stats_queue):
+    while True:
+        try:
+            stats_queue.put_nowait(worker_stats(index))
+        except Exception as e:
+            logging.error(f"Could not report worker stats: {e}")
+        await asyncio.sleep(STATS_INTERVAL)
+
+# serve_worker function
+# Runs one worker of the sharded game server (see supervisor.py) on the given port
+async def serve_worker(index, port, stats_queue):
+    config = runtime.uvicorn_config(app, port, logging_config)
+    reporter = asyncio.create_task(report_stats(index, stats_queue))
+    try:
+        await uvicorn.Server(config).serve()
+    finally:
+        reporter.cancel()
+        await drain_results()
+
+# drain_results function
+# Writes the game results that are still queued, when the server stops
+# The lifespan shutdown already did unless it did not run, e.g. when startup failed
+async def drain_results():
+    if result_writer.url is not None and len(result_writer):
+        await result_writer.drain()
+
+# main function
+# Runs the game server on the main thread's event loop, uvicorn handles SIGINT and SIGTERM
+# and shuts the server down cleanly (see stop_background_tasks)
 async def main():
-    uvicorn_thread = threading.Thread(target=start_uvicorn, daemon=True)
-    uvicorn_thread.start()
-    # while 1:
-    #      await check_timed_out_requests()
-    uvicorn_thread.join()
+    server = uvicorn.Server(runtime.uvicorn_config(app, BASE_PORT, logging_config))
+    logging.info(f"Game server runtime: {runtime.describe()}")
+    try:
+        await server.serve()
+    finally:
+        await drain_results()
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    if WORKERS > 1:
+        logging.config.dictConfig(logging_config)
+        Supervisor(WORKERS).run()
+    else:
+        runtime.run(main())
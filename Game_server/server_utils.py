@@ -1,51 +1,53 @@
 import socketio
-import time
 import json
 import logging
 import socketio
 import os
+from game_logic.game_defaults import TICK_RATE, SNAPSHOT_RATE, MAX_TICK_RATE
+from tick_scheduler import TickScheduler
+from cluster import REDIS_URL, Cluster, client_manager
+from auth import Denylist
+from result_writer import ResultWriter
+from runtime import json_module
+from metrics import Metrics, MetricsApp
+from watchdog import LoopWatchdog
+from service_config import logging_config, full_host_url
 
 # Define a dictionary to store active game instances
 active_games = {}
 
-# This will hold all the pendind game requests
-remote_game_requests = []
-
-# Define custom logging configuration
-logging_config = {
-    'version': 1,
-    'disable_existing_loggers': False,
-    'handlers': {
-        'default': {
-            'level': 'INFO',
-            'formatter': 'default',
-            'class': 'logging.StreamHandler',
-        },
-        'uvicorn_access': {
-            'level': 'ERROR',  # Set to ERROR to suppress lower-level logs
-            'class': 'logging.StreamHandler',
-        },
-    },
-    'loggers': {
-        '': {
-            'handlers': ['default'],
-            'level': 'INFO',
-        },
-        'uvicorn.access': {
-            'handlers': ['uvicorn_access'],
-            'level': 'ERROR',
-            'propagate': False,
-        },
-    },
-    'formatters': {
-        'default': {
-            'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        },
-    },
-}
-
-HOSTNAME = os.environ.get("HOSTNAME")
-full_host_url = f"https://{HOSTNAME}:3000"
+# Metrics of the server, served on /metrics (see metrics.py)
+metrics = Metrics()
+
+# Measures the event loop's lag and logs the stack of whatever blocks it (see watchdog.py)
+loop_watchdog = LoopWatchdog(metrics)
+
+# Shared clock that advances every active game once per tick
+tick_scheduler = TickScheduler(MAX_TICK_RATE, metrics=metrics)
+
+# Physics engine of the games, 'object' steps every game's entities on their own,
+# 'batch' advances all rallies of a tick with one vectorized step (needs numpy)
+PHYSICS_ENGINE = os.environ.get('PHYSICS_ENGINE', 'object')
+physics_engine = None
+if PHYSICS_ENGINE == 'batch':
+    try:
+        from game_logic.batch_engine import BatchPhysicsEngine
+        physics_engine = BatchPhysicsEngine()
+        tick_scheduler.add_tick_hook(physics_engine.run)
+    except ImportError as e:
+        logging.warning(f"Batch physics engine not available, using the object engine: {e}")
+
+# Clustered mode (see cluster.py), with REDIS_URL set games are shared with the other nodes
+# through Redis, otherwise the server runs standalone and cluster stays None
+cluster = None
+cluster_manager = None
+if REDIS_URL:
+    try:
+        cluster = Cluster.from_url(REDIS_URL)
+        cluster_manager = client_manager(REDIS_URL)
+    except ImportError as e:
+        logging.warning(f"Redis client not available, running standalone: {e}")
+        cluster = None
 
 # Create a new ASGI application using the Socket.IO server
 # The 'async_mode' parameter is set to 'asgi' to use the ASGI server
@@ -56,54 +58,53 @@ sio = socketio.AsyncServer(
     logger=False,              # Disable Socket.IO logging
     engineio_logger=False,      # Disable engineio logging
     ping_interval=10,
-    ping_timeout=5
+    ping_timeout=5,
+    client_manager=cluster_manager,  # None for the default in-process manager
+    json=json_module(),              # orjson in the fast runtime profile, see runtime.py
 )
 # Create an ASGI application using the Socket.IO server
 # This application can be run using an ASGI server such as Uvicorn
-app = socketio.ASGIApp(sio)
+# Requests outside of Socket.IO's path go to the metrics endpoint
+app = socketio.ASGIApp(sio, other_asgi_app=MetricsApp(metrics))
+metrics.add_gauge('pong_connected_sessions', 'Socket.IO sessions connected', lambda: len(sio.eio.sockets))
 
 
 # Define a dictionary to store the game instance associated with each session ID
 sid_to_game = {}
 
+# Wire format each session asked for at connect, sessions not in here use plain JSON events
+sid_wire_format = {}
+
+# Game each spectating session watches
+sid_spectating = {}
+
+# Identity each session authenticated with at connect (or at its first join_game), see auth.py
+sid_identity = {}
+
+# Tokens revoked by the token service, refreshed in the background
+denylist = Denylist()
+
+# Results of finished remote games, written to the game history service in the background
+result_writer = ResultWriter()
+
+# Node that runs the game of each session connected here whose game runs on another node,
+# the session's game events are forwarded to it (clustered mode only)
+sid_to_node = {}
 
-class GameRequest:
-    def __init__(self, sid, game_id: int, player1_id, player2_id, is_remote):
-        self.time_stamp = time.time()
-        self.game_id = game_id
-        self.sid = sid
-        self.player1_id = player1_id
-        self.player2_id = player2_id
-        self.is_remote = is_remote
-
-    async def has_timed_out(self):
-        curr_time = time.time()
-        if (curr_time - self.time_stamp) > 10.0:
-            logging.info("Request game has timed out, sending cancel_game!\n")
-            json_data = {
-                    "type": "cancel_game",
-                    "gameId": self.game_id,
-                    }
-            await sio.emit('cancel_game', json_data, room=self.sid)
-            return True
-        return False
-
-    def is_a_match(self, game_id, player1_id, player2_id):
-        if (
-                self.game_id == game_id and
-                self.player1_id == player1_id and
-                self.player2_id == player2_id
-            ):
-            return True
-        else:
-            return False
 
-def coupled_request(game_id, player1_id, player2_id):
-    for instance in remote_game_requests:
-        if instance.is_a_match(game_id, player1_id, player2_id):
-            remote_game_requests.remove(instance)
-            return instance
-    return None
+# Function reads the optional 'tick_rate' and 'snapshot_rate' of a game from its start data
+# The tick rate must divide MAX_TICK_RATE and the snapshot rate can not be above the tick rate
+# Returns (tick_rate, snapshot_rate), or None if the rates are invalid
+def game_rates(data):
+    tick_rate = data.get('tick_rate') or TICK_RATE
+    snapshot_rate = data.get('snapshot_rate') or min(SNAPSHOT_RATE, tick_rate)
+    if not isinstance(tick_rate, int) or not isinstance(snapshot_rate, int):
+        return None
+    if tick_rate <= 0 or MAX_TICK_RATE % tick_rate != 0:
+        return None
+    if snapshot_rate <= 0 or snapshot_rate > tick_rate:
+        return None
+    return tick_rate, snapshot_rate
 
 
 #Function Validates the data received from the frontend before the start of the game
@@ -0,0 +1,41 @@
+import os
+
+# Settings shared by the game server and the replay service (replay_service.py)
+# Importing this module has no side effects, unlike server_utils, which creates the game
+# server's Socket.IO server, tick scheduler, metrics and Redis cluster.
+
+# Define custom logging configuration
+logging_config = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'default': {
+            'level': 'INFO',
+            'formatter': 'default',
+            'class': 'logging.StreamHandler',
+        },
+        'uvicorn_access': {
+            'level': 'ERROR',  # Set to ERROR to suppress lower-level logs
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        '': {
+            'handlers': ['default'],
+            'level': 'INFO',
+        },
+        'uvicorn.access': {
+            'handlers': ['uvicorn_access'],
+            'level': 'ERROR',
+            'propagate': False,
+        },
+    },
+    'formatters': {
+        'default': {
+            'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        },
+    },
+}
+
+HOSTNAME = os.environ.get("HOSTNAME")
+full_host_url = f"https://{HOSTNAME}:3000"
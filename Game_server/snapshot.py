@@ -0,0 +1,113 @@
+from collections import OrderedDict
+
+# Fields of a snapshot, in the order they are stored
+SNAPSHOT_FIELDS = (
+    'ball_x', 'ball_y', 'ball_z', 'ball_dx', 'ball_dz',
+    'p1_x', 'p1_z', 'p2_x', 'p2_z',
+    'bounce', 'hitpos', 'paused', 'p1_seq', 'p2_seq',
+)
+
+KEYFRAME_INTERVAL = 60  # ticks between two keyframes
+SNAPSHOT_HISTORY = 64   # how many sent snapshots are kept as possible baselines
+
+
+# flatten_state function
+# Turns a 'send_game_state' message into a tuple of SNAPSHOT_FIELDS values
+def flatten_state(state: dict) -> tuple:
+    ball = state['ballPosition']
+    delta = state['ballDelta']
+    player1 = state['player1Pos']
+    player2 = state['player2Pos']
+    return (
+        ball['x'], ball['y'], ball['z'], delta['dx'], delta['dz'],
+        player1['x'], player1['z'], player2['x'], player2['z'],
+        state['bounce'], state['hitpos'], state['paused'],
+        state['player1Seq'], state['player2Seq'],
+    )
+
+
+# SnapshotEncoder class
+# Delta compresses a game's snapshots against the last snapshot each client acknowledged
+# Clients acknowledge the tick of the snapshots they received (see the ack_snapshot event),
+# the next snapshot for them only carries the fields that changed since that tick.
+# Clients without a usable baseline (new, reconnected, or too far behind) get a keyframe,
+# and everyone gets a keyframe every KEYFRAME_INTERVAL ticks.
+# Clients with the same baseline share one payload, so it is encoded once per baseline.
+# Properties:
+#   - acks: session ID -> last acknowledged tick, None until the first ack
+#   - history: tick -> flat snapshot, the last SNAPSHOT_HISTORY sent snapshots
+class SnapshotEncoder:
+    def __init__(self, keyframe_interval: int = KEYFRAME_INTERVAL, history_size: int = SNAPSHOT_HISTORY):
+        self.keyframe_interval: int = keyframe_interval
+        self.history_size: int = history_size
+        self.acks: dict = {}
+        self.history: OrderedDict = OrderedDict()
+        self._last_keyframe = None
+
+    def add(self, sid) -> None:
+        self.acks[sid] = None
+
+    def remove(self, sid) -> None:
+        self.acks.pop(sid, None)
+
+    # ack method
+    # Records that a client received the snapshot of the given tick
+    # Acks for snapshots that were never sent or are older than the current one are ignored
+    def ack(self, sid, tick) -> None:
+        if sid not in self.acks or tick not in self.history:
+            return
+        current = self.acks[sid]
+        if current is None or tick > current:
+            self.acks[sid] = tick
+
+    # encode method
+    # Stores the snapshot of the given tick and returns the payloads to send
+    # Returns a list of (payload, sids) pairs
+    def encode(self, tick: int, state: dict) -> list:
+        snapshot = flatten_state(state)
+        keyframe_due = self._last_keyframe is None or tick - self._last_keyframe >= self.keyframe_interval
+        groups = {}
+        for sid, acked in self.acks.items():
+            baseline = None if keyframe_due or acked not in self.history else acked
+            groups.setdefault(baseline, []).append(sid)
+        payloads = []
+        for baseline, sids in groups.items():
+            if baseline is None:
+                payload = {
+                    'tick': tick,
+                    'serverTime': state['serverTime'],
+                    'key': True,
+                    'fields': dict(zip(SNAPSHOT_FIELDS, snapshot)),
+                }
+            else:
+                base = self.history[baseline]
+                payload = {
+                    'tick': tick,
+                    'serverTime': state['serverTime'],
+                    'base': baseline,
+                    'fields': {
+                        field: value
+                        for field, value, old in zip(SNAPSHOT_FIELDS, snapshot, base)
+                        if value != old
+                    },
+                }
+            payloads.append((payload, sids))
+        if keyframe_due:
+            self._last_keyframe = tick
+        self.history[tick] = snapshot
+        while len(self.history) > self.history_size:
+            self.history.popitem(last=False)
+        return payloads
+
+
+# apply_snapshot function
+# Rebuilds the full snapshot from a payload and the client's stored snapshots,
+# used by tests and tools, clients do the same in JS
+def apply_snapshot(payload: dict, received: dict) -> dict:
+    if payload.get('key'):
+        fields = dict(payload['fields'])
+    else:
+        fields = dict(received[payload['base']])
+        fields.update(payload['fields'])
+    received[payload['tick']] = fields
+    return fields
@@ -0,0 +1,161 @@
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Sharded game server
+# With GAME_SERVER_WORKERS > 1, server.py runs this supervisor instead of a single server.
+# It starts one worker process per shard, worker i serves Socket.IO on BASE_PORT + i and
+# keeps its own games, sessions and pending requests, nothing is shared between workers.
+# Both players of a game must reach the same worker: clients put the game_id in the
+# Socket.IO handshake query (?game_id=...), and nginx hashes it over the workers' ports
+# (the game-server upstream of Frontend/nginx.conf, Frontend/tools.sh writes one server per
+# worker from the same GAME_SERVER_WORKERS).
+# Workers that exit are restarted, their games are lost but the shard comes back.
+# On SIGTERM (docker stop) or SIGINT the supervisor sends SIGTERM to the workers, uvicorn
+# shuts them down cleanly (the queued game results are written), and waits up to
+# SHUTDOWN_TIMEOUT seconds for them before it kills the ones that are left.
+# Every worker reports its stats every STATS_INTERVAL seconds, the supervisor serves
+# them and their totals as JSON on http://<host>:STATS_PORT/stats.
+
+WORKERS = int(os.environ.get('GAME_SERVER_WORKERS', '1'))
+BASE_PORT = 8010
+STATS_PORT = int(os.environ.get('GAME_SERVER_STATS_PORT', '8009'))
+STATS_INTERVAL = 5.0
+RESTART_DELAY = 1.0  # seconds before a worker that exited is started again
+SHUTDOWN_TIMEOUT = 10.0  # seconds the workers get to shut down before they are killed
+
+# Worker stats that are summed up in the totals
+TOTAL_KEYS = ('active_games', 'sessions', 'spectators', 'pending_requests', 'scheduled_games',
+              'skipped_ticks', 'dropped_messages', 'disconnected_sessions',
+              'queued_results', 'dropped_results')
+
+
+# run_worker function
+# Entry point of a worker process
+def run_worker(index: int, port: int, stats_queue) -> None:
+    import runtime
+    import server
+    runtime.run(server.serve_worker(index, port, stats_queue))
+
+
+# Supervisor class
+# Starts the workers, restarts them when they exit and collects their stats
+# Properties:
+#   - workers: number of worker processes
+#   - processes: worker index -> Process
+#   - stats: worker index -> the last stats the worker reported
+#   - restarts: number of times a worker had to be restarted
+class Supervisor:
+    def __init__(self, workers: int = WORKERS, base_port: int = BASE_PORT, stats_port: int = STATS_PORT):
+        self.workers: int = workers
+        self.base_port: int = base_port
+        self.stats_port: int = stats_port
+        self.processes: dict = {}
+        self.stats: dict = {}
+        self.restarts: int = 0
+        self._context = multiprocessing.get_context('spawn')
+        self._stats_queue = self._context.Queue()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def start_worker(self, index: int) -> None:
+        process = self._context.Process(
+            target=run_worker, args=(index, self.base_port + index, self._stats_queue),
+            name=f'game-server-{index}', daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+        logging.info(f"Started game server worker {index} (pid {process.pid}) on port {self.base_port + index}")
+
+    # aggregate method
+    # Returns the stats of every worker and their totals
+    def aggregate(self) -> dict:
+        with self._lock:
+            workers = [self.stats[index] for index in sorted(self.stats)]
+        totals = {key: sum(worker.get(key, 0) for worker in workers) for key in TOTAL_KEYS}
+        return {
+            'workers': workers,
+            'totals': {**totals, 'workers': self.workers, 'restarts': self.restarts},
+        }
+
+    # run method
+    # Runs the supervisor until it is interrupted or gets SIGTERM, then stops the workers
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._on_sigterm)
+        for index in range(self.workers):
+            self.start_worker(index)
+        self._serve_stats()
+        try:
+            while not self._stopping.is_set():
+                self._collect_stats(timeout=1.0)
+                if not self._stopping.is_set():
+                    self._restart_exited()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop_workers()
+
+    # stop_workers method
+    # Sends SIGTERM to every worker, waits for them and kills the ones still running after
+    # SHUTDOWN_TIMEOUT seconds
+    def stop_workers(self, timeout: float = SHUTDOWN_TIMEOUT) -> None:
+        logging.info(f"Stopping {len(self.processes)} game server workers")
+        for process in self.processes.values():
+            process.terminate()
+        deadline = time.monotonic() + timeout
+        for index, process in self.processes.items():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logging.error(f"Game server worker {index} did not stop in {timeout} seconds, killing it")
+                process.kill()
+                process.join()
+
+    def _on_sigterm(self, signum, frame) -> None:
+        self._stopping.set()
+
+    def _collect_stats(self, timeout: float) -> None:
+        try:
+            stats = self._stats_queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        with self._lock:
+            self.stats[stats['worker']] = stats
+
+    def _restart_exited(self) -> None:
+        for index, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            logging.error(f"Game server worker {index} exited with code {process.exitcode}, restarting it")
+            with self._lock:
+                self.stats.pop(index, None)
+            self.restarts += 1
+            time.sleep(RESTART_DELAY)
+            self.start_worker(index)
+
+    def _serve_stats(self) -> None:
+        supervisor = self
+
+        class StatsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/stats':
+                    self.send_error(404)
+                    return
+                payload = json.dumps(supervisor.aggregate()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('0.0.0.0', self.stats_port), StatsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
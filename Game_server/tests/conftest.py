@@ -0,0 +1,97 @@
+# conftest.py
+import asyncio
+import pytest
+from server_utils import active_games, sid_to_game
+from server import PongGame
+import broadcast
+import rate_limit
+import pending_joins
+import server
+
+
+# FakeScheduledGame class
+# Minimal game that counts how often the tick scheduler called it
+class FakeScheduledGame:
+    def __init__(self, fail_on_step=False, tick_rate=60):
+        self.tick_rate = tick_rate
+        self.steps = 0
+        self.flushes = 0
+        self.error = None
+        self.fail_on_step = fail_on_step
+
+    def step(self):
+        if self.fail_on_step:
+            raise RuntimeError("step failed")
+        self.steps += 1
+
+    async def flush(self):
+        self.flushes += 1
+
+    def fail(self, error):
+        self.error = error
+
+
+# FakeClock class
+# Manually advanced clock, its sleep moves the time forward instantly
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.now += delay
+        await asyncio.sleep(0)
+
+
+# FakeSio class
+# Stands in for the Socket.IO server, keeps the rooms and records every emit
+class FakeSio:
+    def __init__(self):
+        self.rooms = {}
+        self.emits = []
+        self.disconnected = []
+
+    async def disconnect(self, sid, namespace=None):
+        self.disconnected.append(sid)
+
+    async def enter_room(self, sid, room, namespace=None):
+        self.rooms.setdefault(room, set()).add(sid)
+
+    async def leave_room(self, sid, room, namespace=None):
+        self.rooms.get(room, set()).discard(sid)
+
+    async def emit(self, event, data=None, room=None, skip_sid=None, **kwargs):
+        self.emits.append((event, data, room, skip_sid))
+
+    # received method
+    # Returns the (event, data) pairs the given sid received
+    def received(self, sid):
+        return [
+            (event, data) for event, data, room, skip_sid in self.emits
+            if sid != skip_sid and (room == sid or sid in self.rooms.get(room, ()))
+        ]
+
+
+@pytest.fixture
+def fake_sio(monkeypatch):
+    fake = FakeSio()
+    monkeypatch.setattr(broadcast, 'sio', fake)
+    monkeypatch.setattr(server, 'sio', fake)
+    monkeypatch.setattr(rate_limit, 'sio', fake)
+    monkeypatch.setattr(pending_joins, 'sio', fake)
+    return fake
+
+
+@pytest.fixture
+def fake_clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def pong_game():
+    game = PongGame(1, 42, 808, False)
+    yield game
+    active_games.clear()
+    sid_to_game.clear()
@@ -0,0 +1,1081 @@
+import asyncio
+import json
+import math
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+import pytest
+import server
+import rate_limit
+from tick_scheduler import TickScheduler
+from broadcast import WIRE_JSON, WIRE_FRAMES, WIRE_BINARY, WIRE_EVENTS
+from rate_limit import RateLimiter, rate_limited
+from input_buffer import PlayerInputBuffer
+from snapshot import SnapshotEncoder, SNAPSHOT_FIELDS, flatten_state, apply_snapshot
+from binary_protocol import pack_snapshot, unpack_snapshot, SNAPSHOT_STRUCT
+from server import PongGame, PHASE_SERVE, PHASE_RALLY, PHASE_POST_RALLY
+from server_utils import game_rates
+from headless import run_game, PaddleBot, apply_input
+from recording import Recording, ReplayCursor, KIND_END, KEYFRAME_INTERVAL
+import replay_service
+import runtime
+import server_utils
+from metrics import Metrics, Histogram
+from watchdog import LoopWatchdog
+from socketio import packet
+from supervisor import Supervisor
+from cluster import Cluster, LEASE_TTL
+from fake_redis import FakeRedis
+from benchmarks.fake_token_service import issue_token
+import auth
+from pending_joins import PendingJoins, GameRequest, REQUEST_TIMEOUT
+from result_writer import ResultWriter, MAX_ATTEMPTS
+from game_logic.game_defaults import *
+from tests.conftest import FakeScheduledGame
+
+
+def run_scheduler(scheduler, games, stop_after):
+    async def runner():
+        for game in games:
+            scheduler.register(game)
+        while scheduler.tick < stop_after:
+            await asyncio.sleep(0)
+        for game in games:
+            scheduler.unregister(game)
+        await scheduler._task
+    asyncio.run(runner())
+
+
+def test_scheduler_steps_and_flushes_every_game(fake_clock):
+    scheduler = TickScheduler(60, clock=fake_clock, sleep=fake_clock.sleep)
+    games = [FakeScheduledGame() for _ in range(3)]
+    run_scheduler(scheduler, games, stop_after=10)
+    for game in games:
+        assert game.steps == scheduler.tick
+        assert game.flushes == scheduler.tick
+    # The deadlines are absolute, so the fake time matches the tick count exactly
+    # (plus the last sleep, after which the scheduler found no games left)
+    assert abs(fake_clock.now - (scheduler.tick + 1) / 60) < 1e-9
+
+
+def test_scheduler_catches_up_and_skips_when_late(fake_clock):
+    scheduler = TickScheduler(100, max_catch_up=3, clock=fake_clock, sleep=fake_clock.sleep)
+
+    class StallingGame(FakeScheduledGame):
+        def step(self):
+            super().step()
+            if self.steps == 1:
+                fake_clock.now += 0.1  # blocks the loop for 10 ticks
+
+    game = StallingGame(tick_rate=100)
+    run_scheduler(scheduler, [game], stop_after=4)
+    # 10 ticks were due after the stall: 3 are caught up, the rest skipped
+    assert scheduler.skipped_ticks == 7
+    assert game.steps == 4
+    assert game.flushes == 2
+
+
+def test_scheduler_drops_failing_game(fake_clock):
+    scheduler = TickScheduler(60, clock=fake_clock, sleep=fake_clock.sleep)
+    good, bad = FakeScheduledGame(), FakeScheduledGame(fail_on_step=True)
+    run_scheduler(scheduler, [good, bad], stop_after=3)
+    assert isinstance(bad.error, RuntimeError)
+    assert not scheduler.is_registered(bad)
+    assert good.steps == 3
+
+
+def test_pong_game_rally_phases(pong_game):
+    pong_game.start_rally()
+    assert pong_game.phase == PHASE_SERVE
+    for _ in range(pong_game.serve_delay_ticks):
+        pong_game.step()
+    assert pong_game.phase == PHASE_RALLY
+    assert pong_game.game_state.paused is False
+    # Paddles stand still, move player 1 away so the rally ends
+    pong_game.game_state.move_player(42, -PADDLE_SPEED)
+    for _ in range(10000):
+        if pong_game.phase != PHASE_RALLY:
+            break
+        pong_game.step()
+    assert pong_game.phase == PHASE_POST_RALLY
+    assert pong_game.score_changed is True
+    assert pong_game.game_state.player1.score + pong_game.game_state.player2.score == 1
+    for _ in range(POST_RALLY_FRAMES):
+        pong_game.step()
+    assert pong_game.phase == PHASE_SERVE
+
+
+def test_broadcast_encodes_once_per_wire_format(fake_sio, monkeypatch):
+    monkeypatch.setitem(server.sid_wire_format, 'frames_sid', WIRE_FRAMES)
+    game = PongGame(7, 1, 2, True)
+
+    async def run():
+        for sid, player_id in (('json_sid', 1), ('json_sid2', 2), ('frames_sid', 1)):
+            await game.add_player(sid, player_id)
+        game.state_changed = True
+        game.score_changed = True
+        await game.flush()
+    asyncio.run(run())
+
+    # One emit per message for the whole JSON room, one frame for the frames room
+    rooms = [room for _, _, room, _ in fake_sio.emits]
+    assert rooms == [game.broadcaster.room(WIRE_JSON)] * 2 + [game.broadcaster.room(WIRE_FRAMES)]
+    assert [event for event, _ in fake_sio.received('json_sid2')] == ['send_game_state', 'score']
+    frames = fake_sio.received('frames_sid')
+    assert len(frames) == 1 and frames[0][0] == 'game_frame'
+    assert [event for event, _ in frames[0][1]['events']] == ['send_game_state', 'score']
+
+
+def test_broadcast_skips_quitting_player(fake_sio):
+    game = PongGame(8, 1, 2, True)
+
+    async def run():
+        await game.add_player('a', 1)
+        await game.add_player('b', 2)
+        await game.broadcaster.send('quit_game', {'gameId': 8}, skip_sid='a')
+    asyncio.run(run())
+    assert fake_sio.received('a') == []
+    assert fake_sio.received('b') == [('quit_game', {'gameId': 8})]
+
+
+def test_events_clients_extrapolate_between_trajectory_changes(fake_sio, monkeypatch):
+    monkeypatch.setitem(server.sid_wire_format, 'events_sid', WIRE_EVENTS)
+    game = PongGame(10, 1, 2, True)
+    positions = {}
+
+    async def run():
+        await game.add_player('json_sid', 1)
+        await game.add_player('events_sid', 2)
+        game.start_rally()
+        game.game_state.ball.direction = 225  # down-left, off the bottom wall
+        for _ in range(600):
+            game.step()
+            positions[game.tick] = (game.game_state.ball.x, game.game_state.ball.z)
+            await game.flush()
+    asyncio.run(run())
+
+    states = [data for event, data in fake_sio.received('json_sid') if event == 'send_game_state']
+    received = fake_sio.received('events_sid')
+    assert 'send_game_state' not in [event for event, _ in received]
+    trajectories = [data for event, data in received if event == 'trajectory']
+    trajectories += [data for event, frame in received if event == 'game_frame'
+                     for name, data in frame['events'] if name == 'trajectory']
+    trajectories.sort(key=lambda data: data['tick'])
+    assert len(received) * 10 < len(states)
+    kinds = {change['kind'] for data in trajectories for change in data['changes']}
+    assert {'sync', 'serve', 'launch', 'wall_bounce', 'goal'} <= kinds
+
+    # Between two trajectory messages the ball moves in a straight line
+    for current, following in zip(trajectories, trajectories[1:]):
+        for tick in range(current['tick'] + 1, following['tick']):
+            elapsed = (tick - current['tick']) / current['tickRate']
+            x, z = positions[tick]
+            assert abs(current['ball']['x'] + current['ball']['vx'] * elapsed - x) < 1e-6
+            assert abs(current['ball']['z'] + current['ball']['vz'] * elapsed - z) < 1e-6
+
+
+def test_binary_snapshot_round_trip(pong_game):
+    pong_game.start_rally()
+    pong_game.tick = 1234
+    pong_game.game_state.bounce = True
+    pong_game.input_seq[pong_game.game_state.player2.id] = 77
+    pong_game.send_game_state_to_client()
+    state = pong_game.broadcaster.outbox[-1][1]
+    packed = pack_snapshot(state)
+    assert len(packed) == SNAPSHOT_STRUCT.size == 46
+    snapshot = unpack_snapshot(packed)
+    assert snapshot['tick'] == 1234
+    assert snapshot['player1Seq'] == 0 and snapshot['player2Seq'] == 77
+    assert snapshot['bounce'] is True and snapshot['paused'] is True
+    assert abs(snapshot['ballPosition']['x'] - state['ballPosition']['x']) < 1e-3
+    assert abs(snapshot['ballDelta']['dz'] - state['ballDelta']['dz']) < 1e-3
+    assert abs(snapshot['player2Pos']['z'] - state['player2Pos']['z']) < 1e-3
+
+
+def test_binary_clients_get_packed_state(fake_sio, monkeypatch):
+    monkeypatch.setitem(server.sid_wire_format, 'bin_sid', WIRE_BINARY)
+    game = PongGame(9, 1, 2, True)
+
+    async def run():
+        await game.add_player('bin_sid', 1)
+        game.state_changed = True
+        await game.flush()
+        game.state_changed = True
+        game.score_changed = True
+        await game.flush()
+    asyncio.run(run())
+    (first_event, first_data), (second_event, second_data) = fake_sio.received('bin_sid')
+    assert first_event == 'game_state_bin' and isinstance(first_data, bytes)
+    assert second_event == 'game_frame'
+    assert isinstance(second_data['events'][0][1], bytes)
+    assert second_data['events'][1][0] == 'score'
+
+
+def make_state(tick, ball_x=400.0, p1_z=300.0, p1_seq=0):
+    return {
+        'type': 'send_game_state', 'gameId': 1, 'tick': tick, 'serverTime': 1000.0 * tick,
+        'ballPosition': {'x': ball_x, 'y': 0, 'z': 300.0},
+        'ballDelta': {'dx': 8.0, 'dz': 0.0},
+        'player1Pos': {'x': -8.0, 'z': p1_z},
+        'player2Pos': {'x': 808.0, 'z': 300.0},
+        'bounce': False, 'hitpos': 0.0, 'paused': False,
+        'player1Seq': p1_seq, 'player2Seq': 0,
+    }
+
+
+def test_snapshot_encoder_sends_deltas_against_acked_baseline():
+    encoder = SnapshotEncoder(keyframe_interval=10)
+    encoder.add('a')
+    encoder.add('b')
+    received = {'a': {}, 'b': {}}
+
+    (payload, sids), = encoder.encode(1, make_state(1))
+    assert payload['key'] is True and sorted(sids) == ['a', 'b']
+    for sid in sids:
+        apply_snapshot(payload, received[sid])
+    encoder.ack('a', 1)
+
+    groups = encoder.encode(2, make_state(2, ball_x=408.0))
+    by_sid = {sid: payload for payload, sids in groups for sid in sids}
+    # 'a' acked tick 1, only the ball moved; 'b' never acked and gets a keyframe
+    assert by_sid['a'] == {'tick': 2, 'serverTime': 2000.0, 'base': 1, 'fields': {'ball_x': 408.0}}
+    assert by_sid['b']['key'] is True
+    full = apply_snapshot(by_sid['a'], received['a'])
+    assert full == dict(zip(SNAPSHOT_FIELDS, flatten_state(make_state(2, ball_x=408.0))))
+
+    # An acknowledged input changes the player's seq, which the delta carries
+    encoder.ack('a', 2)
+    (payload, _), = [group for group in encoder.encode(3, make_state(3, ball_x=408.0, p1_seq=5)) if 'a' in group[1]]
+    assert payload['fields'] == {'p1_seq': 5}
+    assert apply_snapshot(payload, received['a'])['p1_seq'] == 5
+
+
+def test_snapshot_encoder_keyframe_interval_and_reconnect():
+    encoder = SnapshotEncoder(keyframe_interval=5)
+    encoder.add('a')
+    for tick in range(1, 5):
+        encoder.encode(tick, make_state(tick))
+        encoder.ack('a', tick)
+    (payload, _), = encoder.encode(5, make_state(5))
+    assert 'base' in payload
+    (payload, _), = encoder.encode(6, make_state(6))
+    assert payload.get('key') is True  # interval reached
+    encoder.ack('a', 6)
+    encoder.remove('a')
+    encoder.add('a')  # reconnect
+    (payload, _), = encoder.encode(7, make_state(7))
+    assert payload.get('key') is True
+
+
+def test_scheduler_runs_games_at_their_own_rate(fake_clock):
+    scheduler = TickScheduler(120, clock=fake_clock, sleep=fake_clock.sleep)
+    fast, slow = FakeScheduledGame(tick_rate=120), FakeScheduledGame(tick_rate=30)
+    run_scheduler(scheduler, [fast, slow], stop_after=12)
+    assert fast.steps == 12
+    assert slow.steps == 3
+    # Games are only flushed on the ticks they were stepped on
+    assert fast.flushes == 12
+    assert slow.flushes == 3
+
+
+def test_game_rates_validation():
+    assert game_rates({}) == (TICK_RATE, SNAPSHOT_RATE)
+    assert game_rates({'tick_rate': 120, 'snapshot_rate': 30}) == (120, 30)
+    assert game_rates({'tick_rate': 50}) is None  # does not divide MAX_TICK_RATE
+    assert game_rates({'tick_rate': 60, 'snapshot_rate': 90}) is None
+
+
+def test_snapshot_rate_is_independent_of_tick_rate(fake_sio):
+    game = PongGame(10, 1, 2, False, tick_rate=120, snapshot_rate=30)
+    # Same ball path at 120 Hz as at 60 Hz, the ball moves half as far per tick
+    reference = PongGame(11, 1, 2, False)
+
+    async def run():
+        await game.add_player('a', 1)
+        for pong in (game, reference):
+            pong.start_rally()
+            pong.game_state.ball.direction = 0
+        for _ in range(game.serve_delay_ticks + 40):
+            game.step()
+            await game.flush()
+        for _ in range(reference.serve_delay_ticks + 20):
+            reference.step()
+    asyncio.run(run())
+    states = [data for event, data in fake_sio.received('a') if event == 'send_game_state']
+    # the serve and the launch are sent right away, then every 4th tick
+    ticks = [state['tick'] for state in states]
+    assert ticks[2:] == list(range(ticks[2], ticks[2] + 4 * (len(ticks) - 2), 4))
+    assert all('serverTime' in state for state in states)
+    assert abs(game.game_state.ball.x - reference.game_state.ball.x) < 1e-9
+
+
+def test_held_key_input_moves_paddle_each_tick(pong_game):
+    pong_game.is_remote = True
+    pong_game.sid_to_player_id = {'a': 42, 'b': 808}
+    paddle = pong_game.game_state.player1.paddle
+    start_z = paddle.z
+    pong_game.start_rally()
+    pong_game.handle_paddle_input('a', {'game_id': 1, 'player_id': 42, 'direction': 1, 'seq': 1})
+    for _ in range(3):
+        pong_game.step()
+    assert paddle.z == start_z + 3 * PADDLE_SPEED
+    # Stale and foreign inputs are ignored
+    pong_game.handle_paddle_input('a', {'game_id': 1, 'player_id': 42, 'direction': 0, 'seq': 1})
+    pong_game.handle_paddle_input('b', {'game_id': 1, 'player_id': 42, 'direction': 0, 'seq': 5})
+    pong_game.step()
+    assert paddle.z == start_z + 4 * PADDLE_SPEED
+    pong_game.handle_paddle_input('a', {'game_id': 1, 'player_id': 42, 'direction': -1, 'seq': 2})
+    pong_game.handle_paddle_input('a', {'game_id': 1, 'player_id': 42, 'direction': 0, 'seq': 3})
+    pong_game.step()
+    assert paddle.z == start_z + 4 * PADDLE_SPEED
+    pong_game.send_game_state_to_client()
+    assert pong_game.broadcaster.outbox[-1][1]['player1Seq'] == 3
+
+
+def test_paddles_move_at_the_same_speed_at_any_tick_rate(fake_sio):
+    for tick_rate in (30, 60, 120):
+        game = PongGame(13, 42, 808, True, tick_rate=tick_rate)
+        game.sid_to_player_id = {'a': 42}
+        paddle = game.game_state.player1.paddle
+        start_z = paddle.z
+        game.start_rally()
+        # Held down for a sixth of a second, then a move_paddle back up as big as a tick allows
+        game.handle_paddle_input('a', {'game_id': 13, 'player_id': 42, 'direction': -1, 'seq': 1})
+        for _ in range(tick_rate // 6):
+            game.step()
+        assert paddle.z == pytest.approx(start_z - BASE_TICK_RATE // 6 * PADDLE_SPEED)
+        game.handle_paddle_input('a', {'game_id': 13, 'player_id': 42, 'direction': 0, 'seq': 2})
+        game.queue_move(42, PADDLE_SPEED * BASE_TICK_RATE / tick_rate)
+        game.step()
+        assert paddle.z == pytest.approx(start_z - (BASE_TICK_RATE // 6 - BASE_TICK_RATE / tick_rate) * PADDLE_SPEED)
+
+
+def test_input_buffer_clamps_and_drops_excess():
+    buffer = PlayerInputBuffer(size=4)
+    for delta in (9, 9, 9, 9, 9):
+        buffer.push_delta(delta)
+    assert buffer.dropped == 1
+    assert buffer.take_deltas(9) == 9
+    assert list(buffer.deltas) == []  # nothing is carried over to the next tick
+    buffer.push_delta(-3)
+    buffer.push_delta(5)
+    assert buffer.take_deltas(12) == 2
+
+
+def test_paddle_stops_when_a_high_refresh_client_releases_the_key(pong_game):
+    pong_game.start_rally()
+    paddle = pong_game.game_state.player1.paddle
+    start_z = paddle.z
+    move = {'type': 'move_paddle', 'game_id': 1, 'player1_id': 42}
+    # A key held for a third of a second on a 144 Hz display, one delta per frame
+    frame_delta = -PADDLE_SPEED * BASE_TICK_RATE / 144
+    frames = 0
+    for tick in range(1, TICK_RATE // 3 + 1):
+        while frames / 144 < tick / TICK_RATE:
+            pong_game.handle_paddle_movement('a', dict(move, p1_delta_z=frame_delta))
+            frames += 1
+        pong_game.step()
+    held_z = paddle.z
+    assert start_z - held_z <= -frame_delta * frames
+    # Released: the paddle stops with the client's prediction
+    for _ in range(10):
+        pong_game.step()
+    assert paddle.z == held_z
+    # Out of range and non-finite deltas never move it further than a tick allows
+    for delta in (1e6, float('inf'), float('nan')):
+        pong_game.handle_paddle_movement('a', dict(move, p1_delta_z=delta))
+    pong_game.step()
+    assert paddle.z == held_z + PADDLE_SPEED
+    pong_game.step()
+    assert paddle.z == held_z + PADDLE_SPEED
+
+
+def test_flooded_move_paddle_is_applied_once_per_tick(pong_game):
+    pong_game.start_rally()
+    paddle = pong_game.game_state.player1.paddle
+    start_z = paddle.z
+    for _ in range(20):
+        pong_game.handle_paddle_movement('a', {
+            'type': 'move_paddle', 'game_id': 1, 'player1_id': 42, 'p1_delta_z': -PADDLE_SPEED,
+        })
+    # Nothing moves or goes out before the tick
+    assert paddle.z == start_z
+    assert pong_game.broadcaster.outbox == []
+    pong_game.step()
+    assert paddle.z == start_z - PADDLE_SPEED
+    pong_game.step()
+    assert paddle.z == start_z - PADDLE_SPEED
+
+
+def test_rate_limiter_token_bucket(fake_clock):
+    limiter = RateLimiter({'move_paddle': (10, 5)}, clock=fake_clock)
+    assert [limiter.allow('a', 'move_paddle') for _ in range(6)] == [True] * 5 + [False]
+    assert limiter.allow('b', 'move_paddle') is True  # budgets are per session
+    fake_clock.now += 0.1  # refills one token
+    assert limiter.allow('a', 'move_paddle') is True
+    assert limiter.allow('a', 'move_paddle') is False
+    assert limiter.dropped == {'move_paddle': 2}
+
+
+def test_rate_limited_handler_drops_and_disconnects(fake_sio, fake_clock, monkeypatch):
+    limiter = RateLimiter({'test': (1, 2)}, clock=fake_clock, disconnect_after=3)
+    monkeypatch.setattr(rate_limit, 'rate_limiter', limiter)
+    handled = []
+
+    @rate_limited('test')
+    async def test(sid):
+        handled.append(sid)
+
+    async def run():
+        for _ in range(5):
+            await test('a')
+    asyncio.run(run())
+    assert handled == ['a', 'a']
+    assert fake_sio.disconnected == ['a']
+    assert limiter.disconnected == 1
+
+
+def test_rate_limiter_keeps_high_refresh_clients(fake_sio, fake_clock, monkeypatch):
+    # A key held for a minute on a 144 Hz display, one move_paddle per frame
+    handled = []
+
+    @rate_limited('move_paddle')
+    async def move_paddle(sid):
+        handled.append(sid)
+
+    async def hold_key(sid, hz, seconds):
+        for _ in range(hz * seconds):
+            fake_clock.now += 1 / hz
+            await move_paddle(sid)
+
+    limiter = RateLimiter(clock=fake_clock)
+    monkeypatch.setattr(rate_limit, 'rate_limiter', limiter)
+    asyncio.run(hold_key('a', 144, 60))
+    assert len(handled) == 144 * 60
+    assert fake_sio.disconnected == []
+    # Over a smaller budget messages are dropped, but it is not a flood
+    limiter = RateLimiter({'move_paddle': (120, 60)}, clock=fake_clock)
+    monkeypatch.setattr(rate_limit, 'rate_limiter', limiter)
+    asyncio.run(hold_key('b', 144, 60))
+    assert limiter.dropped['move_paddle'] > rate_limit.DISCONNECT_AFTER_DROPS
+    assert fake_sio.disconnected == []
+    # Twice the budget and more is
+    asyncio.run(hold_key('c', 300, 10))
+    assert set(fake_sio.disconnected) == {'c'}
+
+
+def test_fast_ball_does_not_tunnel_through_paddle(pong_game):
+    state = pong_game.game_state
+    ball = state.ball
+    speed = PADDLE_WIDTH * 3  # far more than the paddle's depth and the ball's size per step
+    ball.set_state(BALL_RADIUS + 50, PLAYER_START_Z, speed, 180, -speed, 0.0)
+    state.advance_ball()
+    assert state.player1.hits == 1
+    assert state.bounce is True
+    assert ball.delta_x > 0
+    assert BALL_RADIUS <= ball.x <= FIELD_DEPTH - BALL_RADIUS
+    assert not state.check_goal()
+
+
+def test_swept_collision_resolves_several_impacts_per_step(pong_game):
+    state = pong_game.game_state
+    ball = state.ball
+    # heading down-left into the corner: bounces off the bottom wall, then player 1's paddle
+    state.player1.paddle.position.z = PADDLE_WIDTH / 2
+    ball.set_state(60, 30, 0, 0, 0, 0)
+    ball.speed = 100
+    ball.direction = 225
+    state.advance_ball()
+    assert state.player1.hits == 1
+    assert ball.delta_x > 0
+    assert BALL_RADIUS <= ball.z <= FIELD_WIDTH - BALL_RADIUS
+
+
+def test_ball_missing_the_paddle_scores(pong_game):
+    state = pong_game.game_state
+    ball = state.ball
+    ball.set_state(BALL_RADIUS + 10, FIELD_WIDTH - BALL_RADIUS - 1, 50, 180, -50, 0.0)
+    state.advance_ball()
+    assert state.player1.hits == 0
+    assert state.check_goal()
+    assert state.player2.score == 1
+
+
+def test_batch_engine_matches_object_engine():
+    pytest.importorskip('numpy')
+    from game_logic.batch_engine import BatchPhysicsEngine
+    rng = random.Random(9)
+    engine = BatchPhysicsEngine(capacity=4)  # grows while games are submitted
+    pairs = []
+    for game_id in range(200):
+        games = (PongGame(game_id, 1, 2, False), PongGame(game_id, 1, 2, False))
+        x = rng.uniform(1, FIELD_DEPTH - 1)
+        z = rng.uniform(BALL_RADIUS, FIELD_WIDTH - BALL_RADIUS)
+        speed = rng.uniform(BALL_SPEED, 20 * BALL_SPEED)  # fast balls bounce several times per step
+        direction = rng.uniform(0, 360)
+        p1_z, p2_z = rng.uniform(-FIELD_WIDTH, FIELD_WIDTH), rng.uniform(-FIELD_WIDTH, FIELD_WIDTH)
+        for game in games:
+            game.phase = PHASE_RALLY
+            game.game_state.paused = False
+            ball = game.game_state.ball
+            ball.set_state(x, z, speed, direction,
+                           math.cos(math.radians(direction)) * speed, math.sin(math.radians(direction)) * speed)
+            game.game_state.player1.move_paddle(p1_z)
+            game.game_state.player2.move_paddle(p2_z)
+        games[1].physics = engine
+        pairs.append(games)
+    for _ in range(120):
+        for reference, batched in pairs:
+            if reference.phase == PHASE_RALLY:
+                reference.step()
+                batched.step()
+        engine.run()
+        for reference, batched in pairs:
+            expected, actual = reference.game_state, batched.game_state
+            assert batched.phase == reference.phase
+            for field in ('x', 'z', 'speed', 'direction', 'delta_x', 'delta_z'):
+                assert getattr(actual.ball, field) == pytest.approx(getattr(expected.ball, field), abs=1e-6)
+            assert actual.bounce == expected.bounce
+            assert actual.hitpos == pytest.approx(expected.hitpos, abs=1e-9)
+            for player in ('player1', 'player2'):
+                assert getattr(actual, player).score == getattr(expected, player).score
+                assert getattr(actual, player).hits == getattr(expected, player).hits
+            assert actual.current_rally == expected.current_rally
+    assert any(reference.phase == PHASE_POST_RALLY for reference, _ in pairs)
+    assert any(reference.game_state.player1.hits or reference.game_state.player2.hits for reference, _ in pairs)
+
+
+def test_headless_games_are_deterministic():
+    first = run_game(seed=5, max_ticks=3000)
+    assert first['ticks'] == 3000
+    assert run_game(seed=5, max_ticks=3000)['hash'] == first['hash']
+    assert run_game(seed=6, max_ticks=3000)['hash'] != first['hash']
+
+    # Replaying the recorded inputs without the bots plays the same game
+    replay = run_game(seed=5, inputs=first['inputs'], bots=(), max_ticks=3000)
+    assert replay['hash'] == first['hash']
+    assert replay['score'] == first['score']
+
+    # Only seeded games get a generator of their own, live games share the random module's
+    assert PongGame(11, 1, 2, False).game_state.rng is random
+    assert PongGame(12, 1, 2, False, seed=5).game_state.rng is not random
+
+
+def test_supervisor_aggregates_worker_stats():
+    supervisor = Supervisor(workers=2)
+    supervisor.stats = {
+        1: dict(server.worker_stats(1), active_games=3, sessions=6),
+        0: dict(server.worker_stats(0), active_games=2, sessions=3, skipped_ticks=1),
+    }
+    stats = supervisor.aggregate()
+    assert [worker['worker'] for worker in stats['workers']] == [0, 1]
+    assert stats['totals']['active_games'] == 5
+    assert stats['totals']['sessions'] == 9
+    assert stats['totals']['skipped_ticks'] == 1
+    assert stats['totals']['workers'] == 2
+
+
+def test_supervisor_stops_workers_on_sigterm(monkeypatch):
+    class FakeProcess:
+        def __init__(self, stubborn):
+            self.stubborn = stubborn
+            self.calls = []
+
+        def terminate(self):
+            self.calls.append('terminate')
+
+        def join(self, timeout=None):
+            self.calls.append(('join', timeout))
+
+        def is_alive(self):
+            return self.stubborn and 'kill' not in self.calls
+
+        def kill(self):
+            self.calls.append('kill')
+
+    supervisor = Supervisor(workers=2)
+    monkeypatch.setattr(supervisor, 'start_worker',
+                        lambda index: supervisor.processes.__setitem__(index, FakeProcess(index == 1)))
+    monkeypatch.setattr(supervisor, '_serve_stats', lambda: None)
+    monkeypatch.setattr(supervisor, '_collect_stats', lambda timeout: signal.raise_signal(signal.SIGTERM))
+    previous = signal.getsignal(signal.SIGTERM)
+    try:
+        supervisor.run()
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+    # Every worker got SIGTERM and time to drain, the one that did not stop was killed
+    first, stubborn = supervisor.processes[0].calls, supervisor.processes[1].calls
+    assert first[0] == 'terminate' and first[1][0] == 'join' and first[1][1] > 0
+    assert 'kill' not in first
+    assert stubborn[0] == 'terminate' and 'kill' in stubborn
+    assert supervisor.restarts == 0
+
+
+def test_cluster_leases_pairing_and_forwarding(fake_sio, fake_clock, monkeypatch):
+    redis = FakeRedis(clock=fake_clock)
+    node_a, node_b = Cluster(redis, 'a'), Cluster(redis, 'b')
+
+    async def run():
+        # Only one node holds a game's lease, until it expires without being renewed
+        assert await node_a.acquire_lease(7)
+        assert not await node_b.acquire_lease(7)
+        fake_clock.now += LEASE_TTL + 1
+        assert await node_a.renew_leases() == [7]
+        assert await node_b.acquire_lease(7)
+        await node_a.release_lease(7)
+        assert await node_b.owner(7) == 'b'
+
+        # The players of a game are paired through the shared index, whichever node they are on
+        assert await node_a.pair_request(7, 1, 2, 'sid-a', 1, WIRE_JSON) is None
+        partner = await node_b.pair_request(7, 1, 2, 'sid-b', 2, WIRE_EVENTS)
+        assert partner == {'sid': 'sid-a', 'node': 'a', 'player_id': 1, 'wire_format': WIRE_JSON}
+        # A player is never paired with themselves, their newer request replaces the older one
+        assert await node_a.pair_request(8, 1, 2, 'sid-a', 1, WIRE_JSON) is None
+        assert await node_b.pair_request(8, 1, 2, 'sid-c', 1, WIRE_JSON) is None
+        partner = await node_a.pair_request(8, 1, 2, 'sid-b', 2, WIRE_JSON)
+        assert partner['sid'] == 'sid-c'
+
+        # Node a forwards the events of its session to node b, which runs the game
+        forwarded = []
+
+        async def handler(*args):
+            forwarded.append(args)
+        listener = asyncio.create_task(node_b.listen(handler))
+        await asyncio.sleep(0)
+        monkeypatch.setattr(server, 'cluster', node_a)
+        await server.handle_forwarded('game_joined', 'sid-a', {'game_id': 7}, 'b')
+        await server.paddle_input('sid-a', {'direction': 1, 'seq': 1})
+        await server.disconnect('sid-a')
+        for _ in range(3):
+            await asyncio.sleep(0)
+        listener.cancel()
+        assert forwarded == [
+            ('paddle_input', 'sid-a', {'direction': 1, 'seq': 1}, 'a'),
+            ('disconnect', 'sid-a', None, 'a'),
+        ]
+        assert 'sid-a' not in server.sid_to_node
+
+        # The request of a session that disconnects is taken out of the shared index
+        assert await node_a.pair_request(9, 1, 2, 'sid-d', 1, WIRE_JSON) is None
+        server.pending_joins.add(GameRequest('sid-d', 9, 1, 2, 1, True))
+        await server.disconnect('sid-d')
+        assert await redis.get(Cluster.request_key(9, 1, 2)) is None
+
+        # A cancelled game gives its lease up
+        game = PongGame(10, 1, 2, True)
+        server.active_games[10] = game
+        assert await node_a.acquire_lease(10)
+        await game.cancel_game()
+        assert node_a.leases == set()
+        assert await node_b.acquire_lease(10)
+    asyncio.run(run())
+
+
+
+def test_cluster_lease_changes_owner_while_renewed_or_released(fake_clock):
+    # Node b takes over the lease right after node a's first command on it reached Redis,
+    # node a must neither extend nor delete node b's lease
+    class TakeoverRedis(FakeRedis):
+        takeover = None
+
+        async def _after(self, result):
+            if self.takeover is not None:
+                takeover, self.takeover = self.takeover, None
+                await takeover()
+            return result
+
+        async def get(self, key):
+            return await self._after(await super().get(key))
+
+        async def eval(self, script, numkeys, *keys_and_args):
+            return await self._after(await super().eval(script, numkeys, *keys_and_args))
+
+    redis = TakeoverRedis(clock=fake_clock)
+    node_a, node_b = Cluster(redis, 'a'), Cluster(redis, 'b')
+
+    def take_over(game_id):
+        async def takeover():
+            redis.data.pop(Cluster.lease_key(game_id), None)
+            assert await node_b.acquire_lease(game_id)
+        return takeover
+
+    async def run():
+        assert await node_a.acquire_lease(7)
+        redis.takeover = take_over(7)
+        await node_a.renew_leases()
+        assert redis.data[Cluster.lease_key(7)] == ('b', fake_clock() + LEASE_TTL)
+        fake_clock.now += LEASE_TTL / 2
+        assert await node_a.renew_leases() == [7]
+
+        assert await node_a.acquire_lease(8)
+        redis.takeover = take_over(8)
+        await node_a.release_lease(8)
+        assert await node_b.owner(8) == 'b'
+
+    asyncio.run(run())
+
+def test_join_game_verifies_tokens_locally(fake_sio, monkeypatch):
+    secret = 'a game server test secret, 32+ bytes'
+    monkeypatch.setattr(auth, 'JWT_SECRET', secret)
+    monkeypatch.setattr(server, 'denylist', auth.Denylist())
+    token = issue_token(42, secret)
+    join = {'game_id': 5, 'player1_id': 42, 'player2_id': 808, 'is_remote': True}
+
+    async def run():
+        # The handshake's token authenticates the session, join_game needs no token then
+        await server.connect('sid-a', {}, {'token': token})
+        await server.join_game('sid-a', dict(join, local_player_id=42))
+        # Tokens are checked against the player, their signature and the denylist
+        await server.connect('sid-b', {}, {'token': issue_token(808, 'another secret of at least 32 bytes')})
+        await server.join_game('sid-b', dict(join, local_player_id=808))
+        await server.connect('sid-c', {}, None)
+        await server.join_game('sid-c', dict(join, local_player_id=808, token=token))
+        # A session whose identity expired authenticates again with its join_game's token
+        server.sid_identity['sid-d'] = auth.Identity('42', 0, time.time() - 1)
+        await server.join_game('sid-d', dict(join, local_player_id=42))
+        await server.join_game('sid-d', dict(join, local_player_id=42, token=token))
+        assert server.sid_identity['sid-d'].expires_at > time.time()
+        server.denylist.update({'revoked': {42: int(time.time()) + 1}})
+        await server.join_game('sid-a', dict(join, local_player_id=42))
+        assert len(server.pending_joins) == 1
+        for sid in ('sid-a', 'sid-b', 'sid-c', 'sid-d'):
+            await server.disconnect(sid)
+    asyncio.run(run())
+    invalid = [room for event, data, room, skip_sid in fake_sio.emits if event == 'invalid_token']
+    assert invalid == ['sid-b', 'sid-c', 'sid-d', 'sid-a']
+    assert not server.sid_identity
+
+
+def test_pending_joins_pair_dedupe_and_expire(fake_sio, fake_clock):
+    joins = PendingJoins(clock=fake_clock)
+    joins.add(GameRequest('sid-a', 1, 10, 20, 10, True))
+    # The same player joining again replaces its request instead of pairing with itself
+    assert joins.pair(1, 10, 20, 10) is None
+    joins.add(GameRequest('sid-a2', 1, 10, 20, 10, True))
+    joins.add(GameRequest('sid-a2', 1, 10, 20, 10, True))
+    assert len(joins) == 1
+    assert joins.pair(1, 10, 20, 20).sid == 'sid-a2'
+    assert len(joins) == 0
+
+    for game_id in range(2, 6):
+        joins.add(GameRequest(f'sid-{game_id}', game_id, 10, 20, 10, True))
+        fake_clock.now += 1.0
+    joins.remove_sid('sid-3')
+    fake_clock.now = REQUEST_TIMEOUT + 2.5
+    expired = joins.expired()
+    assert [request.sid for request in expired] == ['sid-2', 'sid-4']
+    assert len(joins) == 1
+
+    asyncio.run(expired[0].cancel())
+    assert fake_sio.received('sid-2') == [('cancel_game', {'type': 'cancel_game', 'gameId': 2})]
+
+
+def test_result_writer_batches_and_retries(pong_game):
+    sent, failures = [], [1]
+
+    def send(batch):
+        if failures[0]:
+            failures[0] -= 1
+            raise ConnectionError('game history is down')
+        sent.append([result['idempotency_key'] for result in batch])
+        return {'results': [{'idempotency_key': key, 'status': 'duplicate' if key in seen else 'created'}
+                            for key in sent[-1]]}
+    seen = set()
+    writer = ResultWriter(url='http://game-history', send=send, batch_size=2)
+    game_over = {'winner': 808, 'player1_score': 1, 'player2_score': 5, 'player1_hits': 3,
+                 'player2_hits': 7, 'longest_rally': 4, 'game_duration': 60}
+    for game_id in (1, 2, 3):
+        pong_game.game_id = game_id
+        writer.put(pong_game.game_result(game_over))
+
+    async def run():
+        # The failed batch goes back to the front of the queue and is sent again
+        assert await writer.flush() is False
+        assert len(writer) == 3
+        assert await writer.flush() and await writer.flush()
+        assert len(writer) == 0
+        # A result sent again is not stored twice, the service reports it as a duplicate
+        writer.put(pong_game.game_result(game_over))
+        seen.add('pong-result-3')
+        assert await writer.flush()
+        # Results are given up on after MAX_ATTEMPTS failed attempts
+        writer.put(pong_game.game_result(game_over))
+        failures[0] = MAX_ATTEMPTS
+        for _ in range(MAX_ATTEMPTS):
+            await writer.flush()
+    asyncio.run(run())
+    assert sent == [['pong-result-1', 'pong-result-2'], ['pong-result-3'], ['pong-result-3']]
+    assert writer.written == 4 and writer.rejected == 0
+    assert writer.dropped == 1 and len(writer) == 0
+
+
+def test_end_game_writes_result_unless_lease_lost(fake_sio, monkeypatch):
+    writer = ResultWriter(url='http://game-history', send=lambda batch: {'results': []})
+    monkeypatch.setattr(server, 'result_writer', writer)
+
+    async def run():
+        for game_id in (20, 21):
+            game = PongGame(game_id, 1, 2, True, tick_rate=120)
+            server.active_games[game_id] = game
+            await game.add_player(f'sid-{game_id}', 1)
+            game.tick = 90 * 120
+            if game_id == 21:
+                await server.lease_lost(game_id)  # another node runs the game now
+            await game.end_game()
+    asyncio.run(run())
+    game_over = [data for event, data, room, skip_sid in fake_sio.emits if event == 'game_over']
+    assert [data['game_duration'] for data in game_over] == [90, 90]
+    assert [result['game_id'] for result, _ in writer.queue] == [20]
+    assert writer.queue[0][0]['game_duration'] == 90
+
+
+def test_spectators_share_reduced_rate_delayed_frames(fake_sio, fake_clock, pong_game):
+    server.active_games[1] = pong_game
+    feed = pong_game.broadcaster.spectators
+    feed._clock = fake_clock
+
+    async def run():
+        await pong_game.add_player('sid-player', 42)
+        await server.spectate('sid-player', {'game_id': 1})
+        for sid in ('spec-1', 'spec-2'):
+            await server.spectate(sid, {'game_id': 1})
+        await server.list_games('spec-1')
+        pong_game.start_rally()
+        for _ in range(pong_game.serve_delay_ticks):
+            pong_game.step()
+        for _ in range(2 * TICK_RATE):  # two seconds of rally
+            fake_clock.now += 1 / TICK_RATE
+            pong_game.step()
+            await pong_game.flush()
+        await server.stop_spectating('spec-2')
+    asyncio.run(run())
+
+    assert ('error', {'message': 'Players can not spectate their own game'}) in fake_sio.received('sid-player')
+    game_list = [data for event, data in fake_sio.received('spec-1') if event == 'game_list'][0]
+    assert game_list['games'][0]['spectators'] == 2
+    player_states = [data for event, data in fake_sio.received('sid-player') if event == 'send_game_state']
+    frames = [(data, room) for event, data, room, skip_sid in fake_sio.emits if event == 'spectator_frame']
+    # One emit per frame for the whole spectator room
+    assert frames and all(room == feed.room for data, room in frames)
+    spectator_states = [payload for data, room in frames for event, payload in data['events']
+                        if event == 'send_game_state']
+    assert len(spectator_states) <= feed.rate * 2 + 1
+    assert len(spectator_states) < len(player_states) / 3
+    # Frames are held back for the delay, the newest ones are still in the buffer
+    assert spectator_states[-1]['tick'] <= pong_game.tick - feed.delay * TICK_RATE
+    assert feed.sids == {'spec-1'}
+    assert 'pong_spectators 1' in server.metrics.render()
+
+    # The game ended, its feed is closed and nobody counts as spectating any more
+    asyncio.run(pong_game.broadcaster.close())
+    assert not feed.sids and 'spec-1' not in server.sid_spectating
+    assert 'pong_spectators 0' in server.metrics.render()
+
+
+# SteadyBot class
+# Follows the ball like a player holding the keys: starts moving when the ball is well away
+# and stops when the paddle is level with it, instead of PaddleBot's every-tick corrections
+class SteadyBot(PaddleBot):
+    def inputs(self, tick, game):
+        state = game.game_state
+        gap = state.ball.z - (state.player1 if self.player == 1 else state.player2).paddle.z
+        direction = self.direction
+        if abs(gap) > 4 * PADDLE_SPEED:
+            direction = 1 if gap > 0 else -1
+        elif abs(gap) < PADDLE_SPEED:
+            direction = 0
+        if direction == self.direction:
+            return []
+        self.direction = direction
+        return [{'tick': tick, 'player': self.player, 'direction': direction}]
+
+
+def test_recording_rebuilds_every_tick_and_seeks(tmp_path):
+    game = PongGame(22, 1, 2, True, seed=5)
+    bots = [SteadyBot(1, 11), SteadyBot(2, 12)]
+    path = str(tmp_path / 'game-22.pongrec')
+    game.start_recording(path)
+    actual = {}
+    seconds = 60
+
+    async def run():
+        game.start_rally()
+        while game.tick < seconds * TICK_RATE and game.game_state.in_progress:
+            for bot in bots:
+                for data in bot.inputs(game.tick + 1, game):
+                    apply_input(game, data, game.tick)
+            game.step()
+            state = game.game_state
+            actual[game.tick] = (state.ball.x, state.ball.z, state.player1.paddle.z, state.player2.paddle.z,
+                                 state.player1.score, state.player2.score)
+            await game.flush()
+        game.stop_recording()
+    asyncio.run(run())
+
+    size = os.path.getsize(path)
+    assert size * (300 / seconds) < 100 * 1024  # a 5 minute game in tens of KB
+    recording = Recording.load(path)
+    assert (recording.game_id, recording.player1_id, recording.player2_id) == (22, 1, 2)
+    assert recording.records[-1][1] == KIND_END
+    assert len(recording.keyframes) == seconds // KEYFRAME_INTERVAL
+
+    def assert_matches(cursor, tick):
+        state = cursor.state()
+        x, z, paddle1, paddle2, score1, score2 = actual[tick]
+        assert abs(state['ball']['x'] - x) < 1e-3 and abs(state['ball']['z'] - z) < 1e-3
+        assert abs(state['player1']['z'] - paddle1) < 1e-3 and abs(state['player2']['z'] - paddle2) < 1e-3
+        assert state['score'] == [score1, score2]
+
+    cursor = ReplayCursor(recording)
+    for tick in sorted(actual):
+        cursor.advance(tick)
+        assert_matches(cursor, tick)
+    assert cursor.finished
+    # Seeking to a keyframe rebuilds the state without the records before it
+    cursor.seek(7)
+    keyframe_tick = cursor.tick
+    assert keyframe_tick == recording.records[recording.keyframes[7]][0]
+    for tick in range(keyframe_tick, keyframe_tick + 3 * TICK_RATE):
+        cursor.advance(tick)
+        assert_matches(cursor, tick)
+
+
+def test_replay_service_does_not_import_the_game_server():
+    # Importing server_utils would create the game server's Socket.IO server, scheduler and cluster
+    code = "import sys, replay_service; print('server_utils' in sys.modules)"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.strip() == 'False', result.stderr
+
+
+def test_replay_service_streams_faster_than_real_time(fake_sio, tmp_path, monkeypatch):
+    game = PongGame(23, 1, 2, True, seed=3)
+    game.start_recording(str(tmp_path / 'game-23.pongrec'))
+
+    async def record():
+        game.start_rally()
+        for _ in range(4 * TICK_RATE):
+            game.step()
+            await game.flush()
+        game.stop_recording()
+    asyncio.run(record())
+
+    monkeypatch.setattr(replay_service, 'sio', fake_sio)
+    monkeypatch.setattr(replay_service, 'RECORDINGS_DIR', str(tmp_path))
+
+    async def watch():
+        await replay_service.list_replays('viewer')
+        await replay_service.watch_replay('viewer', {'name': '../game-23.pongrec'})
+        await replay_service.watch_replay('viewer', {'name': 'game-23.pongrec', 'speed': 8})
+        await replay_service.replays['viewer'].task
+    started = time.monotonic()
+    asyncio.run(watch())
+    assert time.monotonic() - started < 1.0
+
+    received = fake_sio.received('viewer')
+    events = [event for event, _ in received]
+    assert received[0][1]['replays'][0]['name'] == 'game-23.pongrec'
+    assert ('error', {'message': 'No such replay'}) in received
+    assert events[-1] == 'replay_end'
+    frames = [data for event, data in received if event == 'replay_frame']
+    # 4 seconds of game at 8x, 30 frames per second
+    assert len(frames) <= 4 * replay_service.REPLAY_FRAME_RATE / 8 + 2
+    assert [frame['tick'] for frame in frames] == sorted(frame['tick'] for frame in frames)
+    assert frames[-1]['tick'] == 4 * TICK_RATE
+
+
+def test_fast_runtime_json_matches_standard_packets(pong_game):
+    if runtime.orjson is None:
+        pytest.skip("orjson is not installed")
+    pong_game.start_rally()
+    pong_game.send_game_state_to_client()
+    state = pong_game.broadcaster.outbox.pop()[1]
+    data = ['game_frame', {'gameId': 1, 'events': [['send_game_state', state]], 'hits': {1: 2}}]
+    standard = packet.Packet(packet.EVENT, data)
+    standard.json = json
+    fast = packet.Packet(packet.EVENT, data)
+    fast.json = runtime.OrjsonModule
+    encoded = fast.encode()
+    assert json.loads(encoded[1:]) == json.loads(standard.encode()[1:])
+    decoded = packet.Packet(encoded_packet=encoded)
+    decoded_fast = packet.Packet()
+    decoded_fast.json = runtime.OrjsonModule
+    decoded_fast.decode(encoded)
+    assert decoded_fast.data == decoded.data
+    assert isinstance(server.sio.packet_class.json, runtime.OrjsonModule)
+
+
+def test_metrics_histograms_counters_and_endpoint(fake_sio, fake_clock, pong_game):
+    scheduler_metrics = Metrics()
+    scheduler = TickScheduler(60, clock=fake_clock, sleep=fake_clock.sleep, metrics=scheduler_metrics)
+    games = [FakeScheduledGame(), FakeScheduledGame()]
+    run_scheduler(scheduler, games, stop_after=10)
+    assert scheduler_metrics.tick_duration.count == 10
+    assert scheduler_metrics.tick_lateness.count == 10
+    assert scheduler_metrics.emit_duration.count == 20
+
+    histogram = Histogram('h', 'test', (1, 2, 4))
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value)
+    assert histogram.counts == [2, 0, 1, 1] and histogram.sum == 14.5
+
+    moves = server_utils.metrics.event_duration.labels('move_paddle')
+    before = moves.count
+    cancelled = server_utils.metrics.games_cancelled.value
+    server.active_games[1] = pong_game
+
+    async def run():
+        await pong_game.add_player('sid-1', 42)
+        server.sid_to_game['sid-1'] = 1
+        await server.move_paddle('sid-1', {'delta_z': 1})
+        await pong_game.cancel_game()
+    asyncio.run(run())
+    assert moves.count == before + 1
+    assert server_utils.metrics.games_cancelled.value == cancelled + 1
+
+    sent = []
+
+    async def scrape(path):
+        sent.clear()
+
+        async def send(message):
+            sent.append(message)
+        await server_utils.app({'type': 'http', 'path': path, 'method': 'GET', 'headers': [],
+                                'query_string': b''}, None, send)
+        return sent[0]['status'], sent[1]['body'].decode()
+    status, body = asyncio.run(scrape('/metrics'))
+    assert status == 200
+    assert 'pong_active_games 0' in body
+    assert 'pong_games_cancelled_total' in body
+    assert 'pong_event_handling_seconds_count{event="move_paddle"}' in body
+    assert 'pong_tick_duration_seconds_bucket{le="+Inf"}' in body
+    assert asyncio.run(scrape('/other'))[0] == 404
+
+
+def test_loop_watchdog_measures_lag_and_captures_blocking_stack(caplog):
+    watchdog = LoopWatchdog(Metrics(), threshold=0.1, interval=0.01, check_interval=0.01, log_interval=60)
+
+    def blocking_call():
+        time.sleep(0.3)
+
+    async def run():
+        watchdog.start()
+        await asyncio.sleep(0.05)
+        blocking_call()
+        await asyncio.sleep(0.05)
+        blocking_call()
+        await asyncio.sleep(0.05)
+        watchdog.stop()
+    with caplog.at_level('WARNING'):
+        asyncio.run(run())
+    assert watchdog.stalls.value == 2
+    assert watchdog.lag.count > 5
+    assert watchdog.lag.sum >= 0.5  # the two 300 ms stalls
+    assert 'blocking_call' in watchdog.last_stack
+    # Only the first stall is logged within the log interval
+    reports = [record for record in caplog.records if 'Event loop blocked' in record.getMessage()]
+    assert len(reports) == 1 and 'blocking_call' in reports[0].getMessage()
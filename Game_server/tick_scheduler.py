@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+
+# How many ticks the scheduler simulates back to back when the event loop
+# was late. If more ticks than this are due, the rest are skipped.
+MAX_CATCH_UP_TICKS = 5
+
+# TickScheduler class
+# Advances every registered game on one shared fixed-timestep clock
+# A game can run at any rate that divides the scheduler's tick rate, it is
+# stepped on every (tick_rate / game tick rate)th tick of the shared clock
+# Registered games must implement:
+#   - tick_rate: ticks per second of the game
+#   - step(): advances the game by one of its ticks (synchronous, no I/O)
+#   - flush(): coroutine that sends whatever the last step(s) produced, called after the
+#     ticks in which the game was stepped
+#   - fail(error): called when step() raised, the game is no longer scheduled
+# Tick hooks run after all games were stepped in a tick, e.g. the batch physics engine
+# Properties:
+#   - tick_rate: number of ticks per second
+#   - tick_interval: length of one tick in seconds
+#   - tick: number of ticks run so far
+#   - skipped_ticks: number of ticks dropped because the loop ran too late
+#   - metrics: where tick duration, tick lateness and the time to flush each game are
+#     observed (see metrics.py), None to not measure them
+class TickScheduler:
+    def __init__(self, tick_rate: int, max_catch_up: int = MAX_CATCH_UP_TICKS,
+                 clock=time.monotonic, sleep=asyncio.sleep, metrics=None):
+        self.tick_rate: int = tick_rate
+        self.tick_interval: float = 1.0 / tick_rate
+        self.max_catch_up: int = max_catch_up
+        self.tick: int = 0
+        self.skipped_ticks: int = 0
+        self._clock = clock
+        self._sleep = sleep
+        self._games: dict = {}  # game -> clock ticks per game tick, O(1) add and remove
+        self._tick_hooks: list = []
+        self._task = None
+        self.metrics = metrics
+
+    # register method
+    # Adds a game to the scheduler and starts the clock if it is not running
+    # Raises a ValueError if the game's tick rate does not divide the scheduler's
+    def register(self, game) -> None:
+        if game.tick_rate <= 0 or self.tick_rate % game.tick_rate != 0:
+            raise ValueError(f"Tick rate {game.tick_rate} does not divide {self.tick_rate}")
+        self._games[game] = self.tick_rate // game.tick_rate
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    # unregister method
+    # Removes a game from the scheduler, the clock stops when no games are left
+    def unregister(self, game) -> None:
+        self._games.pop(game, None)
+
+    # add_tick_hook method
+    # Registers a function that is called after every tick's game steps
+    def add_tick_hook(self, hook) -> None:
+        self._tick_hooks.append(hook)
+
+    def is_registered(self, game) -> bool:
+        return game in self._games
+
+    def __len__(self) -> int:
+        return len(self._games)
+
+    # _run method
+    # The scheduler loop
+    # Deadlines are absolute (start + n * tick_interval), so time spent in
+    # step() and flush() or oversleeping does not make the tick rate drift.
+    # When the loop wakes up late, the missed ticks are simulated back to back
+    # (up to max_catch_up) and the network is flushed once afterwards.
+    # Only the games that were stepped are flushed, a 30 Hz game is flushed 30 times a
+    # second, not on every tick of the shared clock.
+    # Ticks beyond max_catch_up are skipped and the clock is realigned.
+    async def _run(self) -> None:
+        next_deadline = self._clock() + self.tick_interval
+        while self._games:
+            delay = next_deadline - self._clock()
+            if delay > 0:
+                await self._sleep(delay)
+                if not self._games:
+                    break
+            started = self._clock()
+            if self.metrics is not None:
+                self.metrics.tick_lateness.observe(max(0.0, started - next_deadline))
+            due = int((started - next_deadline) / self.tick_interval) + 1
+            if due > self.max_catch_up:
+                skipped = due - self.max_catch_up
+                self.skipped_ticks += skipped
+                next_deadline += skipped * self.tick_interval
+                logging.warning(f"Tick scheduler running late, skipped {skipped} ticks")
+                due = self.max_catch_up
+            games = list(self._games)
+            stepped = {}  # games stepped in this wake-up, in order, only they have anything to send
+            for _ in range(due):
+                self.tick += 1
+                for game in games:
+                    divisor = self._games.get(game)
+                    if divisor is not None and self.tick % divisor == 0:
+                        stepped[game] = None
+                        self._step_game(game)
+                for hook in self._tick_hooks:
+                    self._run_hook(hook)
+            for game in stepped:
+                if game in self._games:
+                    await self._flush_game(game)
+            if self.metrics is not None:
+                self.metrics.tick_duration.observe(self._clock() - started)
+            next_deadline += due * self.tick_interval
+
+    # _step_game method
+    # Runs one tick of a game, a game that raises is dropped from the scheduler
+    # so it can not stall every other game
+    def _step_game(self, game) -> None:
+        try:
+            game.step()
+        except Exception as e:
+            logging.exception("Error while stepping game, removing it from the scheduler")
+            self.unregister(game)
+            game.fail(e)
+
+    def _run_hook(self, hook) -> None:
+        try:
+            hook()
+        except Exception:
+            logging.exception("Error in tick hook")
+
+    async def _flush_game(self, game) -> None:
+        started = self._clock()
+        try:
+            await game.flush()
+        except Exception:
+            logging.exception("Error while sending game updates")
+        if self.metrics is not None:
+            self.metrics.emit_duration.observe(self._clock() - started)
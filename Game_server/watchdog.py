@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+# Event loop watchdog
+# Every game runs on the one event loop, a call that blocks it stalls all of them at once.
+# A heartbeat task wakes up every HEARTBEAT_INTERVAL seconds on the loop and measures how late
+# it woke up, the event loop lag (pong_event_loop_lag_seconds, see metrics.py).
+# A watchdog thread checks the heartbeat every CHECK_INTERVAL seconds. When the loop has not
+# beaten for LAG_THRESHOLD seconds past its due time, something is blocking it: the thread
+# takes the loop thread's stack with sys._current_frames() while it is still blocked and logs
+# it, so the blocking call shows up in the logs (pong_event_loop_stalls_total counts them).
+# At most one stack is logged every LOG_INTERVAL seconds, the stalls in between are counted
+# and reported with the next one.
+
+HEARTBEAT_INTERVAL = 0.05  # seconds
+CHECK_INTERVAL = 0.02
+LAG_THRESHOLD = float(os.environ.get('LOOP_LAG_THRESHOLD', '0.1'))
+LOG_INTERVAL = 10.0
+
+LAG_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+# LoopWatchdog class
+# Measures the lag of the event loop it is started on and reports what blocks it
+# Properties:
+#   - lag: histogram of the heartbeat's lag
+#   - stalls: counter of the times the loop was blocked for longer than the threshold
+#   - last_stack: the stack of the last stall, as text
+class LoopWatchdog:
+    def __init__(self, metrics, threshold: float = LAG_THRESHOLD, interval: float = HEARTBEAT_INTERVAL,
+                 check_interval: float = CHECK_INTERVAL, log_interval: float = LOG_INTERVAL):
+        self.lag = metrics.add_histogram(
+            'pong_event_loop_lag_seconds', 'How late the event loop ran the watchdog heartbeat', LAG_BUCKETS)
+        self.stalls = metrics.add_counter(
+            'pong_event_loop_stalls_total', 'Times the event loop was blocked for longer than the threshold')
+        self.last_stack = None
+        self._threshold = threshold
+        self._interval = interval
+        self._check_interval = check_interval
+        self._log_interval = log_interval
+        self._beat = None           # when the heartbeat last ran, time.monotonic()
+        self._loop_thread = None    # ident of the thread running the event loop
+        self._stalled = False       # a stall was reported and the loop has not beaten since
+        self._last_log = None
+        self._unlogged = 0
+        self._task = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    # start method
+    # Starts the heartbeat on the running event loop and the watchdog thread
+    def start(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self.heartbeat())
+        self._thread = threading.Thread(target=self.watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # heartbeat method
+    # Runs on the event loop, measures how late every wake-up is
+    async def heartbeat(self) -> None:
+        while True:
+            due = time.monotonic() + self._interval
+            await asyncio.sleep(self._interval)
+            now = time.monotonic()
+            self.lag.observe(max(0.0, now - due))
+            self._beat = now
+            self._stalled = False
+
+    # watch method
+    # Runs in the watchdog thread until stop() is called
+    def watch(self) -> None:
+        while not self._stop.wait(self._check_interval):
+            self.check(time.monotonic())
+
+    # check method
+    # Reports a stall if the heartbeat is overdue by more than the threshold
+    def check(self, now: float) -> None:
+        blocked = now - self._beat - self._interval
+        if blocked < self._threshold or self._stalled:
+            return
+        self._stalled = True
+        self.stalls.inc()
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return
+        self.last_stack = ''.join(traceback.format_stack(frame))
+        if self._last_log is not None and now - self._last_log < self._log_interval:
+            self._unlogged += 1
+            return
+        unlogged = f", {self._unlogged} more stalls since the last report" if self._unlogged else ''
+        logging.warning(f"Event loop blocked for {blocked * 1000:.0f} ms{unlogged}, "
+                        f"the loop thread is at:\n{self.last_stack}")
+        self._last_log = now
+        self._unlogged = 0